@@ -70,11 +70,12 @@ async def run_async_migrations() -> None:
     and associate a connection with the context.
 
     """
-    connectable = async_engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
+    section = config.get_section(config.config_ini_section, {})
+    if "sqlalchemy.url" in section:
+        connectable = async_engine_from_config(section, prefix="sqlalchemy.", poolclass=pool.NullPool)
+    else:
+        # No URL configured: use the application's DATABASE_URL
+        connectable = engine
 
     async with connectable.connect() as connection:
         await connection.run_sync(do_run_migrations)
@@ -88,6 +89,11 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        # Called by init_db on startup with a connection of the app's engine
+        do_run_migrations(connection)
+        return
     asyncio.run(run_async_migrations())
 
 if context.is_offline_mode():
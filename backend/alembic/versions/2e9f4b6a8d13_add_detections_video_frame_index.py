@@ -0,0 +1,26 @@
+"""Add detections (video_id, frame_number) index
+
+Revision ID: 2e9f4b6a8d13
+Revises: 8c1d5e3f7a20
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e9f4b6a8d13'
+down_revision: Union[str, None] = '8c1d5e3f7a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_detections_video_id_frame_number', 'detections', ['video_id', 'frame_number'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_detections_video_id_frame_number', table_name='detections')
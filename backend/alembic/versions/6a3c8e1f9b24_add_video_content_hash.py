@@ -0,0 +1,30 @@
+"""Add video content hash
+
+Revision ID: 6a3c8e1f9b24
+Revises: 2e9f4b6a8d13
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a3c8e1f9b24'
+down_revision: Union[str, None] = '2e9f4b6a8d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('videos', sa.Column('content_hash', sa.String(), nullable=True))
+    op.add_column('videos', sa.Column('file_size', sa.BigInteger(), nullable=True))
+    op.create_index(op.f('ix_videos_content_hash'), 'videos', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_videos_content_hash'), table_name='videos')
+    op.drop_column('videos', 'file_size')
+    op.drop_column('videos', 'content_hash')
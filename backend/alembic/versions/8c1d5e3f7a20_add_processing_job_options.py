@@ -0,0 +1,26 @@
+"""Add processing job options
+
+Revision ID: 8c1d5e3f7a20
+Revises: 4b7e2a91c3d5
+Create Date: 2026-10-18 11:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1d5e3f7a20'
+down_revision: Union[str, None] = '4b7e2a91c3d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('processing_jobs', sa.Column('options', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('processing_jobs', 'options')
@@ -0,0 +1,55 @@
+"""Add video processing summary
+
+Revision ID: 9d4f2b7c1e86
+Revises: 6a3c8e1f9b24
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4f2b7c1e86'
+down_revision: Union[str, None] = '6a3c8e1f9b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('videos', sa.Column('status', sa.String(), nullable=True, server_default='pending'))
+    op.add_column('videos', sa.Column('frame_count', sa.Integer(), nullable=True))
+    op.add_column('videos', sa.Column('processed_frames', sa.Integer(), nullable=True, server_default='0'))
+    op.add_column('videos', sa.Column('detection_count', sa.Integer(), nullable=True, server_default='0'))
+    op.add_column('videos', sa.Column('processing_seconds', sa.Float(), nullable=True))
+    op.create_index(op.f('ix_videos_status'), 'videos', ['status'], unique=False)
+
+    # Backfill from the detections and the latest job of each video
+    op.execute("""
+        UPDATE videos SET detection_count = (
+            SELECT COUNT(*) FROM detections WHERE detections.video_id = videos.id
+        )
+    """)
+    op.execute("""
+        UPDATE videos SET status = COALESCE(
+            (
+                SELECT CASE WHEN processing_jobs.status = 'queued' THEN 'pending' ELSE processing_jobs.status END
+                FROM processing_jobs
+                WHERE processing_jobs.video_id = videos.id
+                ORDER BY processing_jobs.id DESC
+                LIMIT 1
+            ),
+            CASE WHEN detection_count > 0 THEN 'completed' ELSE 'pending' END
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_videos_status'), table_name='videos')
+    op.drop_column('videos', 'processing_seconds')
+    op.drop_column('videos', 'detection_count')
+    op.drop_column('videos', 'processed_frames')
+    op.drop_column('videos', 'frame_count')
+    op.drop_column('videos', 'status')
@@ -0,0 +1,52 @@
+"""Add person tracks
+
+Revision ID: b3e8f1a52c07
+Revises: 9d4f2b7c1e86
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8f1a52c07'
+down_revision: Union[str, None] = '9d4f2b7c1e86'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('detections', sa.Column('track_id', sa.Integer(), nullable=True))
+    op.create_index(
+        'ix_detections_video_id_track_id_frame_number', 'detections',
+        ['video_id', 'track_id', 'frame_number'], unique=False
+    )
+    op.create_table(
+        'tracks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('video_id', sa.Integer(), nullable=True),
+        sa.Column('track_id', sa.Integer(), nullable=True),
+        sa.Column('first_frame', sa.Integer(), nullable=True),
+        sa.Column('last_frame', sa.Integer(), nullable=True),
+        sa.Column('frame_count', sa.Integer(), nullable=True),
+        sa.Column('x_min', sa.Float(), nullable=True),
+        sa.Column('y_min', sa.Float(), nullable=True),
+        sa.Column('x_max', sa.Float(), nullable=True),
+        sa.Column('y_max', sa.Float(), nullable=True),
+        sa.Column('mean_confidence', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tracks_id'), 'tracks', ['id'], unique=False)
+    op.create_index('ix_tracks_video_id_track_id', 'tracks', ['video_id', 'track_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tracks_video_id_track_id', table_name='tracks')
+    op.drop_index(op.f('ix_tracks_id'), table_name='tracks')
+    op.drop_table('tracks')
+    op.drop_index('ix_detections_video_id_track_id_frame_number', table_name='detections')
+    op.drop_column('detections', 'track_id')
@@ -0,0 +1,32 @@
+"""Add processing job leases
+
+Revision ID: c7d2e9a4f613
+Revises: b3e8f1a52c07
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2e9a4f613'
+down_revision: Union[str, None] = 'b3e8f1a52c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('processing_jobs', sa.Column('worker_id', sa.String(), nullable=True))
+    op.add_column('processing_jobs', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        op.f('ix_processing_jobs_lease_expires_at'), 'processing_jobs', ['lease_expires_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_processing_jobs_lease_expires_at'), table_name='processing_jobs')
+    op.drop_column('processing_jobs', 'lease_expires_at')
+    op.drop_column('processing_jobs', 'worker_id')
@@ -0,0 +1,791 @@
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from .inference_backends import load_detector
+from .metrics import MetricsRegistry, registry as metrics_registry
+from .pipeline import FramePipeline, detect_people, detection_rows, draw_detections, result_to_array, BOX_COLOR
+from .sampling import FrameSampler, match_boxes
+from .roi import FrameRegion, region_detector
+from .segments import run_segments
+
+DEFAULT_VIDEO = os.path.join(os.path.dirname(__file__), "..", "..", "test_video.mp4")
+
+def benchmark_batch_sizes(video_path: str, batch_sizes, max_frames: int, weights: str = "yolov8n.pt"):
+    model = YOLO(weights)
+
+    # Warm up once so the first batch size doesn't pay model initialization
+    cap = cv2.VideoCapture(video_path)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        raise ValueError(f"Failed to read frames from {video_path}")
+    model(frame, verbose=False)
+
+    report = []
+    for batch_size in batch_sizes:
+        cap = cv2.VideoCapture(video_path)
+        frames_done = 0
+        started = time.perf_counter()
+        while frames_done < max_frames:
+            frames = []
+            while len(frames) < min(batch_size, max_frames - frames_done):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            if not frames:
+                break
+            model(frames, verbose=False)
+            frames_done += len(frames)
+        elapsed = time.perf_counter() - started
+        cap.release()
+
+        report.append({
+            "batch_size": batch_size,
+            "frames": frames_done,
+            "seconds": round(elapsed, 3),
+            "fps": round(frames_done / elapsed, 2) if elapsed > 0 else 0.0,
+        })
+    return report
+
+def run_pipeline(video_path: str, model, sampler=None, batch_size: int = 1, max_frames: int = None, detect=None):
+    # Runs the full pipeline and returns {frame_number: boxes} plus the pipeline stats
+    detections = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        pipeline = FramePipeline(
+            video_path,
+            os.path.join(output_dir, "benchmark.mp4"),
+            detect or (lambda frames: detect_people(model, frames)),
+            batch_size=batch_size,
+            sampler=sampler,
+            on_detections=lambda frame_numbers, boxes: detections.update(zip(frame_numbers, boxes)),
+            max_frames=max_frames
+        )
+        stats = pipeline.run()
+    return detections, stats
+
+def detection_recall(reference: dict, candidate: dict, min_iou: float = 0.5) -> float:
+    total = sum(len(boxes) for boxes in reference.values())
+    if total == 0:
+        return 1.0
+    matched = 0
+    for frame_number, boxes in reference.items():
+        other = candidate.get(frame_number)
+        if other is not None:
+            matched += len(match_boxes(boxes, other, min_iou))
+    return matched / total
+
+def benchmark_sampling(video_path: str, every_values, adaptive_thresholds, max_frames: int,
+                       batch_size: int = 1, weights: str = "yolov8n.pt"):
+    model = YOLO(weights)
+
+    # Full-rate processing is both the speed baseline and the recall reference
+    reference, baseline = run_pipeline(video_path, model, batch_size=batch_size, max_frames=max_frames)
+    configs = [("every", value, FrameSampler(every=value)) for value in every_values if value > 1]
+    configs += [
+        ("adaptive", threshold, FrameSampler(adaptive=True, motion_threshold=threshold))
+        for threshold in adaptive_thresholds
+    ]
+
+    report = [{
+        "mode": "full",
+        "value": 1,
+        "fps": baseline["fps"],
+        "inferred_frames": baseline["inferred_frames"],
+        "speedup": 1.0,
+        "recall": 1.0,
+    }]
+    for mode, value, sampler in configs:
+        detections, stats = run_pipeline(video_path, model, sampler, batch_size, max_frames)
+        report.append({
+            "mode": mode,
+            "value": value,
+            "fps": stats["fps"],
+            "inferred_frames": stats["inferred_frames"],
+            "speedup": round(baseline["seconds"] / stats["seconds"], 2) if stats["seconds"] else 0.0,
+            "recall": round(detection_recall(reference, detections), 4),
+        })
+    return report
+
+def benchmark_segments(video_path: str, worker_counts, batch_size: int = 1, weights: str = "yolov8n.pt"):
+    options = {
+        "batch_size": batch_size,
+        "sample_every": 1,
+        "adaptive_sampling": False,
+        "motion_threshold": 0.0,
+        "max_frame_gap": 1,
+    }
+    report = []
+    baseline = None
+    with tempfile.TemporaryDirectory() as output_dir:
+        for workers in worker_counts:
+            output_path = os.path.join(output_dir, f"segments_{workers}.mp4")
+            stats = run_segments(video_path, output_path, options, workers, weights)
+            baseline = baseline or stats["seconds"]
+            report.append({
+                "workers": workers,
+                "segments": len(stats["segments"]),
+                "frames": stats["frames"],
+                "seconds": stats["seconds"],
+                "fps": stats["fps"],
+                "speedup": round(baseline / stats["seconds"], 2) if stats["seconds"] else 0.0,
+                "stitch_seconds": stats["stitch_seconds"],
+            })
+    return report
+
+def benchmark_backends(video_path: str, backends, max_frames: int, batch_size: int = 1,
+                       weights: str = "yolov8n.pt"):
+    # The ultralytics PyTorch model is the speed baseline and the accuracy reference
+    reference, baseline = run_pipeline(video_path, load_detector(weights, "torch"), None, batch_size, max_frames)
+    report = [{
+        "backend": "torch",
+        "fps": baseline["fps"],
+        "infer_ms_per_frame": baseline["stages"]["infer"]["ms_per_frame"],
+        "speedup": 1.0,
+        "recall": 1.0,
+        "precision": 1.0,
+    }]
+    for name in backends:
+        backend, _, precision = name.partition("-")
+        try:
+            detector = load_detector(weights, backend, int8=precision == "int8")
+        except ImportError as e:
+            report.append({"backend": name, "skipped": f"missing dependency: {e.name}"})
+            continue
+        detections, stats = run_pipeline(video_path, detector, None, batch_size, max_frames)
+        report.append({
+            "backend": name,
+            "fps": stats["fps"],
+            "infer_ms_per_frame": stats["stages"]["infer"]["ms_per_frame"],
+            "speedup": round(baseline["seconds"] / stats["seconds"], 2) if stats["seconds"] else 0.0,
+            "recall": round(detection_recall(reference, detections), 4),
+            "precision": round(detection_recall(detections, reference), 4),
+        })
+    return report
+
+def benchmark_roi(video_path: str, sizes, roi, max_frames: int, batch_size: int = 1,
+                  motion_threshold: float = 6.0, weights: str = "yolov8n.pt"):
+    model = YOLO(weights)
+    if roi is None:
+        # Default to the central half of the frame
+        cap = cv2.VideoCapture(video_path)
+        width, height = cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        cap.release()
+        roi = [[width / 4, height / 4], [width * 3 / 4, height * 3 / 4]]
+
+    # Full frames at 640 are the speed baseline and the accuracy reference
+    reference, baseline = run_pipeline(video_path, model, None, batch_size, max_frames,
+                                       region_detector(model, None, 640))
+    configs = [(f"size {size}", size, None, False) for size in sizes if size != 640]
+    configs += [("roi", 640, roi, False), ("roi + motion mask", 640, roi, True)]
+
+    report = [{"mode": "full frame 640", "fps": baseline["fps"], "inferred_frames": baseline["inferred_frames"],
+               "speedup": 1.0, "recall": 1.0, "precision": 1.0}]
+    for mode, size, points, motion_mask in configs:
+        region = FrameRegion(points) if points else None
+        sampler = FrameSampler(adaptive=True, motion_threshold=motion_threshold, region=region) if motion_mask else None
+        detections, stats = run_pipeline(video_path, model, sampler, batch_size, max_frames,
+                                         region_detector(model, region, size))
+        expected = reference
+        if region is not None:
+            # People outside the ROI are left out on purpose, so only the ones inside count
+            expected = {frame: boxes[region.contains(boxes)] if len(boxes) else boxes
+                        for frame, boxes in reference.items()}
+        report.append({
+            "mode": mode,
+            "fps": stats["fps"],
+            "inferred_frames": stats["inferred_frames"],
+            "speedup": round(baseline["seconds"] / stats["seconds"], 2) if stats["seconds"] else 0.0,
+            "recall": round(detection_recall(expected, detections), 4),
+            "precision": round(detection_recall(detections, expected), 4),
+        })
+    return report
+
+def _per_box_postprocess(video_id: int, frame_number: int, result, frame) -> list:
+    # Box-by-box extraction, filtering, row building and drawing, as done before
+    boxes = []
+    for box in result.boxes:
+        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+        confidence = box.conf[0].cpu().numpy()
+        class_id = box.cls[0].cpu().numpy()
+        if class_id == 0:
+            boxes.append((x1, y1, x2, y2, confidence))
+    rows = [
+        (video_id, frame_number, float(x1), float(y1), float(x2 - x1), float(y2 - y1), float(confidence))
+        for x1, y1, x2, y2, confidence in boxes
+    ]
+    for x1, y1, x2, y2, _ in boxes:
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), BOX_COLOR, 2)
+    return rows
+
+def _vectorized_postprocess(video_id: int, frame_number: int, result, frame) -> list:
+    boxes = result_to_array(result)
+    rows = detection_rows(video_id, np.full(len(boxes), frame_number), boxes)
+    draw_detections(frame, boxes)
+    return rows
+
+def benchmark_postprocess(box_counts, frames: int, other_classes: float = 0.3,
+                          width: int = 1280, height: int = 720):
+    import torch
+    from ultralytics.engine.results import Results
+
+    rng = np.random.default_rng(0)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    report = []
+    for count in box_counts:
+        # A crowded frame with `count` person boxes plus some boxes of other classes.
+        # The per-box path gets all of them, the model filters the others out before
+        # they reach the vectorized path
+        others = int(count * other_classes)
+        x1 = rng.uniform(0, width - 100, count + others)
+        y1 = rng.uniform(0, height - 200, count + others)
+        data = np.column_stack([
+            x1, y1, x1 + rng.uniform(20, 100, count + others), y1 + rng.uniform(50, 200, count + others),
+            rng.uniform(0.25, 1.0, count + others), np.r_[np.zeros(count), rng.integers(1, 80, others)]
+        ]).astype(np.float32)
+        all_classes = Results(frame, path="", names={0: "person"}, boxes=torch.from_numpy(data))
+        people = Results(frame, path="", names={0: "person"}, boxes=torch.from_numpy(data[:count]))
+
+        timings = {}
+        for name, postprocess, result in (("per_box", _per_box_postprocess, all_classes),
+                                          ("vectorized", _vectorized_postprocess, people)):
+            canvas = frame.copy()
+            started = time.perf_counter()
+            for frame_number in range(frames):
+                postprocess(1, frame_number, result, canvas)
+            timings[name] = (time.perf_counter() - started) / frames * 1000
+
+        report.append({
+            "people": count,
+            "other_boxes": others,
+            "per_box_ms_per_frame": round(timings["per_box"], 4),
+            "vectorized_ms_per_frame": round(timings["vectorized"], 4),
+            "speedup": round(timings["per_box"] / timings["vectorized"], 2) if timings["vectorized"] else 0.0,
+        })
+    return report
+
+async def _events_load_test(clients: int, duration: float, poll_interval: float) -> list:
+    # Imported here so DATABASE_URL can point at the stand-in database first
+    import httpx
+    from sqlalchemy import event
+    from . import models
+    from .database import engine, Base, AsyncSessionLocal
+    from .events import broker
+    from .main import app
+
+    queries = {"count": 0}
+
+    def count_query(*args):
+        queries["count"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as session:
+        video = models.Video(filename="benchmark.mp4", filepath=DEFAULT_VIDEO)
+        session.add(video)
+        await session.commit()
+        session.add(models.ProcessingJob(video_id=video.id, status="processing", progress=0))
+        await session.commit()
+        video_id = video.id
+
+    loop = asyncio.get_running_loop()
+    report = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        # Every client polls the status endpoint, like the old frontend did
+        async def poll():
+            deadline = loop.time() + duration
+            while loop.time() < deadline:
+                await client.get(f"/video/{video_id}/status")
+                await asyncio.sleep(poll_interval)
+
+        queries["count"] = 0
+        await asyncio.gather(*(poll() for _ in range(clients)))
+        report.append(("polling", queries["count"]))
+
+        # Every client subscribes to the event stream while progress is published
+        async def listen():
+            async with client.stream("GET", f"/video/{video_id}/events") as response:
+                async for _ in response.aiter_lines():
+                    pass
+
+        async def publish():
+            steps = max(int(duration / 0.1), 1)
+            for step in range(steps):
+                broker.publish(video_id, {"video_id": video_id, "status": "processing", "progress": step * 100 / steps})
+                await asyncio.sleep(0.1)
+            broker.publish(video_id, {"video_id": video_id, "status": "completed", "progress": 100})
+
+        queries["count"] = 0
+        broker.publish(video_id, {"video_id": video_id, "status": "processing", "progress": 0})
+        await asyncio.gather(publish(), *(listen() for _ in range(clients)))
+        report.append(("events", queries["count"]))
+
+    await engine.dispose()
+    minutes = duration / 60
+    return [{
+        "mode": mode,
+        "clients": clients,
+        "seconds": duration,
+        "queries": count,
+        "queries_per_client_per_minute": round(count / clients / minutes, 2),
+    } for mode, count in report]
+
+def benchmark_events(clients: int, duration: float, poll_interval: float, database_url: str = None) -> list:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["DATABASE_URL"] = database_url or f"sqlite+aiosqlite:///{tmp_dir}/benchmark.db"
+        return asyncio.run(_events_load_test(clients, duration, poll_interval))
+
+def benchmark_stream(video_path: str, duration: float, latency_budgets, variant: str = None) -> list:
+    """Live processing of the video played back as a camera, per latency budget.
+
+    The file is read at its own frame rate and looped, so input fps, drop rate
+    and end-to-end latency show whether inference keeps up in real time.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # streams pulls in the database module, which needs a URL at import time
+        os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tmp_dir}/benchmark.db")
+        from .streams import LiveStream, run_stream
+
+        report = []
+        for budget in latency_budgets:
+            stream = LiveStream(0, video_path, {"model_variant": variant}, loop=True, latency_budget_ms=budget)
+            timer = threading.Timer(duration, stream.stop_event.set)
+            timer.start()
+            run_stream(lambda event: None, stream)
+            timer.cancel()
+            health = stream.health()
+            report.append({
+                "latency_budget_ms": budget,
+                **{key: health[key] for key in (
+                    "input_fps", "processed_fps", "frames_read", "frames_processed",
+                    "frames_dropped", "drop_rate", "frames_over_budget", "latency_ms"
+                )},
+            })
+        return report
+
+# Relative slowdown of fps or per-frame stage time reported as a regression
+REGRESSION_TOLERANCE = 0.10
+PROFILE_TOP = 30
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+async def _run_process_video(video_path: str, options: dict) -> dict:
+    # Imported here so DATABASE_URL can point at the stand-in database first
+    from . import models
+    from .database import engine, Base, AsyncSessionLocal
+    from .result_cache import result_cache
+    from .video_processor import process_video_async
+
+    # Every run has to do the work
+    result_cache.enabled = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as session:
+        video = models.Video(filename=os.path.basename(video_path), filepath=video_path, status="processing")
+        session.add(video)
+        await session.commit()
+        video_id = video.id
+
+    started = time.perf_counter()
+    stats = await process_video_async(video_id, video_path, options)
+    elapsed = time.perf_counter() - started
+
+    async with AsyncSessionLocal() as session:
+        video = await session.get(models.Video, video_id)
+        output_path = video.processed_filepath
+    if output_path and os.path.exists(output_path):
+        os.remove(output_path)
+    await engine.dispose()
+    return {"stats": stats, "seconds": elapsed}
+
+def _profile_threads(profilers: list):
+    # cProfile only sees the thread it was enabled in; this starts one in
+    # every thread created afterwards, i.e. the processing workers and stages
+    def start(frame, event, arg):
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+    threading.setprofile(start)
+
+def benchmark_pipeline(video_path: str, options: dict, database_url: str = None,
+                       profile_output: str = None) -> dict:
+    """End-to-end process_video_async run against a throwaway SQLite database.
+
+    Reports per-frame time of each pipeline stage and of the database writes,
+    end-to-end fps and peak RSS. With profile_output, a cProfile of every
+    thread is written there and the top functions are printed to stderr.
+    """
+    video_path = os.path.abspath(video_path)
+    profilers = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["DATABASE_URL"] = database_url or f"sqlite+aiosqlite:///{tmp_dir}/benchmark.db"
+        if profile_output:
+            _profile_threads(profilers)
+            main_profiler = cProfile.Profile()
+            profilers.append(main_profiler)
+            main_profiler.enable()
+        try:
+            result = asyncio.run(_run_process_video(video_path, options))
+        finally:
+            if profile_output:
+                main_profiler.disable()
+                threading.setprofile(None)
+                # Worker threads end here, which stops their profilers
+                from .executor import shutdown_executor
+                shutdown_executor(wait=True)
+
+    if profile_output:
+        profile = pstats.Stats(*profilers, stream=sys.stderr)
+        profile.dump_stats(profile_output)
+        profile.sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+    stats, elapsed = result["stats"], result["seconds"]
+    frames = stats.get("frames", 0)
+    per_frame_ms = {
+        name: stage["ms_per_frame"] for name, stage in stats.get("stages", {}).items()
+    }
+    db_write = stats.get("db_write", {})
+    per_frame_ms["db_write"] = round(db_write.get("seconds", 0.0) / frames * 1000, 3) if frames else 0.0
+    return {
+        "video": video_path,
+        "options": options,
+        "frames": frames,
+        "detections": db_write.get("rows_written", 0),
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "per_frame_ms": per_frame_ms,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> list:
+    """Regressions of report against a stored baseline run, as readable strings."""
+    regressions = []
+    if baseline.get("fps") and report["fps"] < baseline["fps"] * (1 - tolerance):
+        regressions.append(f"fps {report['fps']} < baseline {baseline['fps']}")
+    for name, baseline_ms in baseline.get("per_frame_ms", {}).items():
+        current_ms = report["per_frame_ms"].get(name)
+        # Sub-millisecond stages are dominated by noise
+        if current_ms is not None and baseline_ms >= 1.0 and current_ms > baseline_ms * (1 + tolerance):
+            regressions.append(f"{name} {current_ms}ms/frame > baseline {baseline_ms}ms/frame")
+    return regressions
+
+# Metric updates FramePipeline makes per frame at batch size 1: four stage
+# timings, the inference latency, the frame counter and the two queue gauges
+# each raised and lowered once
+METRIC_UPDATES_PER_FRAME = 10
+# Share of pipeline throughput the metrics may cost
+METRICS_OVERHEAD_BUDGET = 0.01
+
+def _metric_update_seconds(iterations: int = 100000) -> float:
+    # Mean cost of one update, over a counter, a labelled gauge and a labelled histogram
+    registry = MetricsRegistry(enabled=True)
+    counter = registry.counter("benchmark_total", "Benchmark counter")
+    gauge = registry.gauge("benchmark_depth", "Benchmark gauge", ("queue",)).labels("decode")
+    histogram = registry.histogram("benchmark_seconds", "Benchmark histogram", ("stage",)).labels("infer")
+    started = time.perf_counter()
+    for _ in range(iterations):
+        counter.inc()
+        gauge.inc()
+        histogram.observe(0.004)
+    return (time.perf_counter() - started) / (iterations * 3)
+
+def benchmark_metrics(video_path: str, runs: int, max_frames: int, weights: str = "yolov8n.pt") -> dict:
+    """Pipeline throughput with metrics recorded vs disabled.
+
+    Both variants alternate over several runs and the best fps of each is
+    compared. A 1% difference is within run-to-run noise on most machines, so
+    the budget is checked against an estimate instead: the measured cost of
+    one metric update times the updates made per frame, over the frame time.
+    """
+    model = YOLO(weights)
+    best = {False: 0.0, True: 0.0}
+    enabled = metrics_registry.enabled
+    try:
+        for _ in range(runs):
+            for metrics_enabled in (False, True):
+                metrics_registry.enabled = metrics_enabled
+                _, stats = run_pipeline(video_path, model, max_frames=max_frames)
+                best[metrics_enabled] = max(best[metrics_enabled], stats["fps"])
+    finally:
+        metrics_registry.enabled = enabled
+
+    started = time.perf_counter()
+    metrics_registry.render()
+    render_seconds = time.perf_counter() - started
+
+    update_seconds = _metric_update_seconds()
+    estimated = METRIC_UPDATES_PER_FRAME * update_seconds * best[True] if best[True] else 0.0
+    measured = (best[False] - best[True]) / best[False] if best[False] else 0.0
+    return {
+        "video": os.path.abspath(video_path),
+        "runs": runs,
+        "frames": stats["frames"],
+        "fps_without_metrics": best[False],
+        "fps_with_metrics": best[True],
+        "measured_overhead_pct": round(measured * 100, 3),
+        "update_ns": round(update_seconds * 1e9, 1),
+        "updates_per_frame": METRIC_UPDATES_PER_FRAME,
+        "estimated_overhead_pct": round(estimated * 100, 4),
+        "budget_pct": METRICS_OVERHEAD_BUDGET * 100,
+        "within_budget": estimated <= METRICS_OVERHEAD_BUDGET,
+        "render_ms": round(render_seconds * 1000, 3),
+    }
+
+async def _enqueue_videos(video_path: str, count: int) -> list:
+    from . import models
+    from .database import init_db, engine, AsyncSessionLocal
+    from .jobs import enqueue_job
+
+    await init_db()
+    video_ids = []
+    for i in range(count):
+        async with AsyncSessionLocal() as session:
+            video = models.Video(filename=f"worker-benchmark-{i}.mp4", filepath=video_path, status="pending")
+            session.add(video)
+            await session.commit()
+            video_ids.append(video.id)
+        await enqueue_job(video.id)
+    await engine.dispose()
+    return video_ids
+
+async def _job_states() -> list:
+    from sqlalchemy import select
+    from . import models
+    from .database import engine, AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(models.ProcessingJob.video_id, models.ProcessingJob.status, models.ProcessingJob.attempts,
+                   models.ProcessingJob.worker_id, models.Video.detection_count)
+            .join(models.Video, models.Video.id == models.ProcessingJob.video_id)
+        )
+        rows = [row._asdict() for row in result]
+    await engine.dispose()
+    return rows
+
+def benchmark_workers(video_path: str, workers: int, jobs: int, kill_after: float = None,
+                      lease_seconds: float = 5.0, timeout: float = 600.0, database_url: str = None) -> dict:
+    """Several `python -m app.worker` processes draining one job table.
+
+    Every job must finish exactly once with the same detections. With
+    kill_after, the first worker is killed without warning after that many
+    seconds and its job has to be reclaimed by the others once its lease
+    runs out.
+    """
+    video_path = os.path.abspath(video_path)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["DATABASE_URL"] = database_url or f"sqlite+aiosqlite:///{tmp_dir}/benchmark.db"
+        asyncio.run(_enqueue_videos(video_path, jobs))
+
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [backend_dir, os.environ.get("PYTHONPATH")])),
+            "JOB_POLL_INTERVAL": "0.5",
+            "JOB_LEASE_SECONDS": str(lease_seconds),
+            # Identical inputs would otherwise be answered from the cache
+            "RESULT_CACHE": "false",
+            "MAX_CONCURRENT_JOBS": "1",
+        }
+        started = time.perf_counter()
+        processes = []
+        for i in range(workers):
+            log = open(os.path.join(tmp_dir, f"worker-{i}.log"), "w")
+            processes.append((subprocess.Popen(
+                [sys.executable, "-m", "app.worker"], cwd=tmp_dir,
+                env={**env, "WORKER_ID": f"worker-{i}"}, stdout=log, stderr=subprocess.STDOUT
+            ), log))
+
+        killed = False
+        try:
+            while time.perf_counter() - started < timeout:
+                time.sleep(0.5)
+                if kill_after is not None and not killed and time.perf_counter() - started >= kill_after:
+                    processes[0][0].kill()
+                    killed = True
+                states = asyncio.run(_job_states())
+                if all(state["status"] in ("completed", "failed") for state in states):
+                    break
+            elapsed = time.perf_counter() - started
+        finally:
+            for process, log in processes:
+                if process.poll() is None:
+                    process.send_signal(signal.SIGTERM)
+            for process, log in processes:
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                log.close()
+
+    statuses = [state["status"] for state in states]
+    detection_counts = {state["detection_count"] for state in states if state["status"] == "completed"}
+    jobs_per_worker = {}
+    for state in states:
+        jobs_per_worker[state["worker_id"]] = jobs_per_worker.get(state["worker_id"], 0) + 1
+    completed = statuses.count("completed")
+    return {
+        "workers": workers,
+        "jobs": jobs,
+        "completed": completed,
+        "failed": statuses.count("failed"),
+        "seconds": round(elapsed, 3),
+        "jobs_per_minute": round(completed / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "jobs_per_worker": jobs_per_worker,
+        "killed_worker": "worker-0" if killed else None,
+        "retried_jobs": sum(1 for state in states if (state["attempts"] or 0) > 1),
+        # Every video holds one complete set of detections, none doubled or lost
+        "consistent_detections": len(detection_counts) <= 1,
+        "passed": completed == jobs and len(detection_counts) <= 1,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the video processing pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch_parser = subparsers.add_parser("batch", help="Inference throughput per batch size")
+    batch_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    batch_parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    batch_parser.add_argument("--max-frames", type=int, default=256)
+    batch_parser.add_argument("--weights", default="yolov8n.pt")
+
+    sampling_parser = subparsers.add_parser("sampling", help="Speedup and recall of frame sampling vs full rate")
+    sampling_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    sampling_parser.add_argument("--every", type=int, nargs="*", default=[2, 3, 5, 10])
+    sampling_parser.add_argument("--adaptive", type=float, nargs="*", default=[3.0, 6.0, 12.0])
+    sampling_parser.add_argument("--max-frames", type=int, default=600)
+    sampling_parser.add_argument("--batch-size", type=int, default=1)
+    sampling_parser.add_argument("--weights", default="yolov8n.pt")
+
+    segments_parser = subparsers.add_parser("segments", help="Scaling of parallel segment processing")
+    segments_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    segments_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    segments_parser.add_argument("--batch-size", type=int, default=1)
+    segments_parser.add_argument("--weights", default="yolov8n.pt")
+
+    backends_parser = subparsers.add_parser("backends", help="Throughput and accuracy of CPU inference backends vs PyTorch")
+    backends_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    backends_parser.add_argument("--backends", nargs="+",
+                                 default=["onnxruntime", "onnxruntime-int8", "openvino", "openvino-int8"])
+    backends_parser.add_argument("--max-frames", type=int, default=300)
+    backends_parser.add_argument("--batch-size", type=int, default=1)
+    backends_parser.add_argument("--weights", default="yolov8n.pt")
+
+    roi_parser = subparsers.add_parser("roi", help="Speedup and accuracy of inference sizes, ROI and motion masking")
+    roi_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    roi_parser.add_argument("--sizes", type=int, nargs="*", default=[320, 480])
+    roi_parser.add_argument("--roi", type=json.loads, default=None, help='e.g. "[[100, 50], [500, 400]]"')
+    roi_parser.add_argument("--max-frames", type=int, default=600)
+    roi_parser.add_argument("--batch-size", type=int, default=1)
+    roi_parser.add_argument("--motion-threshold", type=float, default=6.0)
+    roi_parser.add_argument("--weights", default="yolov8n.pt")
+
+    postprocess_parser = subparsers.add_parser("postprocess", help="Post-processing cost per frame in crowded scenes")
+    postprocess_parser.add_argument("--boxes", type=int, nargs="+", default=[10, 50, 100, 300])
+    postprocess_parser.add_argument("--frames", type=int, default=200)
+
+    events_parser = subparsers.add_parser("events", help="DB queries per client: status polling vs event stream")
+    events_parser.add_argument("--clients", type=int, default=50)
+    events_parser.add_argument("--duration", type=float, default=30.0)
+    events_parser.add_argument("--poll-interval", type=float, default=2.0)
+    events_parser.add_argument("--database-url", default=None)
+
+    stream_parser = subparsers.add_parser("stream", help="Real-time processing of the video played back as a live source")
+    stream_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    stream_parser.add_argument("--duration", type=float, default=20.0)
+    stream_parser.add_argument("--budgets", type=float, nargs="+", default=[100.0, 500.0])
+    stream_parser.add_argument("--variant", default=None)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="End-to-end processing with per-stage and DB write timings")
+    pipeline_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    pipeline_parser.add_argument("--options", type=json.loads, default={}, help='Processing options as JSON, e.g. {"batch_size": 8}')
+    pipeline_parser.add_argument("--database-url", default=None)
+    pipeline_parser.add_argument("--output", default=None, help="Also write the report to this file")
+    pipeline_parser.add_argument("--baseline", default=None, help="Report to compare against; exits 1 on regressions")
+    pipeline_parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    pipeline_parser.add_argument("--profile", nargs="?", const="pipeline.prof", default=None,
+                                 help="Write a cProfile of all threads to this file (default: pipeline.prof)")
+
+    metrics_parser = subparsers.add_parser("metrics", help="Pipeline throughput cost of recording metrics")
+    metrics_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    metrics_parser.add_argument("--runs", type=int, default=3)
+    metrics_parser.add_argument("--max-frames", type=int, default=300)
+    metrics_parser.add_argument("--weights", default="yolov8n.pt")
+
+
+    workers_parser = subparsers.add_parser("workers", help="Worker processes sharing one job table, optionally losing one")
+    workers_parser.add_argument("--video", default=DEFAULT_VIDEO)
+    workers_parser.add_argument("--workers", type=int, default=3)
+    workers_parser.add_argument("--jobs", type=int, default=6)
+    workers_parser.add_argument("--kill-after", type=float, default=None,
+                                help="Kill the first worker after this many seconds")
+    workers_parser.add_argument("--lease-seconds", type=float, default=5.0)
+    workers_parser.add_argument("--timeout", type=float, default=600.0)
+    workers_parser.add_argument("--database-url", default=None)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "batch":
+        report = benchmark_batch_sizes(args.video, args.sizes, args.max_frames, args.weights)
+    elif args.command == "sampling":
+        report = benchmark_sampling(args.video, args.every, args.adaptive, args.max_frames,
+                                    args.batch_size, args.weights)
+    elif args.command == "segments":
+        report = benchmark_segments(args.video, args.workers, args.batch_size, args.weights)
+    elif args.command == "backends":
+        report = benchmark_backends(args.video, args.backends, args.max_frames, args.batch_size, args.weights)
+    elif args.command == "roi":
+        report = benchmark_roi(args.video, args.sizes, args.roi, args.max_frames, args.batch_size,
+                               args.motion_threshold, args.weights)
+    elif args.command == "postprocess":
+        report = benchmark_postprocess(args.boxes, args.frames)
+    elif args.command == "events":
+        report = benchmark_events(args.clients, args.duration, args.poll_interval, args.database_url)
+    elif args.command == "stream":
+        report = benchmark_stream(args.video, args.duration, args.budgets, args.variant)
+    elif args.command == "pipeline":
+        report = benchmark_pipeline(args.video, args.options, args.database_url, args.profile)
+        if args.baseline:
+            with open(args.baseline) as f:
+                report["regressions"] = compare_to_baseline(report, json.load(f), args.tolerance)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+    elif args.command == "metrics":
+        report = benchmark_metrics(args.video, args.runs, args.max_frames, args.weights)
+    elif args.command == "workers":
+        report = benchmark_workers(args.video, args.workers, args.jobs, args.kill_after, args.lease_seconds,
+                                   args.timeout, args.database_url)
+
+    print(json.dumps(report, indent=2))
+    if args.command == "pipeline" and report.get("regressions"):
+        sys.exit(1)
+    if args.command == "metrics" and not report["within_budget"]:
+        sys.exit(1)
+    if args.command == "workers" and not report["passed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,69 @@
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.sql import func
 from dotenv import load_dotenv
+import logging
 import os
 import ssl
+import time
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Log every SQL statement; very noisy while detections are being written
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+# Connections kept open, extra connections allowed under load, and the age
+# after which a connection is replaced (before server or proxy timeouts hit it)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Prepared statements cached per asyncpg connection; 0 behind PgBouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+# Apply pending migrations on startup; when false, startup fails if the schema is behind
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic")
 
 # Create SSL context for Aiven PostgreSQL
 ssl_context = ssl.create_default_context()
 ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE
 
+# SSL and server settings only apply to asyncpg (e.g. not to a local SQLite database)
+connect_args = {}
+if DATABASE_URL and DATABASE_URL.startswith("postgresql+asyncpg"):
+    connect_args = {
+        "ssl": ssl_context,
+        "server_settings": {
+            "application_name": "video_processing"
+        },
+        # asyncpg's own cache and SQLAlchemy's cache of prepared statements
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
+
+# SQLite has no connection pool to size
+pool_args = {}
+if DATABASE_URL and not DATABASE_URL.startswith("sqlite"):
+    pool_args = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
 # Create async engine with SSL
 engine = create_async_engine(
     DATABASE_URL,
-    echo=True,
+    echo=SQL_ECHO,
     future=True,
     pool_pre_ping=True,
-    connect_args={
-        "ssl": ssl_context,
-        "server_settings": {
-            "application_name": "video_processing"
-        }
-    }
+    connect_args=connect_args,
+    **pool_args
 )
 
 # Create async session factory
@@ -46,9 +84,88 @@ async def get_db():
         finally:
             await session.close()
 
-async def init_db():
+# Schema changes of each revision, newest first: (revision, table, column or
+# index that revision added). Databases created before migrations were
+# tracked are stamped with the newest revision their schema already has.
+LEGACY_MARKERS = (
+    ("c7d2e9a4f613", "processing_jobs", "lease_expires_at"),
+    ("b3e8f1a52c07", "tracks", None),
+    ("9d4f2b7c1e86", "videos", "processing_seconds"),
+    ("6a3c8e1f9b24", "videos", "content_hash"),
+    ("2e9f4b6a8d13", "detections", "ix_detections_video_id_frame_number"),
+    ("8c1d5e3f7a20", "processing_jobs", "options"),
+    ("4b7e2a91c3d5", "processing_jobs", None),
+)
+# Both branches merged by 4b7e2a91c3d5
+LEGACY_BASE = ("d9dc2ffdce86", "update_video_model")
+
+def alembic_config(connection=None):
+    from alembic.config import Config
+    config = Config()
+    config.set_main_option("script_location", ALEMBIC_DIR)
+    # env.py runs the migrations on this connection instead of opening its own
+    config.attributes["connection"] = connection
+    return config
+
+def legacy_revision(connection):
+    # Revision(s) matching a schema that create_all built without alembic
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    for revision, table, name in LEGACY_MARKERS:
+        if table not in tables:
+            continue
+        if name is None:
+            return revision
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        indexes = {index["name"] for index in inspector.get_indexes(table)}
+        if name in columns or name in indexes:
+            return revision
+    return LEGACY_BASE
+
+def migrate(connection) -> dict:
+    """Brings the schema up to the alembic head without dropping anything.
+
+    An empty database gets every table from the models and is stamped at
+    head. A database built by create_all before migrations were tracked is
+    stamped at the revision its schema matches and upgraded from there.
+    Otherwise pending migrations are applied, or with DB_AUTO_MIGRATE off,
+    startup fails when there are any.
+    """
+    from alembic import command
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    from . import models  # noqa: F401 - registers the tables on Base
+
+    config = alembic_config(connection)
+    heads = set(ScriptDirectory.from_config(config).get_heads())
+    current = set(MigrationContext.configure(connection).get_current_heads())
+    if current == heads:
+        return {"action": "verified", "revision": sorted(heads)}
+
+    if not current:
+        if "videos" not in inspect(connection).get_table_names():
+            Base.metadata.create_all(connection)
+            command.stamp(config, "heads")
+            return {"action": "created", "revision": sorted(heads)}
+        revision = legacy_revision(connection)
+        logger.info(f"Database has no migration history; schema matches {revision}")
+        command.stamp(config, revision)
+        current = set(revision) if isinstance(revision, tuple) else {revision}
+        if current == heads:
+            return {"action": "stamped", "revision": sorted(heads)}
+
+    if not DB_AUTO_MIGRATE:
+        raise RuntimeError(f"Database schema is at {sorted(current)}, expected {sorted(heads)}; run migrations first")
+    command.upgrade(config, "heads")
+    return {"action": "upgraded", "from": sorted(current), "revision": sorted(heads)}
+
+async def init_db() -> dict:
+    started = time.perf_counter()
     async with engine.begin() as conn:
-        # Drop all tables
-        await conn.run_sync(Base.metadata.drop_all)
-        # Create all tables
-        await conn.run_sync(Base.metadata.create_all) 
\ No newline at end of file
+        if conn.dialect.name == "postgresql":
+            # Several processes starting at once migrate one after the other
+            await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('alembic_migrate'))"))
+        report = await conn.run_sync(migrate)
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Database schema {report['action']} in {report['seconds']}s: {report}")
+    return report
@@ -0,0 +1,146 @@
+import numpy as np
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Keep a compressed columnar copy of each video's detections
+COLUMNAR_STORE = os.getenv("COLUMNAR_STORE", "false").lower() in ("1", "true", "yes")
+DETECTION_STORE_DIR = os.getenv("DETECTION_STORE_DIR", "detection_store")
+# Number of decoded videos kept in memory for repeated queries
+STORE_CACHE_SIZE = max(1, int(os.getenv("DETECTION_STORE_CACHE_SIZE", "8")))
+
+COLUMNS = {
+    "frame_number": np.int32,
+    "x": np.float32,
+    "y": np.float32,
+    "width": np.float32,
+    "height": np.float32,
+    "confidence": np.float32,
+}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+class ColumnarDetections:
+    """Accumulates per-frame (N, 5) x1, y1, x2, y2, confidence arrays as columns."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def append(self, frame_numbers, detections):
+        counts = [len(boxes) for boxes in detections]
+        if not sum(counts):
+            return
+        boxes = np.concatenate([np.asarray(b, dtype=np.float32).reshape(-1, 5) for b in detections])
+        self.chunks.append((np.repeat(np.asarray(frame_numbers, dtype=np.int32), counts), boxes))
+
+    def extend(self, frame_numbers, boxes):
+        # frame_numbers has one entry per row of boxes
+        if len(frame_numbers):
+            self.chunks.append((np.asarray(frame_numbers, dtype=np.int32), np.asarray(boxes, dtype=np.float32)))
+
+    def to_arrays(self) -> dict:
+        if not self.chunks:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        frame_number = np.concatenate([frames for frames, _ in self.chunks])
+        boxes = np.concatenate([boxes for _, boxes in self.chunks])
+        order = np.argsort(frame_number, kind="stable")
+        frame_number, boxes = frame_number[order], boxes[order]
+        return {
+            "frame_number": frame_number,
+            "x": boxes[:, 0],
+            "y": boxes[:, 1],
+            "width": boxes[:, 2] - boxes[:, 0],
+            "height": boxes[:, 3] - boxes[:, 1],
+            "confidence": boxes[:, 4],
+        }
+
+def store_path(video_id: int) -> str:
+    return os.path.join(DETECTION_STORE_DIR, f"video_{video_id}.npz").replace("\\", "/")
+
+def has_detections(video_id: int) -> bool:
+    return os.path.exists(store_path(video_id))
+
+def save_detections(video_id: int, arrays: dict, total_frames: int = 0) -> str:
+    os.makedirs(DETECTION_STORE_DIR, exist_ok=True)
+    path = store_path(video_id)
+    frame_number = arrays["frame_number"]
+
+    # frame_offsets[f] is the first row of frame f, so frame ranges are two lookups
+    last_frame = max(total_frames, int(frame_number[-1]) + 1 if len(frame_number) else 0)
+    frame_offsets = np.searchsorted(frame_number, np.arange(last_frame + 1)).astype(np.int64)
+
+    # Write to a temporary file first so readers never see a partial archive
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, frame_offsets=frame_offsets, **{
+            name: np.ascontiguousarray(arrays[name], dtype=dtype) for name, dtype in COLUMNS.items()
+        })
+    os.replace(tmp_path, path)
+    with _cache_lock:
+        _cache.pop(path, None)
+    logger.info(f"Stored {len(frame_number)} detections for video {video_id} at {path}")
+    return path
+
+def delete_detections(video_id: int):
+    path = store_path(video_id)
+    with _cache_lock:
+        _cache.pop(path, None)
+    if os.path.exists(path):
+        os.remove(path)
+
+def load_detections(video_id: int) -> dict:
+    path = store_path(video_id)
+    mtime = os.path.getmtime(path)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            _cache.move_to_end(path)
+            return cached[1]
+
+    with np.load(path) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+
+    with _cache_lock:
+        _cache[path] = (mtime, arrays)
+        while len(_cache) > STORE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return arrays
+
+def query_range(arrays: dict, start_frame: int = None, end_frame: int = None) -> dict:
+    # Detections with start_frame <= frame_number < end_frame, as views into the arrays
+    offsets = arrays["frame_offsets"]
+    last = len(offsets) - 1
+    start = 0 if start_frame is None else offsets[min(max(start_frame, 0), last)]
+    end = offsets[last] if end_frame is None else offsets[min(max(end_frame, 0), last)]
+    end = max(start, end)
+    return {name: arrays[name][start:end] for name in COLUMNS}
+
+def to_npy(arrays: dict) -> bytes:
+    # Interleaves the columns into one record array: a full copy of the range
+    table = np.empty(len(arrays["frame_number"]), dtype=[(name, dtype) for name, dtype in COLUMNS.items()])
+    for name in COLUMNS:
+        table[name] = arrays[name]
+    buffer = io.BytesIO()
+    np.save(buffer, table, allow_pickle=False)
+    return buffer.getvalue()
+
+def to_arrow(arrays: dict) -> bytes:
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    # The columns are copied once into the IPC stream and once more into the
+    # bytes the response is built from
+    table = pa.table({name: pa.array(arrays[name]) for name in COLUMNS})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
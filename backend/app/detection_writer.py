@@ -0,0 +1,102 @@
+from sqlalchemy import insert
+from . import models
+from .database import engine as default_engine
+from .metrics import DETECTION_ROWS, DETECTION_FLUSH_LATENCY
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Flush thresholds for buffered detection inserts
+DETECTION_FLUSH_ROWS = int(os.getenv("DETECTION_FLUSH_ROWS", "5000"))
+DETECTION_FLUSH_SECONDS = float(os.getenv("DETECTION_FLUSH_SECONDS", "2.0"))
+# Use COPY instead of multi-row INSERT when running on asyncpg
+DETECTION_USE_COPY = os.getenv("DETECTION_USE_COPY", "true").lower() in ("1", "true", "yes")
+
+COLUMNS = ("video_id", "frame_number", "x", "y", "width", "height", "confidence", "track_id")
+
+class DetectionWriter:
+    """Buffers Detection rows and writes them to the database in bulk."""
+
+    def __init__(self, engine=None, max_rows: int = DETECTION_FLUSH_ROWS,
+                 max_interval: float = DETECTION_FLUSH_SECONDS, use_copy: bool = DETECTION_USE_COPY,
+                 lease_check=None):
+        self.engine = engine if engine is not None else default_engine
+        # Awaited with the connection before each flush's rows are written; raising drops them
+        self.lease_check = lease_check
+        self.max_rows = max_rows
+        self.max_interval = max_interval
+        self.use_copy = (
+            use_copy
+            and self.engine.dialect.name == "postgresql"
+            and self.engine.dialect.driver == "asyncpg"
+        )
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+        # Write statistics
+        self.rows_written = 0
+        self.flush_count = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    async def add(self, video_id: int, frame_number: int, x: float, y: float,
+                  width: float, height: float, confidence: float, track_id: int = None):
+        self.buffer.append((video_id, frame_number, x, y, width, height, confidence, track_id))
+        await self.maybe_flush()
+
+    async def add_many(self, rows):
+        self.buffer.extend(rows)
+        await self.maybe_flush()
+
+    async def maybe_flush(self):
+        if len(self.buffer) >= self.max_rows:
+            await self.flush()
+        elif self.buffer and time.monotonic() - self.last_flush >= self.max_interval:
+            await self.flush()
+
+    async def flush(self) -> int:
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return 0
+
+        rows, self.buffer = self.buffer, []
+        started = time.perf_counter()
+        async with self.engine.begin() as conn:
+            if self.lease_check is not None:
+                await self.lease_check(conn)
+            if self.use_copy:
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.copy_records_to_table(
+                    models.Detection.__tablename__, records=rows, columns=COLUMNS
+                )
+            else:
+                await conn.execute(
+                    insert(models.Detection.__table__),
+                    [dict(zip(COLUMNS, row)) for row in rows]
+                )
+        elapsed = time.perf_counter() - started
+        DETECTION_FLUSH_LATENCY.observe(elapsed)
+        DETECTION_ROWS.inc(len(rows))
+
+        self.rows_written += len(rows)
+        self.flush_count += 1
+        self.flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.last_flush = time.monotonic()
+        return len(rows)
+
+    async def close(self):
+        await self.flush()
+        logger.info(f"Detection writer finished: {self.stats()}")
+
+    def stats(self) -> dict:
+        return {
+            "rows_written": self.rows_written,
+            "flushes": self.flush_count,
+            "seconds": round(self.flush_seconds, 3),
+            "rows_per_sec": round(self.rows_written / self.flush_seconds, 1) if self.flush_seconds else 0.0,
+            "avg_flush_ms": round(self.flush_seconds / self.flush_count * 1000, 2) if self.flush_count else 0.0,
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+        }
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Number of videos whose last known state is kept for late subscribers
+EVENT_CACHE_SIZE = max(1, int(os.getenv("EVENT_CACHE_SIZE", "1000")))
+# Seconds between keep-alive comments on idle event streams
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+# Events buffered per subscriber; older progress events are dropped for slow clients
+SUBSCRIBER_QUEUE_SIZE = 16
+
+FINAL_STATUSES = ("completed", "failed")
+
+class ProgressBroker:
+    """In-process pub/sub of processing state, keyed by video id."""
+
+    def __init__(self, cache_size: int = EVENT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.subscribers = {}
+        self.last_state = OrderedDict()
+
+    def publish(self, video_id: int, state: dict):
+        self.last_state[video_id] = state
+        self.last_state.move_to_end(video_id)
+        while len(self.last_state) > self.cache_size:
+            self.last_state.popitem(last=False)
+
+        for queue in self.subscribers.get(video_id, ()):
+            if queue.full():
+                # Only the latest progress matters to a client that fell behind
+                queue.get_nowait()
+            queue.put_nowait(state)
+
+    def get_state(self, video_id: int):
+        return self.last_state.get(video_id)
+
+    def subscribe(self, video_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.setdefault(video_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, video_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(video_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[video_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self.subscribers.values())
+
+def format_event(state: dict) -> str:
+    return f"event: {state.get('status', 'progress')}\ndata: {json.dumps(state)}\n\n"
+
+async def event_stream(video_id: int, initial_state: dict):
+    """Server-sent events for one video, starting with its last known state."""
+    queue = broker.subscribe(video_id)
+    try:
+        state = broker.get_state(video_id) or initial_state
+        yield format_event(state)
+        while state.get("status") not in FINAL_STATUSES:
+            try:
+                state = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(state)
+    finally:
+        broker.unsubscribe(video_id, queue)
+
+broker = ProgressBroker()
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Number of videos whose decode/inference/encode can run at the same time
+PROCESSING_WORKERS = max(1, int(os.getenv("PROCESSING_WORKERS", "2")))
+# Maximum number of worker events waiting to be consumed by the event loop
+WORKER_QUEUE_SIZE = max(1, int(os.getenv("WORKER_QUEUE_SIZE", "64")))
+
+_executor = None
+_DONE = object()
+
+class WorkerCancelled(Exception):
+    pass
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PROCESSING_WORKERS, thread_name_prefix="video-worker")
+        logger.info(f"Started processing executor with {PROCESSING_WORKERS} workers")
+    return _executor
+
+def shutdown_executor(wait: bool = False):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+
+async def stream_from_worker(func, *args, executor=None):
+    """Run blocking func(emit, *args) in the processing pool and yield every emitted event.
+
+    The queue between the worker thread and the event loop is bounded, so a slow
+    consumer applies backpressure to the worker instead of buffering without limit.
+    Long-running workers can pass their own executor to keep the pool free.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=WORKER_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    def emit(item):
+        if cancelled.is_set():
+            raise WorkerCancelled()
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def run():
+        try:
+            func(emit, *args)
+        finally:
+            if not cancelled.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(_DONE), loop).result()
+
+    future = loop.run_in_executor(executor or get_executor(), run)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        if not future.done():
+            # Unblock the worker if the consumer stopped early
+            cancelled.set()
+            while not queue.empty():
+                queue.get_nowait()
+
+    # Re-raise any exception from the worker
+    await future
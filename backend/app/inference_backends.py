@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from .sampling import box_iou
+import glob
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "torch" (ultralytics), "onnxruntime" or "openvino"
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+# Use INT8 weights with the onnxruntime and openvino backends
+INFERENCE_INT8 = os.getenv("INFERENCE_INT8", "false").lower() in ("1", "true", "yes")
+# Square input size the exported models are built for
+INFERENCE_IMGSZ = int(os.getenv("INFERENCE_IMGSZ", "640"))
+CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", "0.25"))
+NMS_IOU_THRESHOLD = float(os.getenv("NMS_IOU_THRESHOLD", "0.45"))
+MAX_DETECTIONS = 300
+
+PERSON_CLASS = 0
+LETTERBOX_COLOR = (114, 114, 114)
+
+def nms(boxes, scores, iou_threshold: float = NMS_IOU_THRESHOLD, max_detections: int = MAX_DETECTIONS):
+    # Greedy NMS; each step drops every box overlapping the best remaining one at once
+    order = np.argsort(-scores)
+    keep = []
+    while len(order) and len(keep) < max_detections:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        order = rest[box_iou(boxes[best:best + 1], boxes[rest])[0] <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+def letterbox(frame, size: int):
+    # Resize keeping the aspect ratio and pad to size x size, like ultralytics does
+    height, width = frame.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    if (new_width, new_height) != (width, height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    left, top = (size - new_width) // 2, (size - new_height) // 2
+    frame = cv2.copyMakeBorder(
+        frame, top, size - new_height - top, left, size - new_width - left,
+        cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR
+    )
+    return frame, ratio, (left, top)
+
+def postprocess(prediction, ratio: float, pad, frame_shape,
+                conf_threshold: float = CONFIDENCE_THRESHOLD, iou_threshold: float = NMS_IOU_THRESHOLD):
+    """Person boxes from one raw YOLOv8 output, as an (N, 5) x1, y1, x2, y2, confidence array."""
+    # prediction is (4 + classes, anchors): cx, cy, w, h then one score per class.
+    # Only the person row is looked at, so the class filter costs nothing
+    scores = prediction[4 + PERSON_CLASS]
+    candidates = scores >= conf_threshold
+    if not candidates.any():
+        return np.empty((0, 5), dtype=np.float32)
+
+    cx, cy, w, h = prediction[:4, candidates]
+    scores = scores[candidates]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    keep = nms(boxes, scores, iou_threshold)
+    boxes, scores = boxes[keep], scores[keep]
+
+    # Undo the letterbox and clip to the frame
+    boxes -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=boxes.dtype)
+    boxes /= ratio
+    height, width = frame_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return np.column_stack([boxes, scores]).astype(np.float32)
+
+class ExportedDetector:
+    """Person detector running an exported YOLOv8 model outside of PyTorch.
+
+    detect() takes BGR frames and returns one (N, 5) array per frame, like
+    pipeline.detect_people does for the ultralytics model.
+    """
+
+    def __init__(self, path: str, runtime: str, imgsz: int = INFERENCE_IMGSZ):
+        self.path = path
+        self.runtime = runtime
+        self.imgsz = imgsz
+        if runtime == "onnxruntime":
+            import onnxruntime as ort
+            self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            self.batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        elif runtime == "openvino":
+            from openvino.runtime import Core
+            self.compiled = Core().compile_model(path, "CPU")
+            self.output = self.compiled.output(0)
+            batch = self.compiled.input(0).get_partial_shape()[0]
+            self.batch_size = None if batch.is_dynamic else batch.get_length()
+        else:
+            raise ValueError(f"Unknown runtime {runtime!r}")
+
+    def _run(self, batch):
+        if self.runtime == "onnxruntime":
+            return self.session.run(None, {self.input_name: batch})[0]
+        return self.compiled(batch)[self.output]
+
+    def detect(self, frames: list, imgsz: int = None) -> list:
+        # Models are exported with dynamic axes, so other input sizes work too
+        letterboxed = [letterbox(frame, imgsz or self.imgsz) for frame in frames]
+        # BGR HWC uint8 -> RGB CHW float32 in [0, 1]
+        batch = np.stack([image for image, _, _ in letterboxed])[..., ::-1].transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+        if self.batch_size is None:
+            predictions = self._run(batch)
+        else:
+            # Models exported with a fixed batch size are fed in chunks of that size
+            predictions = np.concatenate([
+                self._run(batch[i:i + self.batch_size]) for i in range(0, len(batch), self.batch_size)
+            ])
+        return [
+            postprocess(prediction, ratio, pad, frame.shape)
+            for prediction, (_, ratio, pad), frame in zip(predictions, letterboxed, frames)
+        ]
+
+def _export(weights: str, format: str, int8: bool = False) -> str:
+    return YOLO(weights).export(format=format, imgsz=INFERENCE_IMGSZ, dynamic=True, int8=int8)
+
+def export_onnx(weights: str, int8: bool = False) -> str:
+    # Exports are kept next to the weights and reused
+    path = os.path.splitext(weights)[0] + ".onnx"
+    if not os.path.exists(path):
+        logger.info(f"Exporting {weights} to ONNX")
+        path = _export(weights, "onnx")
+    if not int8:
+        return path
+
+    int8_path = os.path.splitext(path)[0] + "_int8.onnx"
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        logger.info(f"Quantizing {path} to INT8")
+        quantize_dynamic(path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+def export_openvino(weights: str, int8: bool = False) -> str:
+    suffix = "_int8_openvino_model" if int8 else "_openvino_model"
+    model_dir = os.path.splitext(weights)[0] + suffix
+    if not os.path.isdir(model_dir):
+        logger.info(f"Exporting {weights} to OpenVINO{' INT8' if int8 else ''}")
+        model_dir = _export(weights, "openvino", int8)
+    return glob.glob(os.path.join(model_dir, "*.xml"))[0]
+
+def load_detector(weights: str, backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8):
+    # The torch backend is the ultralytics model itself
+    if backend == "torch":
+        return YOLO(weights)
+    # Runtimes are imported first so a missing one fails before the export
+    if backend == "onnxruntime":
+        import onnxruntime
+        return ExportedDetector(export_onnx(weights, int8), "onnxruntime")
+    if backend == "openvino":
+        import openvino
+        return ExportedDetector(export_openvino(weights, int8), "openvino")
+    raise ValueError(f"Unknown inference backend {backend!r}")
@@ -0,0 +1,500 @@
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .database import engine
+from .video_processor import process_video_async, clear_results
+from .events import broker
+from .metrics import JOBS_ACTIVE, JOBS_FINISHED, JOBS_RECLAIMED, JOB_WAIT_SECONDS, JOB_SECONDS
+from collections import deque
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of videos processed at the same time
+MAX_CONCURRENT_JOBS = max(1, int(os.getenv("MAX_CONCURRENT_JOBS", "2")))
+# "priority" (highest priority first, then FIFO) or "fifo"
+JOB_ORDERING = os.getenv("JOB_ORDERING", "priority").lower()
+# Seconds between two scans of the job table when nothing wakes the scheduler
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5.0"))
+# Jobs interrupted by a restart are retried up to this many attempts
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Minimum interval between two progress writes for the same job
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "2.0"))
+# "embedded": the API process runs jobs itself; "api": jobs are left to
+# `python -m app.worker` processes sharing the database and storage
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "embedded").lower()
+# A claimed job belongs to its worker until the lease runs out; workers renew
+# their leases every JOB_HEARTBEAT_INTERVAL and jobs of dead workers are requeued
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(JOB_LEASE_SECONDS / 3)))
+# Identifies this process in job leases
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Seconds between two reads of job progress for event streams in "api" mode
+JOB_WATCH_INTERVAL = float(os.getenv("JOB_WATCH_INTERVAL", "1.0"))
+
+class LeaseLost(Exception):
+    pass
+
+async def enqueue_job(video_id: int, priority: int = 0, options=None) -> models.ProcessingJob:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        job = models.ProcessingJob(
+            video_id=video_id,
+            status="queued",
+            priority=priority,
+            options=options.model_dump(exclude_none=True) if options else None,
+            created_at=datetime.utcnow()
+        )
+        session.add(job)
+        await session.execute(
+            update(models.Video)
+            .where(models.Video.id == video_id)
+            .values(status="pending", processed_frames=0, processing_seconds=None)
+        )
+        await session.commit()
+    logger.info(f"Queued job {job.id} for video_id: {video_id}")
+    broker.publish(video_id, {"video_id": video_id, "job_id": job.id, "status": "pending", "progress": 0})
+    scheduler.wake()
+    return job
+
+async def get_latest_job(session: AsyncSession, video_id: int):
+    stmt = (
+        select(models.ProcessingJob)
+        .where(models.ProcessingJob.video_id == video_id)
+        .order_by(models.ProcessingJob.id.desc())
+        .limit(1)
+    )
+    result = await session.execute(stmt)
+    return result.scalar_one_or_none()
+
+async def get_queue_position(session: AsyncSession, job: models.ProcessingJob) -> int:
+    # Number of queued jobs that will be picked before this one
+    stmt = select(func.count(models.ProcessingJob.id)).where(models.ProcessingJob.status == "queued")
+    if JOB_ORDERING == "fifo":
+        stmt = stmt.where(models.ProcessingJob.id < job.id)
+    else:
+        stmt = stmt.where(
+            (models.ProcessingJob.priority > job.priority)
+            | ((models.ProcessingJob.priority == job.priority) & (models.ProcessingJob.id < job.id))
+        )
+    result = await session.execute(stmt)
+    return result.scalar()
+
+class JobScheduler:
+    """Drains the processing_jobs table with a bounded number of concurrent jobs.
+
+    Several schedulers (API process or app.worker processes) can drain the
+    same table. A claimed job is leased to its worker_id, and the lease is
+    renewed by a heartbeat while the job runs. Jobs whose lease ran out
+    belong to a worker that died or lost the database and are requeued by
+    whichever scheduler notices first. A worker that finds its lease taken
+    over stops the job and leaves its results to the new owner.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_JOBS, ordering: str = JOB_ORDERING,
+                 poll_interval: float = JOB_POLL_INTERVAL, worker_id: str = WORKER_ID,
+                 lease_seconds: float = JOB_LEASE_SECONDS, heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL):
+        self.max_concurrency = max_concurrency
+        self.ordering = ordering
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id
+        self.lease = timedelta(seconds=lease_seconds)
+        self.heartbeat_interval = heartbeat_interval
+        self.running = {}
+        self.completed = 0
+        self.failed = 0
+        self.reclaimed = 0
+        self.recent_waits = deque(maxlen=100)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._heartbeat_task = None
+
+    async def start(self):
+        await self.reclaim()
+        self._task = asyncio.create_task(self._run())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        logger.info(
+            f"Job scheduler {self.worker_id} started "
+            f"(max concurrency {self.max_concurrency}, {self.ordering} ordering)"
+        )
+
+    async def stop(self):
+        for task in (self._task, self._heartbeat_task):
+            if task:
+                task.cancel()
+        self._task = self._heartbeat_task = None
+        job_ids = list(self.running)
+        tasks = list(self.running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if job_ids:
+            await self.release(job_ids)
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def release(self, job_ids: list):
+        # Hands unfinished jobs back to the queue on shutdown; the attempt doesn't count
+        async with AsyncSession(engine) as session:
+            released = await session.execute(
+                update(models.ProcessingJob)
+                .where(models.ProcessingJob.id.in_(job_ids))
+                .where(models.ProcessingJob.status == "processing")
+                .where(models.ProcessingJob.worker_id == self.worker_id)
+                .values(status="queued", progress=0, started_at=None, worker_id=None, lease_expires_at=None,
+                        attempts=models.ProcessingJob.attempts - 1)
+            )
+            await session.execute(
+                update(models.Video)
+                .where(models.Video.id.in_(
+                    select(models.ProcessingJob.video_id).where(models.ProcessingJob.id.in_(job_ids))
+                ))
+                .where(models.Video.status == "processing")
+                .values(status="pending", processed_frames=0)
+            )
+            await session.commit()
+        logger.info(f"Released {released.rowcount} jobs held by {self.worker_id}")
+
+    async def reclaim(self):
+        # Jobs whose lease ran out, or that were claimed before leases existed,
+        # lost their worker: retry them or give up after JOB_MAX_ATTEMPTS
+        now = datetime.utcnow()
+        expired = (models.ProcessingJob.status == "processing") & (
+            models.ProcessingJob.lease_expires_at.is_(None) | (models.ProcessingJob.lease_expires_at < now)
+        )
+        async with AsyncSession(engine) as session:
+            result = await session.execute(
+                select(models.ProcessingJob.id, models.ProcessingJob.video_id, models.ProcessingJob.attempts)
+                .where(expired)
+                .with_for_update(skip_locked=True)
+            )
+            jobs = result.all()
+            if not jobs:
+                return
+            retry = [job for job in jobs if (job.attempts or 0) < JOB_MAX_ATTEMPTS]
+            give_up = [job for job in jobs if (job.attempts or 0) >= JOB_MAX_ATTEMPTS]
+            if retry:
+                await session.execute(
+                    update(models.ProcessingJob)
+                    .where(models.ProcessingJob.id.in_([job.id for job in retry]))
+                    .where(expired)
+                    .values(status="queued", progress=0, started_at=None, worker_id=None, lease_expires_at=None)
+                )
+                await session.execute(
+                    update(models.Video)
+                    .where(models.Video.id.in_([job.video_id for job in retry]))
+                    .values(status="pending", processed_frames=0)
+                )
+            if give_up:
+                await session.execute(
+                    update(models.ProcessingJob)
+                    .where(models.ProcessingJob.id.in_([job.id for job in give_up]))
+                    .where(expired)
+                    .values(status="failed", error="Interrupted too many times", finished_at=now,
+                            lease_expires_at=None)
+                )
+                await session.execute(
+                    update(models.Video)
+                    .where(models.Video.id.in_([job.video_id for job in give_up]))
+                    .values(status="failed")
+                )
+            await session.commit()
+        self.reclaimed += len(jobs)
+        JOBS_RECLAIMED.inc(len(jobs))
+        logger.info(f"Reclaimed jobs of lost workers: {len(retry)} requeued, {len(give_up)} failed")
+        if retry:
+            self.wake()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            job_ids = list(self.running)
+            if not job_ids:
+                continue
+            try:
+                async with AsyncSession(engine) as session:
+                    await session.execute(
+                        update(models.ProcessingJob)
+                        .where(models.ProcessingJob.id.in_(job_ids))
+                        .where(models.ProcessingJob.status == "processing")
+                        .where(models.ProcessingJob.worker_id == self.worker_id)
+                        .values(lease_expires_at=datetime.utcnow() + self.lease)
+                    )
+                    result = await session.execute(
+                        select(models.ProcessingJob.id)
+                        .where(models.ProcessingJob.id.in_(job_ids))
+                        .where(models.ProcessingJob.worker_id == self.worker_id)
+                    )
+                    held = set(result.scalars())
+                    await session.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The lease survives a missed beat or two; reclaiming starts once it expires
+                logger.error(f"Error renewing job leases: {str(e)}", exc_info=True)
+                continue
+            for job_id in job_ids:
+                task = self.running.get(job_id)
+                if job_id not in held and task is not None:
+                    logger.warning(f"Lease of job {job_id} was taken over, stopping it")
+                    task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reclaim()
+                while len(self.running) < self.max_concurrency:
+                    job = await self._claim_next()
+                    if job is None:
+                        break
+                    self.running[job.id] = asyncio.create_task(self._execute(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error scheduling jobs: {str(e)}", exc_info=True)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim_next(self):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            stmt = select(models.ProcessingJob).where(models.ProcessingJob.status == "queued")
+            if self.ordering == "fifo":
+                stmt = stmt.order_by(models.ProcessingJob.created_at, models.ProcessingJob.id)
+            else:
+                stmt = stmt.order_by(
+                    models.ProcessingJob.priority.desc(),
+                    models.ProcessingJob.created_at,
+                    models.ProcessingJob.id
+                )
+            # Concurrent workers on PostgreSQL skip rows another one is claiming
+            result = await session.execute(stmt.limit(1).with_for_update(skip_locked=True))
+            job = result.scalar_one_or_none()
+            if job is None:
+                return None
+
+            # Only claim the job if nobody else did in the meantime
+            started_at = datetime.utcnow()
+            attempts = (job.attempts or 0) + 1
+            claimed = await session.execute(
+                update(models.ProcessingJob)
+                .where(models.ProcessingJob.id == job.id)
+                .where(models.ProcessingJob.status == "queued")
+                .values(status="processing", started_at=started_at, attempts=attempts,
+                        worker_id=self.worker_id, lease_expires_at=started_at + self.lease)
+            )
+            if claimed.rowcount != 1:
+                await session.rollback()
+                return await self._claim_next()
+            await session.execute(
+                update(models.Video).where(models.Video.id == job.video_id).values(status="processing")
+            )
+            await session.commit()
+
+            video = await session.get(models.Video, job.video_id)
+
+        wait = (started_at - job.created_at).total_seconds()
+        self.recent_waits.append(wait)
+        JOB_WAIT_SECONDS.observe(wait)
+        job.attempts = attempts
+        job.video = video
+        return job
+
+    async def _update_job(self, job: models.ProcessingJob, video_values=None, **values):
+        # video_values updates the video summary in the same transaction.
+        # Nothing is written once another worker has taken the job over
+        async with AsyncSession(engine) as session:
+            updated = await session.execute(
+                update(models.ProcessingJob)
+                .where(models.ProcessingJob.id == job.id)
+                .where(models.ProcessingJob.worker_id == self.worker_id)
+                .values(**values)
+            )
+            if updated.rowcount != 1:
+                await session.rollback()
+                raise LeaseLost(f"Job {job.id} is no longer leased to {self.worker_id}")
+            if video_values:
+                await session.execute(
+                    update(models.Video).where(models.Video.id == job.video_id).values(**video_values)
+                )
+            await session.commit()
+
+    async def _check_lease(self, job: models.ProcessingJob, connection):
+        # Locks the job row, so it can't be taken over before the caller's transaction commits
+        worker_id = await connection.scalar(
+            select(models.ProcessingJob.worker_id).where(models.ProcessingJob.id == job.id).with_for_update()
+        )
+        if worker_id != self.worker_id:
+            raise LeaseLost(f"Job {job.id} is no longer leased to {self.worker_id}")
+
+    async def _execute(self, job: models.ProcessingJob):
+        last_write = 0.0
+        started = time.monotonic()
+
+        def publish(status: str, progress: float, **extra):
+            broker.publish(job.video_id, {
+                "video_id": job.video_id,
+                "job_id": job.id,
+                "status": status,
+                "progress": progress,
+                **extra
+            })
+
+        async def on_progress(progress: float, stats: dict, processed_frames: int, frame_count: int):
+            nonlocal last_write
+            now = time.monotonic()
+            elapsed = now - started
+            publish(
+                "processing",
+                progress,
+                fps=stats.get("fps") if stats else None,
+                eta_seconds=round(elapsed * (100 - progress) / progress, 1) if progress > 0 else None
+            )
+            if now - last_write >= JOB_PROGRESS_INTERVAL:
+                last_write = now
+                await self._update_job(
+                    job,
+                    progress=progress,
+                    stats=stats,
+                    video_values={"processed_frames": processed_frames, "frame_count": frame_count}
+                )
+
+        try:
+            if job.video is None:
+                raise ValueError("Video not found")
+            logger.info(f"Starting job {job.id} for video_id: {job.video_id}")
+            publish("processing", 0)
+            # Rows of an interrupted or failed earlier run would be counted twice
+            await clear_results(job.video_id)
+            stats = await process_video_async(
+                job.video_id, job.video.filepath, options=job.options, on_progress=on_progress,
+                lease_check=lambda connection: self._check_lease(job, connection)
+            )
+            await self._update_job(job, status="completed", progress=100, stats=stats,
+                                   finished_at=datetime.utcnow(), lease_expires_at=None)
+            publish("completed", 100, seconds=round(time.monotonic() - started, 3))
+            self.completed += 1
+            JOBS_FINISHED.labels("completed").inc()
+        except asyncio.CancelledError:
+            raise
+        except LeaseLost as e:
+            # The worker that took the job over reports its outcome
+            logger.warning(f"Stopped job {job.id}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}", exc_info=True)
+            try:
+                await self._update_job(job, status="failed", error=str(e), finished_at=datetime.utcnow(),
+                                       lease_expires_at=None, video_values={"status": "failed"})
+            except LeaseLost:
+                logger.warning(f"Job {job.id} was taken over before its failure could be recorded")
+            else:
+                publish("failed", 0, error=str(e))
+                self.failed += 1
+                JOBS_FINISHED.labels("failed").inc()
+        finally:
+            JOB_SECONDS.observe(time.monotonic() - started)
+            self.running.pop(job.id, None)
+            self.wake()
+
+    async def metrics(self) -> dict:
+        async with AsyncSession(engine) as session:
+            result = await session.execute(
+                select(func.count(models.ProcessingJob.id), func.min(models.ProcessingJob.created_at))
+                .where(models.ProcessingJob.status == "queued")
+            )
+            queue_length, oldest = result.one()
+            # Jobs in progress on every worker sharing the database
+            result = await session.execute(
+                select(func.count(models.ProcessingJob.id), func.count(models.ProcessingJob.worker_id.distinct()))
+                .where(models.ProcessingJob.status == "processing")
+            )
+            processing, busy_workers = result.one()
+
+        waits = list(self.recent_waits)
+        return {
+            "queue_length": queue_length,
+            "processing": processing,
+            "busy_workers": busy_workers,
+            "processing_mode": PROCESSING_MODE,
+            "worker_id": self.worker_id,
+            "running": len(self.running),
+            "max_concurrency": self.max_concurrency,
+            "ordering": self.ordering,
+            "completed": self.completed,
+            "failed": self.failed,
+            "reclaimed": self.reclaimed,
+            "oldest_queued_wait_seconds": round((datetime.utcnow() - oldest).total_seconds(), 3) if oldest else 0.0,
+            "avg_wait_seconds": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "max_wait_seconds": round(max(waits), 3) if waits else 0.0,
+        }
+
+class JobWatcher:
+    """Publishes the progress of jobs run by worker processes to this process's broker.
+
+    In "api" mode the workers' events never reach the API's event streams,
+    so the latest job of every video with a subscriber is read from the
+    database and published when it changed: one query per interval, however
+    many clients are listening.
+    """
+
+    def __init__(self, interval: float = JOB_WATCH_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                video_ids = list(broker.subscribers)
+                if video_ids:
+                    await self.poll(video_ids)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading job progress: {str(e)}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def poll(self, video_ids: list):
+        latest = (
+            select(func.max(models.ProcessingJob.id))
+            .where(models.ProcessingJob.video_id.in_(video_ids))
+            .group_by(models.ProcessingJob.video_id)
+        )
+        async with AsyncSession(engine) as session:
+            result = await session.execute(
+                select(models.ProcessingJob.id, models.ProcessingJob.video_id, models.ProcessingJob.status,
+                       models.ProcessingJob.progress, models.ProcessingJob.error)
+                .where(models.ProcessingJob.id.in_(latest))
+            )
+            jobs = result.all()
+        for job in jobs:
+            state = {
+                "video_id": job.video_id,
+                "job_id": job.id,
+                # Same vocabulary as the events of an embedded scheduler
+                "status": "pending" if job.status == "queued" else job.status,
+                "progress": job.progress or 0,
+            }
+            if job.status == "failed":
+                state["error"] = job.error
+            if broker.get_state(job.video_id) != state:
+                broker.publish(job.video_id, state)
+
+scheduler = JobScheduler()
+JOBS_ACTIVE.set_function(lambda: len(scheduler.running))
+job_watcher = JobWatcher()
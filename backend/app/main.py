@@ -1,19 +1,32 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, tuple_
 from . import models, schemas
 from .database import engine, Base, get_db, AsyncSessionLocal, init_db
-from .video_processor import process_video, get_processing_progress
+from .jobs import scheduler, job_watcher, enqueue_job, get_latest_job, get_queue_position, PROCESSING_MODE
+from .executor import shutdown_executor
+from . import detection_store, uploads
+from .events import broker, event_stream
+from .model_registry import registry
+from .rendering import render_cache, RenderDiscarded
+from .media import RangeFileResponse
+from .result_cache import result_cache
+from .video_processor import clear_results
+from .streams import stream_manager, stream_models, StreamLimitError
+from .metrics import registry as metrics_registry, MetricsMiddleware, UPLOADS, JOBS_QUEUED, JOBS_PROCESSING, CONTENT_TYPE
 import os
 from dotenv import load_dotenv
 import logging
 import io
-from typing import List
+from typing import List, Optional
+from pydantic import ValidationError
 import asyncio
+import time
 from datetime import datetime
-import shutil
+import base64
+import json
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,54 +45,182 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"]
 )
+# Outermost, so handler latency includes the other middleware
+app.add_middleware(MetricsMiddleware)
+
+# Rows fetched per round trip when streaming detections
+DETECTION_STREAM_CHUNK = 1000
 
 # Create directories if they don't exist
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = uploads.UPLOAD_DIR
 PROCESSED_DIR = "processed_videos"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
 @app.on_event("startup")
 async def startup_event():
-    await init_db()
-    logger.info("Database initialized")
+    started = time.perf_counter()
+    # Applies pending migrations; existing data is kept
+    database = await init_db()
+    database_done = time.perf_counter()
+    if PROCESSING_MODE == "api":
+        # Jobs run in app.worker processes; only their progress is followed here
+        model_done = time.perf_counter()
+        await job_watcher.start()
+    else:
+        # Load and warm up the default weights before the first job needs them
+        await asyncio.to_thread(registry.preload)
+        model_done = time.perf_counter()
+        await scheduler.start()
+    finished = time.perf_counter()
+    logger.info(
+        f"Startup finished in {finished - started:.3f}s (database {database['seconds']}s, "
+        f"model {model_done - database_done:.3f}s, scheduler {finished - model_done:.3f}s)"
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stream_manager.shutdown()
+    render_cache.shutdown()
+    await job_watcher.stop()
+    await scheduler.stop()
+    shutdown_executor()
+
+def video_to_dict(video: models.Video) -> dict:
+    return {
+        "id": video.id,
+        "filename": video.filename,
+        "created_at": video.created_at.isoformat() if video.created_at else None,
+        "status": video.status,
+        "file_size": video.file_size,
+        "frame_count": video.frame_count,
+        "processed_frames": video.processed_frames,
+        "detection_count": video.detection_count,
+        "processing_seconds": video.processing_seconds
+    }
+
+async def register_upload(filename: str, filepath: str, content_hash: str, size: int,
+                          priority: int = 0, processing_options=None) -> dict:
+    async with AsyncSession(engine) as session:
+        # Identical content was uploaded before: reuse that video and its detections
+        stmt = select(models.Video).where(models.Video.content_hash == content_hash).limit(1)
+        result = await session.execute(stmt)
+        existing = result.scalar_one_or_none()
+        if existing:
+            # Only finished or pending results are reused; a failed or abandoned
+            # video is queued again instead of being returned as it is
+            job = await get_latest_job(session, existing.id)
+            if existing.status == "completed" or (job and job.status in ("queued", "processing")):
+                logger.info(f"Upload of {filename} matches video {existing.id}, skipping processing")
+                UPLOADS.labels("deduplicated").inc()
+                return {**video_to_dict(existing), "deduplicated": True}
+
+            video = video_to_dict(existing)
+            if existing.filepath != filepath:
+                existing.filepath = filepath
+                await session.commit()
+            job = await enqueue_job(video["id"], priority, processing_options)
+            logger.info(f"Upload of {filename} matches unfinished video {video['id']}, queued job {job.id}")
+            UPLOADS.labels("requeued").inc()
+            return {**video, "deduplicated": True, "status": "queued", "job_id": job.id}
 
-@app.post("/video/upload")
-async def upload_video(file: UploadFile = File(...)):
-    try:
-        # Create unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{file.filename}"
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        
-        # Save file to disk
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
         # Create video record
         video = models.Video(
-            filename=file.filename,
+            filename=filename,
             filepath=filepath,
+            content_hash=content_hash,
+            file_size=size,
+            status="pending",
             created_at=datetime.now()
         )
-        
-        async with AsyncSession(engine) as session:
-            session.add(video)
-            await session.commit()
-            await session.refresh(video)
-            
-            # Start processing in background
-            process_video(video.id, video)
-            
-            return {
-                "id": video.id,
-                "filename": video.filename,
-                "created_at": video.created_at.isoformat()
-            }
+        session.add(video)
+        await session.commit()
+        await session.refresh(video)
+
+    # Queue the video for processing
+    await enqueue_job(video.id, priority, processing_options)
+    UPLOADS.labels("new").inc()
+
+    return {
+        "id": video.id,
+        "filename": video.filename,
+        "created_at": video.created_at.isoformat(),
+        "deduplicated": False,
+        "status": "queued"
+    }
+
+@app.post("/video/upload")
+async def upload_video(file: UploadFile = File(...), priority: int = 0, options: Optional[str] = Form(None)):
+    try:
+        # Processing options arrive as a JSON form field next to the file
+        try:
+            processing_options = schemas.ProcessingOptions.model_validate_json(options) if options else None
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors())
+
+        # Stream the file to content-addressed storage while hashing it
+        filepath, content_hash, size = await uploads.save_upload(file)
+        return await register_upload(file.filename, filepath, content_hash, size, priority, processing_options)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading video: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/uploads")
+async def create_upload_session(request: schemas.UploadSessionCreate):
+    try:
+        return await asyncio.to_thread(uploads.create_session, request.filename, request.size)
+    except Exception as e:
+        logger.error(f"Error creating upload session: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/uploads/{upload_id}")
+async def get_upload_session(upload_id: str):
+    try:
+        return uploads.get_session(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request):
+    # The body is appended at the offset given by the Upload-Offset header
+    try:
+        offset = int(request.headers.get("upload-offset", "0"))
+        new_offset = await uploads.append_chunk(upload_id, offset, request.stream())
+        return {"upload_id": upload_id, "offset": new_offset}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except uploads.UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error receiving upload chunk: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, priority: int = 0,
+                          options: Optional[schemas.ProcessingOptions] = None):
+    try:
+        filepath, content_hash, size, filename = await uploads.complete_session(upload_id)
+        return await register_upload(filename, filepath, content_hash, size, priority, options)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except uploads.UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "offset": e.expected})
+    except Exception as e:
+        logger.error(f"Error completing upload: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/uploads/{upload_id}")
+async def cancel_upload(upload_id: str):
+    try:
+        uploads.delete_session(upload_id)
+        return {"message": "Upload cancelled"}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
 @app.get("/videos")
 async def get_videos():
     try:
@@ -87,11 +228,7 @@ async def get_videos():
             stmt = select(models.Video)
             result = await session.execute(stmt)
             videos = result.scalars().all()
-            return [{
-                "id": v.id,
-                "filename": v.filename,
-                "created_at": v.created_at.isoformat() if v.created_at else None
-            } for v in videos]
+            return [video_to_dict(v) for v in videos]
     except Exception as e:
         logger.error(f"Error fetching videos: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -100,36 +237,54 @@ async def get_videos():
 async def get_video_status(video_id: int):
     try:
         async with AsyncSession(engine) as session:
-            # Check if video exists
-            stmt = select(models.Video).where(models.Video.id == video_id)
-            result = await session.execute(stmt)
-            video = result.scalar_one_or_none()
+            video = await session.get(models.Video, video_id)
             
             if not video:
                 raise HTTPException(status_code=404, detail="Video not found")
             
-            # Check if video has detections
-            stmt = select(models.Detection).where(models.Detection.video_id == video_id)
-            result = await session.execute(stmt)
-            detections = result.scalars().all()
-            
-            if detections:
+            # Finished videos are answered from the video row alone
+            if video.status == "completed":
                 return {"status": "completed", "progress": 100}
-            
-            # Get processing progress
-            progress = get_processing_progress(video_id)
-            if progress == -1:
-                return {"status": "failed", "progress": 0}
-            elif progress > 0:
-                return {"status": "processing", "progress": progress}
-            else:
-                return {"status": "pending", "progress": 0}
+
+            # Queue position, errors and pipeline stats live on the latest job
+            job = await get_latest_job(session, video_id)
+            if video.status == "failed":
+                return {"status": "failed", "progress": 0, "error": job.error if job else None}
+            elif video.status == "processing":
+                progress = job.progress if job else 0
+                return {"status": "processing", "progress": progress, "pipeline": job.stats if job else None}
+            elif job is not None and job.status == "queued":
+                return {
+                    "status": "pending",
+                    "progress": 0,
+                    "queue_position": await get_queue_position(session, job)
+                }
+            return {"status": "pending", "progress": 0}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error getting video status: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/video/{video_id}/events")
+async def video_events(video_id: int):
+    try:
+        # Late subscribers get the cached state; the database is only read when
+        # nothing about this video has been published since startup
+        initial_state = broker.get_state(video_id)
+        if initial_state is None:
+            initial_state = {"video_id": video_id, **(await get_video_status(video_id))}
+        return StreamingResponse(
+            event_stream(video_id, initial_state),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming video events: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/video/{video_id}")
 async def get_video(video_id: int):
     try:
@@ -142,11 +297,7 @@ async def get_video(video_id: int):
             if not video:
                 raise HTTPException(status_code=404, detail="Video not found")
             
-            return {
-                "id": video.id,
-                "filename": video.filename,
-                "created_at": video.created_at.isoformat() if video.created_at else None
-            }
+            return video_to_dict(video)
     except HTTPException:
         raise
     except Exception as e:
@@ -154,7 +305,8 @@ async def get_video(video_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/video/{video_id}/process")
-async def process_video_endpoint(video_id: int):
+async def process_video_endpoint(video_id: int, priority: int = 0, reprocess: bool = False,
+                                 options: Optional[schemas.ProcessingOptions] = None):
     try:
         async with AsyncSession(engine) as session:
             # Check if video exists
@@ -166,58 +318,326 @@ async def process_video_endpoint(video_id: int):
                 raise HTTPException(status_code=404, detail="Video not found")
             
             # Check if video is already processed
-            stmt = select(models.Detection).where(models.Detection.video_id == video_id)
-            result = await session.execute(stmt)
-            detections = result.scalars().all()
-            
-            if detections:
+            if video.status == "completed" and not reprocess:
                 return {"status": "completed", "message": "Video already processed"}
+
+            # Streams keep a URL or camera file, not an uploaded file a job could read
+            if not uploads.is_upload_path(video.filepath):
+                raise HTTPException(status_code=400, detail="Only uploaded videos can be processed")
+
+            # Don't queue the same video twice
+            job = await get_latest_job(session, video_id)
+            if job and job.status in ("queued", "processing"):
+                return {"status": job.status, "message": "Video is already queued for processing", "job_id": job.id}
+
+            if video.status == "completed":
+                # Processing again, e.g. with other options: drop the previous results now
+                # rather than serving them until the job starts
+                await clear_results(video_id)
             
-            # Start processing
-            process_video(video_id, video)
-            return {"status": "processing", "message": "Video processing started"}
+            # Queue processing
+            job = await enqueue_job(video_id, priority, options)
+            return {"status": "queued", "message": "Video queued for processing", "job_id": job.id}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error starting video processing: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/streams")
+async def start_stream(request: schemas.StreamCreate):
+    try:
+        options = request.options.model_dump(exclude_none=True) if request.options else {}
+        stream = await stream_manager.start(request.source, options, request.loop, request.latency_budget_ms)
+        return stream.health()
+    except StreamLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error starting stream: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/streams")
+async def list_streams():
+    return [stream.health() for stream in stream_manager.streams.values()]
+
+@app.get("/streams/{video_id}")
+async def get_stream_health(video_id: int):
+    stream = stream_manager.get(video_id)
+    if not stream:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    return stream.health()
+
+@app.delete("/streams/{video_id}")
+async def stop_stream(video_id: int):
+    try:
+        if not stream_manager.get(video_id):
+            raise HTTPException(status_code=404, detail="Stream not found")
+        stream = await stream_manager.stop(video_id)
+        return stream.health()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error stopping stream: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/metrics")
+async def get_job_metrics():
+    try:
+        return await scheduler.metrics()
+    except Exception as e:
+        logger.error(f"Error fetching job metrics: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text format; the queue length is read from the job table per scrape
+    try:
+        job_metrics = await scheduler.metrics()
+        JOBS_QUEUED.set(job_metrics["queue_length"])
+        JOBS_PROCESSING.set(job_metrics["processing"])
+        return Response(metrics_registry.render(), media_type=CONTENT_TYPE)
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/models")
+async def get_models():
+    try:
+        return {**registry.stats(), "streams": stream_models.stats()}
+    except Exception as e:
+        logger.error(f"Error fetching model stats: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+DETECTION_COLUMNS = (
+    models.Detection.id,
+    models.Detection.frame_number,
+    models.Detection.confidence,
+    models.Detection.x,
+    models.Detection.y,
+    models.Detection.width,
+    models.Detection.height,
+    models.Detection.track_id,
+    models.Detection.timestamp,
+)
+
+def encode_cursor(frame_number: int, detection_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{frame_number}:{detection_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        frame_number, detection_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(frame_number), int(detection_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def detection_query(video_id: int, start_frame: Optional[int], end_frame: Optional[int],
+                    min_confidence: Optional[float], track_id: Optional[int] = None):
+    # Served by the (video_id, frame_number) index, ordered for keyset pagination
+    stmt = (
+        select(*DETECTION_COLUMNS)
+        .where(models.Detection.video_id == video_id)
+        .order_by(models.Detection.frame_number, models.Detection.id)
+    )
+    if start_frame is not None:
+        stmt = stmt.where(models.Detection.frame_number >= start_frame)
+    if end_frame is not None:
+        stmt = stmt.where(models.Detection.frame_number < end_frame)
+    if min_confidence is not None:
+        stmt = stmt.where(models.Detection.confidence >= min_confidence)
+    if track_id is not None:
+        # Served by the (video_id, track_id, frame_number) index instead
+        stmt = stmt.where(models.Detection.track_id == track_id)
+    return stmt
+
+def detection_to_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "frame_number": row.frame_number,
+        "confidence": row.confidence,
+        "x": row.x,
+        "y": row.y,
+        "width": row.width,
+        "height": row.height,
+        "track_id": row.track_id,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None
+    }
+
+async def ensure_video_exists(session: AsyncSession, video_id: int):
+    stmt = select(models.Video.id).where(models.Video.id == video_id)
+    result = await session.execute(stmt)
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+
 @app.get("/detections/{video_id}")
-async def get_detections(video_id: int):
+async def get_detections(video_id: int, cursor: Optional[str] = None, limit: int = 1000,
+                         start_frame: Optional[int] = None, end_frame: Optional[int] = None,
+                         min_confidence: Optional[float] = None, track_id: Optional[int] = None):
     try:
+        limit = min(max(limit, 1), 10000)
         async with AsyncSession(engine) as session:
             # Check if video exists
-            stmt = select(models.Video).where(models.Video.id == video_id)
-            result = await session.execute(stmt)
-            video = result.scalar_one_or_none()
-            
-            if not video:
-                raise HTTPException(status_code=404, detail="Video not found")
+            await ensure_video_exists(session, video_id)
             
-            # Get detections
-            stmt = select(models.Detection).where(models.Detection.video_id == video_id)
-            result = await session.execute(stmt)
-            detections = result.scalars().all()
+            # Get one page of detections after the cursor
+            stmt = detection_query(video_id, start_frame, end_frame, min_confidence, track_id)
+            if cursor:
+                stmt = stmt.where(
+                    tuple_(models.Detection.frame_number, models.Detection.id) > decode_cursor(cursor)
+                )
+            result = await session.execute(stmt.limit(limit + 1))
+            rows = result.all()
             
-            if not detections:
-                raise HTTPException(status_code=404, detail="No detections found for this video")
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(rows[-1].frame_number, rows[-1].id)
             
-            return [{
-                "id": d.id,
-                "frame_number": d.frame_number,
-                "confidence": d.confidence,
-                "x": d.x,
-                "y": d.y,
-                "width": d.width,
-                "height": d.height,
-                "timestamp": d.timestamp.isoformat()
-            } for d in detections]
+            return {
+                "detections": [detection_to_dict(row) for row in rows],
+                "next_cursor": next_cursor
+            }
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error fetching detections: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/detections/{video_id}/stream")
+async def stream_detections(video_id: int, start_frame: Optional[int] = None, end_frame: Optional[int] = None,
+                            min_confidence: Optional[float] = None, track_id: Optional[int] = None):
+    try:
+        async with AsyncSession(engine) as session:
+            await ensure_video_exists(session, video_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming detections: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def generate():
+        # Rows come from a server-side cursor in chunks instead of one big list
+        stmt = detection_query(video_id, start_frame, end_frame, min_confidence, track_id)
+        async with AsyncSession(engine) as session:
+            result = await session.stream(stmt.execution_options(yield_per=DETECTION_STREAM_CHUNK))
+            async for rows in result.partitions():
+                yield "".join(json.dumps(detection_to_dict(row)) + "\n" for row in rows)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+def track_to_dict(track) -> dict:
+    return {
+        "track_id": track.track_id,
+        "first_frame": track.first_frame,
+        "last_frame": track.last_frame,
+        "frame_count": track.frame_count,
+        "x_min": track.x_min,
+        "y_min": track.y_min,
+        "x_max": track.x_max,
+        "y_max": track.y_max,
+        "mean_confidence": track.mean_confidence
+    }
+
+@app.get("/video/{video_id}/tracks")
+async def get_tracks(video_id: int, min_frames: int = 1):
+    try:
+        async with AsyncSession(engine) as session:
+            await ensure_video_exists(session, video_id)
+
+            # One summary row per person instead of a scan over the detections
+            stmt = (
+                select(models.Track)
+                .where(models.Track.video_id == video_id, models.Track.frame_count >= min_frames)
+                .order_by(models.Track.track_id)
+            )
+            result = await session.execute(stmt)
+            tracks = [track_to_dict(track) for track in result.scalars()]
+            return {"count": len(tracks), "tracks": tracks}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching tracks: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/video/{video_id}/tracks/{track_id}")
+async def get_track(video_id: int, track_id: int):
+    try:
+        async with AsyncSession(engine) as session:
+            stmt = select(models.Track).where(models.Track.video_id == video_id, models.Track.track_id == track_id)
+            result = await session.execute(stmt)
+            track = result.scalar_one_or_none()
+            if not track:
+                raise HTTPException(status_code=404, detail="Track not found")
+
+            # The person's box in every frame they were seen in
+            stmt = (
+                select(models.Detection.frame_number, models.Detection.x, models.Detection.y,
+                       models.Detection.width, models.Detection.height, models.Detection.confidence)
+                .where(models.Detection.video_id == video_id, models.Detection.track_id == track_id)
+                .order_by(models.Detection.frame_number)
+            )
+            result = await session.execute(stmt)
+            return {
+                **track_to_dict(track),
+                "boxes": [
+                    {
+                        "frame_number": row.frame_number,
+                        "x": row.x,
+                        "y": row.y,
+                        "width": row.width,
+                        "height": row.height,
+                        "confidence": row.confidence
+                    }
+                    for row in result
+                ]
+            }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching track: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/detections/{video_id}/columnar")
+async def get_columnar_detections(video_id: int, format: str = "json", start_frame: Optional[int] = None,
+                                  end_frame: Optional[int] = None, offset: int = 0, limit: int = 10000):
+    try:
+        if format not in ("json", "npy", "arrow"):
+            raise HTTPException(status_code=400, detail="format must be one of json, npy, arrow")
+        if not detection_store.has_detections(video_id):
+            raise HTTPException(status_code=404, detail="No columnar detections stored for this video")
+
+        arrays = await asyncio.to_thread(detection_store.load_detections, video_id)
+        columns = detection_store.query_range(arrays, start_frame, end_frame)
+
+        if format == "npy":
+            content = await asyncio.to_thread(detection_store.to_npy, columns)
+            return Response(content=content, media_type="application/octet-stream")
+        if format == "arrow":
+            if detection_store.pa is None:
+                raise HTTPException(status_code=501, detail="Arrow output requires pyarrow")
+            content = await asyncio.to_thread(detection_store.to_arrow, columns)
+            return Response(content=content, media_type="application/vnd.apache.arrow.stream")
+
+        # Paginated column-oriented JSON
+        total = len(columns["frame_number"])
+        offset = max(offset, 0)
+        limit = min(max(limit, 1), 100000)
+        page = {name: values[offset:offset + limit].tolist() for name, values in columns.items()}
+        return {
+            "video_id": video_id,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next_offset": offset + limit if offset + limit < total else None,
+            "columns": page
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching columnar detections: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/video/{video_id}")
 async def delete_video(video_id: int):
     try:
@@ -230,17 +650,30 @@ async def delete_video(video_id: int):
             if not video:
                 raise HTTPException(status_code=404, detail="Video not found")
             
-            # Delete video file
-            if os.path.exists(video.filepath):
+            # Stop the stream if the video is a live stream
+            if stream_manager.get(video_id):
+                await stream_manager.stop(video_id)
+                stream_manager.forget(video_id)
+
+            # Delete video file; stream sources are not ours to delete
+            if uploads.is_upload_path(video.filepath) and os.path.exists(video.filepath):
                 os.remove(video.filepath)
             
             # Delete processed video file if exists
             if video.processed_filepath and os.path.exists(video.processed_filepath):
                 os.remove(video.processed_filepath)
+
+            # Delete columnar detections and on-demand renders if stored
+            detection_store.delete_detections(video_id)
+            render_cache.delete(video_id)
             
-            # Delete all detections first
+            # Delete all detections and processing jobs first
             stmt = delete(models.Detection).where(models.Detection.video_id == video_id)
             await session.execute(stmt)
+            stmt = delete(models.ProcessingJob).where(models.ProcessingJob.video_id == video_id)
+            await session.execute(stmt)
+            stmt = delete(models.Track).where(models.Track.video_id == video_id)
+            await session.execute(stmt)
             
             # Delete video
             await session.delete(video)
@@ -254,7 +687,7 @@ async def delete_video(video_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/video/{video_id}/processed")
-async def get_processed_video(video_id: int):
+async def get_processed_video(video_id: int, download: bool = False):
     try:
         async with AsyncSession(engine) as session:
             # Check if video exists
@@ -264,35 +697,88 @@ async def get_processed_video(video_id: int):
             
             if not video:
                 raise HTTPException(status_code=404, detail="Video not found")
-            
-            if not video.processed_filepath:
+
+        if not video.processed_filepath:
+            # Detections-only processing: render from the stored detections on first request
+            if video.status != "completed":
                 raise HTTPException(status_code=404, detail="Processed video not found")
-            
+            processed_path = render_cache.get(video_id)
+            if processed_path is None:
+                task = await render_cache.render(video_id, video.filepath)
+                if task.progressive:
+                    # Fragmented MP4 can be played while the rest is being encoded
+                    return StreamingResponse(
+                        render_cache.stream(task),
+                        media_type="video/mp4",
+                        headers={"Cache-Control": "no-cache"}
+                    )
+                try:
+                    processed_path = await render_cache.wait(task)
+                except RenderDiscarded:
+                    # The video is being processed again
+                    raise HTTPException(status_code=404, detail="Processed video not found")
+        else:
             # Convert path to use forward slashes
             processed_path = video.processed_filepath.replace("\\", "/")
-            
-            if not os.path.exists(processed_path):
-                logger.error(f"Processed video file not found at path: {processed_path}")
-                raise HTTPException(status_code=404, detail="Processed video file not found")
-            
-            # Return the processed video file with proper headers
-            return FileResponse(
-                processed_path,
-                media_type="video/mp4",
-                filename=f"processed_{video.filename}",
-                headers={
-                    "Content-Disposition": f'attachment; filename="processed_{video.filename}"',
-                    "Accept-Ranges": "bytes",
-                    "Content-Length": str(os.path.getsize(processed_path)),
-                    "Cache-Control": "no-cache"
-                }
-            )
+        
+        if not os.path.exists(processed_path):
+            logger.error(f"Processed video file not found at path: {processed_path}")
+            raise HTTPException(status_code=404, detail="Processed video file not found")
+        
+        # The same URL gets new bytes when the video is processed or rendered again,
+        # so players cache it but revalidate with the ETag before reusing it
+        return RangeFileResponse(
+            processed_path,
+            media_type="video/mp4",
+            filename=f"processed_{video.filename}",
+            download=download
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error serving processed video: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/video/{video_id}/original")
+async def get_original_video(video_id: int, download: bool = False):
+    try:
+        async with AsyncSession(engine) as session:
+            video = await session.get(models.Video, video_id)
+            if not video:
+                raise HTTPException(status_code=404, detail="Video not found")
+
+        # Stream videos point at their source; only files in upload storage are served
+        if not video.filepath or not uploads.is_upload_path(video.filepath):
+            raise HTTPException(status_code=404, detail="Video has no uploaded file")
+        original_path = video.filepath.replace("\\", "/")
+        if not os.path.exists(original_path):
+            logger.error(f"Uploaded video file not found at path: {original_path}")
+            raise HTTPException(status_code=404, detail="Uploaded video file not found")
+
+        # Uploads are stored by content hash, so a path always holds the same bytes
+        return RangeFileResponse(original_path, filename=video.filename, immutable=True, download=download)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error serving uploaded video: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cache/metrics")
+async def get_result_cache_metrics():
+    try:
+        return await asyncio.to_thread(result_cache.stats)
+    except Exception as e:
+        logger.error(f"Error fetching result cache metrics: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/renders/metrics")
+async def get_render_metrics():
+    try:
+        return await asyncio.to_thread(render_cache.stats)
+    except Exception as e:
+        logger.error(f"Error fetching render metrics: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
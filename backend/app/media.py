@@ -0,0 +1,246 @@
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from starlette.datastructures import Headers
+from starlette.responses import Response
+import anyio
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import stat
+import struct
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from disk per body message when serving a file
+FILE_CHUNK_SIZE = 1024 * 1024
+# Uploads are stored by content hash, so their URL always serves the same bytes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# MP4 boxes that contain the sample tables holding chunk offsets
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _boxes(f, start: int, end: int):
+    # (type, offset, size, header size) of the MP4 boxes between start and end
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ValueError(f"Malformed MP4 box {kind!r} at {offset}")
+        yield kind, offset, size, header
+        offset += size
+
+def _shift_chunk_offsets(moov: bytearray, start: int, end: int, first: int, last: int, shift: int):
+    # Adds shift to every stco/co64 chunk offset in [first, last) inside moov[start:end]
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", moov, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", moov, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            raise ValueError(f"Malformed MP4 box {kind!r} in moov")
+
+        if kind in CONTAINER_BOXES:
+            _shift_chunk_offsets(moov, offset + header, offset + size, first, last, shift)
+        elif kind in (b"stco", b"co64"):
+            # Full box: version and flags, entry count, then the offsets
+            entry_format = ">I" if kind == b"stco" else ">Q"
+            entry_size = struct.calcsize(entry_format)
+            count = struct.unpack_from(">I", moov, offset + header + 4)[0]
+            entries = offset + header + 8
+            for i in range(count):
+                position = entries + i * entry_size
+                value = struct.unpack_from(entry_format, moov, position)[0]
+                if first <= value < last:
+                    value += shift
+                    if kind == b"stco" and value > 0xFFFFFFFF:
+                        raise OverflowError("Chunk offset no longer fits in stco")
+                    struct.pack_into(entry_format, moov, position, value)
+        offset += size
+
+def faststart(path: str) -> bool:
+    """Moves the moov box of an MP4 in front of its media data, in place.
+
+    Encoders write moov last because its tables are only known at the end,
+    so players have to fetch the end of the file before they can start. With
+    moov first, playback and seeking start after the first range request.
+    Returns False when the file is already laid out that way.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        boxes = list(_boxes(f, 0, size))
+        moov = next((box for box in boxes if box[0] == b"moov"), None)
+        mdat = next((box for box in boxes if box[0] == b"mdat"), None)
+        if moov is None or mdat is None or moov[1] < mdat[1]:
+            return False
+
+        _, moov_offset, moov_size, moov_header = moov
+        f.seek(moov_offset)
+        moov_data = bytearray(f.read(moov_size))
+        # Everything from the first mdat up to the old moov moves down by moov's size
+        try:
+            _shift_chunk_offsets(moov_data, moov_header, moov_size, mdat[1], moov_offset, moov_size)
+        except OverflowError:
+            logger.warning(f"Not moving moov of {path}: offsets would need 64 bits")
+            return False
+
+        temp_path = f"{path}.faststart"
+        try:
+            with open(temp_path, "wb") as out:
+                f.seek(0)
+                _copy_range(f, out, mdat[1])
+                out.write(moov_data)
+                f.seek(mdat[1])
+                _copy_range(f, out, moov_offset - mdat[1])
+                f.seek(moov_offset + moov_size)
+                shutil.copyfileobj(f, out, FILE_CHUNK_SIZE)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    os.replace(temp_path, path)
+    return True
+
+def _copy_range(source, target, length: int):
+    while length > 0:
+        chunk = source.read(min(FILE_CHUNK_SIZE, length))
+        if not chunk:
+            raise ValueError("Unexpected end of file")
+        target.write(chunk)
+        length -= len(chunk)
+
+def parse_range(header: str, size: int):
+    """(start, end) of a single byte range, end inclusive.
+
+    Returns None for headers that should be ignored (multiple ranges or
+    invalid syntax such as a last byte before the first, answered with the
+    full file) and raises ValueError when the range starts past the end of
+    the file.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, min(int(last), size - 1) if last else size - 1
+
+class RangeFileResponse(Response):
+    """File response with byte ranges and conditional requests.
+
+    Range requests get 206 with the requested slice, If-None-Match and
+    If-Modified-Since get 304 when the file is unchanged, and If-Range drops
+    the range when it is not. The body is read from disk and sent in
+    FILE_CHUNK_SIZE messages, only for the requested slice; uvicorn and
+    hypercorn have no zero-copy file sending to hand it to.
+    """
+
+    def __init__(self, path: str, media_type: str = None, filename: str = None,
+                 immutable: bool = False, download: bool = False, headers: dict = None):
+        self.path = path
+        self.status_code = 200
+        self.media_type = media_type or mimetypes.guess_type(filename or path)[0] or "application/octet-stream"
+        self.background = None
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers.setdefault("cache-control", IMMUTABLE_CACHE_CONTROL if immutable else "no-cache")
+        if filename is not None:
+            disposition = "attachment" if download else "inline"
+            self.headers.setdefault("content-disposition", f"{disposition}; filename*=utf-8''{quote(filename)}")
+
+    def _not_modified(self, request_headers: Headers, etag: str, mtime: int) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range_applies(self, request_headers: Headers, etag: str, last_modified: str) -> bool:
+        # If-Range: only honour the range when the client's copy is current
+        if_range = request_headers.get("if-range")
+        return if_range is None or if_range.strip() in (etag, last_modified)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        except FileNotFoundError:
+            raise RuntimeError(f"File at path {self.path} does not exist.")
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"File at path {self.path} is not a file.")
+
+        size = stat_result.st_size
+        mtime = int(stat_result.st_mtime)
+        etag = f'"{size:x}-{stat_result.st_mtime_ns:x}"'
+        last_modified = formatdate(mtime, usegmt=True)
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = last_modified
+
+        request_headers = Headers(scope=scope)
+        status_code, start, end = 200, 0, size - 1
+        if self._not_modified(request_headers, etag, mtime):
+            status_code = 304
+        elif "range" in request_headers and self._range_applies(request_headers, etag, last_modified):
+            try:
+                byte_range = parse_range(request_headers["range"], size)
+            except ValueError:
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                await send({"type": "http.response.start", "status": 416, "headers": self.raw_headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            if byte_range is not None:
+                status_code, (start, end) = 206, byte_range
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        length = max(end - start + 1, 0)
+        if status_code == 304:
+            del self.headers["content-type"]
+        else:
+            self.headers["content-length"] = str(length)
+        await send({"type": "http.response.start", "status": status_code, "headers": self.raw_headers})
+
+        if status_code == 304 or scope.get("method") == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = await f.read(min(FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
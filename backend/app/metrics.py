@@ -0,0 +1,339 @@
+import bisect
+import math
+import os
+import threading
+import time
+
+# Set to false to turn every metric update into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Upper bounds in seconds; the +Inf bucket is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+# Starlette appends the charset to text types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _CounterValue:
+    def __init__(self, registry):
+        self._registry = registry
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def drain(self):
+        with self._lock:
+            value, self.value = self.value, 0.0
+        return value
+
+    def merge(self, value):
+        with self._lock:
+            self.value += value
+
+class _GaugeValue:
+    def __init__(self, registry):
+        self._registry = registry
+        self._lock = threading.Lock()
+        self._value = 0.0
+        self._function = None
+
+    @property
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._value
+
+    def set(self, value: float):
+        if self._registry.enabled:
+            self._value = value
+
+    def inc(self, amount: float = 1.0):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        # Read at scrape time instead of being kept up to date
+        self._function = function
+
+class _HistogramValue:
+    def __init__(self, registry, buckets):
+        self._registry = registry
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        if not self._registry.enabled:
+            return
+        # Buckets are stored per bound and made cumulative when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def drain(self):
+        with self._lock:
+            state = (self.counts, self.sum)
+            self.counts, self.sum = [0] * (len(self.buckets) + 1), 0.0
+        return state
+
+    def merge(self, state):
+        counts, total = state
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, counts)]
+            self.sum += total
+
+class _Timer:
+    def __init__(self, histogram: _HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+class Metric:
+    """A named metric with one value per combination of label values.
+
+    Metrics without labels are updated directly (counter.inc()); labelled ones
+    through the value returned by labels(). Values are looked up in a dict
+    and updated under their own lock, so the hot path costs well under a
+    microsecond.
+    """
+
+    kind = None
+
+    def __init__(self, registry, name: str, documentation: str, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabelled metrics expose their only value's methods directly
+            default = self.labels()
+            for method in ("inc", "dec", "set", "set_function", "observe", "time"):
+                if hasattr(default, method):
+                    setattr(self, method, getattr(default, method))
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                value = self._values.setdefault(values, self._new_value())
+        return value
+
+    def samples(self) -> list:
+        # (name suffix, label values, extra label, value) to render
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_value(self):
+        return _CounterValue(self.registry)
+
+    def samples(self) -> list:
+        return [("", values, "", value.value) for values, value in list(self._values.items())]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_value(self):
+        return _GaugeValue(self.registry)
+
+    def samples(self) -> list:
+        return [("", values, "", value.value) for values, value in list(self._values.items())]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.registry, self.buckets)
+
+    def samples(self) -> list:
+        samples = []
+        for values, value in list(self._values.items()):
+            with value._lock:
+                counts, total = list(value.counts), value.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(("_bucket", values, f'le="{_format_value(bound)}"', cumulative))
+            samples.append(("_sum", values, "", total))
+            samples.append(("_count", values, "", cumulative))
+        return samples
+
+class MetricsRegistry:
+    """Process-wide set of metrics, rendered in the Prometheus text format."""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> dict:
+        """Counter and histogram updates since the last drain, for another process to merge.
+
+        Worker processes (parallel segments) record into their own registry;
+        their parent merges what they return so /metrics sees their frames too.
+        Gauges describe the worker itself and are left out.
+        """
+        state = {}
+        for name, metric in list(self.metrics.items()):
+            if isinstance(metric, (Counter, Histogram)):
+                state[name] = {values: value.drain() for values, value in list(metric._values.items())}
+        return state
+
+    def merge(self, state: dict):
+        for name, values in state.items():
+            metric = self.metrics.get(name)
+            if metric is None:
+                continue
+            for label_values, value in values.items():
+                metric.labels(*label_values).merge(value)
+
+registry = MetricsRegistry()
+
+# HTTP
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by handler and status code", ("method", "handler", "status")
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time until the response is fully sent", ("method", "handler")
+)
+
+# Uploads
+UPLOADS = registry.counter("uploads_total", "Completed uploads by outcome", ("result",))
+UPLOAD_BYTES = registry.counter("upload_bytes_total", "Video bytes received from clients")
+
+# Jobs
+JOBS_QUEUED = registry.gauge("jobs_queued", "Jobs waiting to be processed")
+JOBS_ACTIVE = registry.gauge("jobs_active", "Jobs being processed by this process")
+JOBS_PROCESSING = registry.gauge("jobs_processing", "Jobs being processed by any worker")
+JOBS_FINISHED = registry.counter("jobs_finished_total", "Finished jobs by status", ("status",))
+JOBS_RECLAIMED = registry.counter("jobs_reclaimed_total", "Jobs taken back from workers whose lease expired")
+JOB_WAIT_SECONDS = registry.histogram("job_wait_seconds", "Time from enqueue to start", buckets=JOB_BUCKETS)
+JOB_SECONDS = registry.histogram("job_duration_seconds", "Time from start to finish", buckets=JOB_BUCKETS)
+
+# Processing pipeline
+PIPELINE_FRAMES = registry.counter("pipeline_frames_total", "Frames through the processing pipelines")
+PIPELINE_STAGE_SECONDS = registry.histogram(
+    "pipeline_stage_seconds", "Time per frame spent in each pipeline stage", ("stage",)
+)
+PIPELINE_QUEUED_FRAMES = registry.gauge(
+    "pipeline_queued_frames", "Frames waiting between pipeline stages", ("queue",)
+)
+INFERENCE_SECONDS = registry.histogram("inference_batch_seconds", "Model inference latency per batch")
+
+# Database writes
+DETECTION_ROWS = registry.counter("detection_rows_written_total", "Detection rows written to the database")
+DETECTION_FLUSH_LATENCY = registry.histogram(
+    "detection_flush_seconds", "Latency of one bulk detection insert"
+)
+
+# Live streams
+STREAMS_ACTIVE = registry.gauge("streams_active", "Live streams being processed")
+
+class MetricsMiddleware:
+    """Counts HTTP requests and their latency per route handler.
+
+    Plain ASGI so streaming responses are timed until their last byte. The
+    handler label is the endpoint function's name, which keeps the number of
+    series bounded whatever the request paths are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router adds the matched endpoint to the scope
+            handler = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            HTTP_REQUESTS.labels(scope["method"], handler, status).inc()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], handler).observe(time.perf_counter() - started)
@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+from .inference_backends import ExportedDetector, load_detector, INFERENCE_BACKEND, INFERENCE_INT8
+from .pipeline import detect_people
+import numpy as np
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+# YOLOv8 size used when a job doesn't ask for one
+MODEL_VARIANT = os.getenv("MODEL_VARIANT", "n")
+# Variants loaded and warmed up at startup, comma separated
+PRELOAD_MODELS = [v.strip() for v in os.getenv("PRELOAD_MODELS", MODEL_VARIANT).split(",") if v.strip()]
+# Instances kept per variant; one per processing worker is enough to never wait
+MODEL_POOL_SIZE = max(1, int(os.getenv("MODEL_POOL_SIZE", os.getenv("PROCESSING_WORKERS", "2"))))
+# Seconds a video or stream waits for a free instance before it fails
+MODEL_ACQUIRE_TIMEOUT = float(os.getenv("MODEL_ACQUIRE_TIMEOUT", "600"))
+# Side of the blank frame used to warm up a freshly loaded model
+WARMUP_SIZE = 640
+
+VARIANTS = ("n", "s", "m", "l", "x")
+
+class ModelBusyError(Exception):
+    pass
+
+def weights_path(variant: str) -> str:
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown model variant {variant!r}")
+    # Prefer weights shipped in MODEL_DIR; otherwise ultralytics downloads them
+    local_path = os.path.join(MODEL_DIR, f"yolov8{variant}.pt")
+    return local_path if os.path.exists(local_path) else f"yolov8{variant}.pt"
+
+def warm_up(model):
+    # The first call pays for fusing layers and allocating buffers
+    detect_people(model, [np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)])
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _parameter_bytes(model):
+    if isinstance(model, ExportedDetector):
+        # Exported weights are loaded as they are on disk; OpenVINO keeps them in the .bin
+        path = model.path
+        if path.endswith(".xml"):
+            path = path[:-len(".xml")] + ".bin"
+        return os.path.getsize(path)
+    try:
+        return sum(p.numel() * p.element_size() for p in model.model.parameters())
+    except AttributeError:
+        return None
+
+class ModelPool:
+    """Bounded pool of warmed-up detector instances for one weights file.
+
+    A model instance is not safe to call from two threads at once, so every
+    processing worker checks out its own instance for the length of a video.
+    """
+
+    def __init__(self, variant: str, size: int = MODEL_POOL_SIZE,
+                 backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8):
+        self.variant = variant
+        self.weights = weights_path(variant)
+        self.backend = backend
+        self.int8 = int8
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.instances = 0
+        self.in_use = 0
+        self.load_seconds = []
+        self.warmup_seconds = []
+        self.parameter_bytes = None
+        self.rss_bytes = []
+
+    def _load(self):
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        model = load_detector(self.weights, self.backend, self.int8)
+        loaded = time.perf_counter()
+        warm_up(model)
+        warmed = time.perf_counter()
+        rss_after = _rss_bytes()
+
+        self.load_seconds.append(loaded - started)
+        self.warmup_seconds.append(warmed - loaded)
+        self.parameter_bytes = _parameter_bytes(model)
+        if rss_before is not None and rss_after is not None:
+            self.rss_bytes.append(max(rss_after - rss_before, 0))
+        logger.info(f"Loaded {self.weights} ({self.backend}) in {loaded - started:.2f}s, warm-up {warmed - loaded:.2f}s")
+        return model
+
+    def preload(self):
+        with self.lock:
+            if self.instances:
+                return
+            self.instances += 1
+        try:
+            self.idle.put(self._load())
+        except Exception:
+            with self.lock:
+                self.instances -= 1
+            raise
+
+    @contextmanager
+    def acquire(self, timeout: float = MODEL_ACQUIRE_TIMEOUT):
+        try:
+            model = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_load = self.instances < self.size
+                if can_load:
+                    self.instances += 1
+            if can_load:
+                try:
+                    model = self._load()
+                except Exception:
+                    with self.lock:
+                        self.instances -= 1
+                    raise
+            else:
+                # Every instance is busy: wait for one to be returned
+                try:
+                    model = self.idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise ModelBusyError(f"No {self.weights} instance was free within {timeout:.0f}s") from None
+
+        with self.lock:
+            self.in_use += 1
+        try:
+            yield model
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self.idle.put(model)
+
+    def stats(self) -> dict:
+        with self.lock:
+            instances, in_use = self.instances, self.in_use
+        return {
+            "weights": self.weights,
+            "backend": self.backend,
+            "int8": self.int8,
+            "instances": instances,
+            "in_use": in_use,
+            "max_instances": self.size,
+            "load_seconds": round(max(self.load_seconds), 3) if self.load_seconds else None,
+            "warmup_seconds": round(max(self.warmup_seconds), 3) if self.warmup_seconds else None,
+            "parameter_mb": round(self.parameter_bytes / 2**20, 1) if self.parameter_bytes else None,
+            "rss_mb_per_instance": (
+                round(sum(self.rss_bytes) / len(self.rss_bytes) / 2**20, 1) if self.rss_bytes else None
+            ),
+        }
+
+class ModelRegistry:
+    """One ModelPool per variant, created on first use."""
+
+    def __init__(self, pool_size: int = MODEL_POOL_SIZE):
+        self.pool_size = pool_size
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def get_pool(self, variant: str = None) -> ModelPool:
+        variant = variant or MODEL_VARIANT
+        with self.lock:
+            pool = self.pools.get(variant)
+            if pool is None:
+                pool = self.pools[variant] = ModelPool(variant, self.pool_size)
+            return pool
+
+    def acquire(self, variant: str = None, timeout: float = MODEL_ACQUIRE_TIMEOUT):
+        return self.get_pool(variant).acquire(timeout)
+
+    def preload(self, variants=None):
+        for variant in variants or PRELOAD_MODELS:
+            self.get_pool(variant).preload()
+
+    def stats(self) -> dict:
+        with self.lock:
+            pools = dict(self.pools)
+        return {
+            "default_variant": MODEL_VARIANT,
+            "variants": {variant: pool.stats() for variant, pool in pools.items()},
+        }
+
+registry = ModelRegistry()
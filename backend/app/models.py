@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
 from .database import Base
 from datetime import datetime
@@ -10,14 +10,33 @@ class Video(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
     filepath = Column(String)  # Store path to video file
+    content_hash = Column(String, index=True, nullable=True)  # SHA-256 of the uploaded file
+    file_size = Column(BigInteger, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     processed_filepath = Column(String, nullable=True)
+
+    # Processing summary, kept up to date by the job scheduler and the processor
+    status = Column(String, default="pending", index=True)  # pending, processing, completed, failed
+    frame_count = Column(Integer, nullable=True)
+    processed_frames = Column(Integer, default=0)
+    detection_count = Column(Integer, default=0)
+    processing_seconds = Column(Float, nullable=True)
     
     # Relationship with detections
     detections = relationship("Detection", back_populates="video", cascade="all, delete-orphan")
 
+    # Relationship with processing jobs
+    jobs = relationship("ProcessingJob", back_populates="video", cascade="all, delete-orphan")
+
+    # Relationship with person tracks
+    tracks = relationship("Track", back_populates="video", cascade="all, delete-orphan")
+
 class Detection(Base):
     __tablename__ = "detections"
+    __table_args__ = (
+        Index("ix_detections_video_id_frame_number", "video_id", "frame_number"),
+        Index("ix_detections_video_id_track_id_frame_number", "video_id", "track_id", "frame_number"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     video_id = Column(Integer, ForeignKey("videos.id"))
@@ -27,7 +46,53 @@ class Detection(Base):
     width = Column(Float)
     height = Column(Float)
     confidence = Column(Float)
+    track_id = Column(Integer, nullable=True)  # Person ID within the video, see Track
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationship with video
-    video = relationship("Video", back_populates="detections")
\ No newline at end of file
+    video = relationship("Video", back_populates="detections")
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey("videos.id"), index=True)
+    status = Column(String, default="queued", index=True)  # queued, processing, completed, failed
+    priority = Column(Integer, default=0)
+    progress = Column(Float, default=0)
+    attempts = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    options = Column(JSON, nullable=True)  # ProcessingOptions for this job
+    stats = Column(JSON, nullable=True)  # Latest pipeline stats
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Worker holding the job and until when; expired leases are reclaimed
+    worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+
+    # Relationship with video
+    video = relationship("Video", back_populates="jobs")
+
+class Track(Base):
+    """Summary of one tracked person, written when a video finishes processing."""
+    __tablename__ = "tracks"
+    __table_args__ = (
+        Index("ix_tracks_video_id_track_id", "video_id", "track_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey("videos.id"))
+    track_id = Column(Integer)
+    first_frame = Column(Integer)
+    last_frame = Column(Integer)
+    frame_count = Column(Integer)
+    # Bounding box of everywhere the person was seen
+    x_min = Column(Float)
+    y_min = Column(Float)
+    x_max = Column(Float)
+    y_max = Column(Float)
+    mean_confidence = Column(Float)
+
+    # Relationship with video
+    video = relationship("Video", back_populates="tracks")
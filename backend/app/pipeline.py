@@ -0,0 +1,375 @@
+import cv2
+import numpy as np
+from .sampling import interpolate_detections
+from .inference_backends import ExportedDetector
+from .metrics import PIPELINE_FRAMES, PIPELINE_STAGE_SECONDS, PIPELINE_QUEUED_FRAMES, INFERENCE_SECONDS
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Frames buffered between two pipeline stages; keeps memory flat on long videos
+PIPELINE_QUEUE_SIZE = max(1, int(os.getenv("PIPELINE_QUEUE_SIZE", "16")))
+# Minimum interval between two progress callbacks
+PROGRESS_INTERVAL = 0.5
+
+BOX_COLOR = (0, 255, 0)
+
+_END = object()
+
+PERSON_CLASS = 0  # Class ID for person in the COCO dataset
+
+def result_to_array(result):
+    # boxes.data is (N, 6) x1, y1, x2, y2, confidence, class: one device transfer per frame
+    return result.boxes.data.cpu().numpy()[:, :5].astype(np.float32, copy=False)
+
+def detect_people(model, frames: list, imgsz: int = None) -> list:
+    # Returns one (N, 5) array of x1, y1, x2, y2, confidence per frame.
+    # imgsz is the inference resolution; boxes are always in input frame pixels
+    if isinstance(model, ExportedDetector):
+        return model.detect(frames, imgsz)
+    # Other classes are dropped by the model before NMS instead of afterwards in Python
+    options = {"imgsz": imgsz} if imgsz else {}
+    results = model(frames, classes=[PERSON_CLASS], verbose=False, **options)
+    return [result_to_array(result) for result in results]
+
+def detection_rows(video_id: int, frame_numbers, boxes, track_ids=None) -> list:
+    # (video_id, frame_number, x, y, width, height, confidence, track_id) tuples from
+    # one frame number (and track ID) per row of the (N, 5) x1, y1, x2, y2, confidence array
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+    x1, y1, x2, y2, confidence = boxes.T
+    track_ids = itertools.repeat(None, len(boxes)) if track_ids is None else np.asarray(track_ids).tolist()
+    return list(zip(
+        itertools.repeat(video_id, len(boxes)),
+        np.asarray(frame_numbers).tolist(),
+        x1.tolist(),
+        y1.tolist(),
+        (x2 - x1).tolist(),
+        (y2 - y1).tolist(),
+        confidence.tolist(),
+        track_ids
+    ))
+
+def draw_detections(frame, boxes):
+    if not len(boxes):
+        return
+    # All rectangles of the frame in one call, as closed 4-point polylines
+    x1, y1, x2, y2 = np.asarray(boxes)[:, :4].astype(np.int32).T
+    corners = np.stack([
+        np.stack([x1, y1], axis=1),
+        np.stack([x2, y1], axis=1),
+        np.stack([x2, y2], axis=1),
+        np.stack([x1, y2], axis=1),
+    ], axis=1)
+    cv2.polylines(frame, list(corners), True, BOX_COLOR, 2)
+
+def open_video_writer(path: str, fps: float, size):
+    # H.264 plays in browsers; fall back to MPEG-4 where OpenCV has no H.264 encoder
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'avc1'), fps, size)
+    if not out.isOpened():
+        logger.warning("H.264 encoder unavailable, writing MPEG-4 video instead")
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    return out
+
+class StageStats:
+    def __init__(self, histogram=None):
+        self.frames = 0
+        self.seconds = 0.0
+        self.histogram = histogram
+
+    def add(self, seconds: float, frames: int = 1):
+        self.seconds += seconds
+        self.frames += frames
+        if self.histogram is not None:
+            self.histogram.observe(seconds / frames)
+
+    def as_dict(self, elapsed: float) -> dict:
+        return {
+            "frames": self.frames,
+            "seconds": round(self.seconds, 3),
+            "ms_per_frame": round(self.seconds / self.frames * 1000, 3) if self.frames else 0.0,
+            "busy_pct": round(self.seconds / elapsed * 100, 1) if elapsed > 0 else 0.0,
+        }
+
+class QueueStats:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.max_depth = 0
+        self.total_depth = 0
+        self.samples = 0
+
+    def sample(self, depth: int):
+        self.max_depth = max(self.max_depth, depth)
+        self.total_depth += depth
+        self.samples += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "max_depth": self.max_depth,
+            "avg_depth": round(self.total_depth / self.samples, 2) if self.samples else 0.0,
+        }
+
+class FramePipeline:
+    """Streaming decode -> infer -> encode pipeline joined by bounded queues.
+
+    Decoding and encoding run in their own threads while inference runs in the
+    calling thread. Each stage is a single consumer of a FIFO queue, so frames
+    reach the encoder in their original order. With a sampler, only keyframes
+    are sent to the detector and the frames in between are interpolated.
+    Without an output_path nothing is drawn or encoded.
+    """
+
+    def __init__(self, video_path: str, output_path: str, detect, batch_size: int = 1,
+                 queue_size: int = PIPELINE_QUEUE_SIZE, sampler=None, on_detections=None, on_progress=None,
+                 start_frame: int = 0, max_frames: int = None):
+        self.video_path = video_path
+        self.output_path = output_path
+        self.detect = detect
+        self.batch_size = max(1, batch_size)
+        self.sampler = sampler
+        self.on_detections = on_detections
+        self.on_progress = on_progress
+        self.start_frame = start_frame
+        self.max_frames = max_frames
+
+        # Frames the inference stage may hold while waiting for the next keyframe
+        gap = 1
+        if sampler is not None and sampler.enabled:
+            gap = sampler.max_gap if sampler.adaptive else sampler.every
+        self.max_buffered = self.batch_size * gap + 1
+
+        self.decode_queue = queue.Queue(maxsize=queue_size)
+        self.encode_queue = queue.Queue(maxsize=queue_size)
+        self.stage_stats = {
+            name: StageStats(PIPELINE_STAGE_SECONDS.labels(name)) for name in ("decode", "infer", "draw", "encode")
+        }
+        self.queued_frames = {name: PIPELINE_QUEUED_FRAMES.labels(name) for name in ("decode", "encode")}
+        self.queue_stats = {"decode": QueueStats(queue_size), "encode": QueueStats(queue_size)}
+
+        self.fps = 0.0
+        self.width = 0
+        self.height = 0
+        self.total_frames = 0
+        self.frames_written = 0
+        self.interpolated_frames = 0
+        self.started_at = None
+        self.elapsed = 0.0
+
+        self._stop = threading.Event()
+        self._error = None
+
+    def _fail(self, error: Exception):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _put(self, name: str, item) -> bool:
+        q = self.decode_queue if name == "decode" else self.encode_queue
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            self.queue_stats[name].sample(q.qsize())
+            if item is not _END:
+                self.queued_frames[name].inc()
+            return True
+        return False
+
+    def _get(self, name: str):
+        q = self.decode_queue if name == "decode" else self.encode_queue
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+                continue
+            if item is not _END:
+                self.queued_frames[name].dec()
+            return item
+
+    def _drain(self):
+        # Frames left behind by a failed run no longer count as queued
+        for name in ("decode", "encode"):
+            q = self.decode_queue if name == "decode" else self.encode_queue
+            while not q.empty():
+                if q.get_nowait() is not _END:
+                    self.queued_frames[name].dec()
+
+    def _decode(self):
+        stats = self.stage_stats["decode"]
+        frame_number = self.start_frame
+        try:
+            while not self._stop.is_set():
+                if self.max_frames is not None and frame_number - self.start_frame >= self.max_frames:
+                    break
+                started = time.perf_counter()
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                keyframe = self.sampler.is_keyframe(frame_number, frame) if self.sampler else True
+                stats.add(time.perf_counter() - started)
+                if not self._put("decode", (frame_number, frame, keyframe)):
+                    return
+                frame_number += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put("decode", _END)
+
+    def _infer(self):
+        stats = self.stage_stats["infer"]
+        # Entries are [frame_number, frame, is_keyframe, boxes] waiting to be resolved
+        buffer = []
+        previous = None
+        ended = False
+        try:
+            while not ended:
+                item = self._get("decode")
+                if item is _END:
+                    ended = True
+                else:
+                    buffer.append([*item, None])
+
+                pending = [entry for entry in buffer if entry[2] and entry[3] is None]
+                if not ended and len(pending) < self.batch_size and len(buffer) < self.max_buffered:
+                    continue
+                if not buffer:
+                    break
+
+                # The last buffered frame needs real detections to close the gap
+                if (ended or not pending) and not buffer[-1][2]:
+                    buffer[-1][2] = True
+                    pending.append(buffer[-1])
+
+                if pending:
+                    started = time.perf_counter()
+                    detections = self.detect([entry[1] for entry in pending])
+                    elapsed = time.perf_counter() - started
+                    stats.add(elapsed, len(pending))
+                    INFERENCE_SECONDS.observe(elapsed)
+                    for entry, boxes in zip(pending, detections):
+                        entry[3] = boxes
+
+                # Resolve every frame up to the last keyframe; skipped frames get
+                # boxes interpolated between their neighbouring keyframes
+                last_keyframe = max(i for i, entry in enumerate(buffer) if entry[2])
+                resolved, buffer = buffer[:last_keyframe + 1], buffer[last_keyframe + 1:]
+                gap = []
+                for entry in resolved:
+                    if not entry[2]:
+                        gap.append(entry)
+                        continue
+                    if gap:
+                        start = previous if previous is not None else entry[3]
+                        for skipped, boxes in zip(gap, interpolate_detections(start, entry[3], len(gap))):
+                            skipped[3] = boxes
+                        self.interpolated_frames += len(gap)
+                        gap = []
+                    previous = entry[3]
+
+                if self.on_detections:
+                    self.on_detections([entry[0] for entry in resolved], [entry[3] for entry in resolved])
+
+                for frame_number, frame, _, boxes in resolved:
+                    if not self._put("encode", (frame_number, frame, boxes)):
+                        return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put("encode", _END)
+
+    def _encode(self):
+        draw_stats = self.stage_stats["draw"]
+        encode_stats = self.stage_stats["encode"]
+        last_progress = 0.0
+        try:
+            while True:
+                item = self._get("encode")
+                if item is _END:
+                    break
+                _, frame, boxes = item
+
+                if self.out is not None:
+                    started = time.perf_counter()
+                    draw_detections(frame, boxes)
+                    drawn = time.perf_counter()
+                    self.out.write(frame)
+                    draw_stats.add(drawn - started)
+                    encode_stats.add(time.perf_counter() - drawn)
+                self.frames_written += 1
+                PIPELINE_FRAMES.inc()
+
+                now = time.monotonic()
+                if self.on_progress and now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    self.on_progress(self.frames_written, self.total_frames, self.stats())
+        except Exception as e:
+            self._fail(e)
+
+    def run(self):
+        self.cap = cv2.VideoCapture(self.video_path)
+        if not self.cap.isOpened():
+            raise ValueError("Failed to open video file")
+
+        # Get video properties
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.start_frame:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            self.total_frames = max(self.total_frames - self.start_frame, 0)
+        if self.max_frames is not None:
+            self.total_frames = min(self.total_frames, self.max_frames)
+
+        # Create output video writer with H.264 codec
+        self.out = None
+        if self.output_path:
+            self.out = open_video_writer(self.output_path, self.fps, (self.width, self.height))
+
+        threads = [
+            threading.Thread(target=self._decode, name="pipeline-decode", daemon=True),
+            threading.Thread(target=self._encode, name="pipeline-encode", daemon=True),
+        ]
+        self.started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            self._infer()
+        finally:
+            for thread in threads:
+                thread.join()
+            self._drain()
+            self.cap.release()
+            if self.out is not None:
+                self.out.release()
+            self.elapsed = time.perf_counter() - self.started_at
+
+        if self._error is not None:
+            raise self._error
+
+        if self.on_progress:
+            self.on_progress(self.frames_written, self.total_frames, self.stats())
+        return self.stats()
+
+    def stats(self) -> dict:
+        elapsed = self.elapsed or (time.perf_counter() - self.started_at if self.started_at else 0.0)
+        stages = {name: stats.as_dict(elapsed) for name, stats in self.stage_stats.items()}
+        busiest = max(self.stage_stats, key=lambda name: self.stage_stats[name].seconds)
+        return {
+            "frames": self.frames_written,
+            "seconds": round(elapsed, 3),
+            "fps": round(self.frames_written / elapsed, 2) if elapsed > 0 else 0.0,
+            "inferred_frames": self.stage_stats["infer"].frames,
+            "interpolated_frames": self.interpolated_frames,
+            "stages": stages,
+            "queues": {name: stats.as_dict() for name, stats in self.queue_stats.items()},
+            "bottleneck": busiest,
+        }
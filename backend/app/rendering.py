@@ -0,0 +1,298 @@
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import detection_store, models
+from .database import engine
+from .pipeline import draw_detections, open_video_writer
+from .media import faststart
+import asyncio
+import glob
+import itertools
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Encode the annotated video while processing; when off it is rendered on first request
+RENDER_VIDEO = os.getenv("RENDER_VIDEO", "true").lower() in ("1", "true", "yes")
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "render_cache")
+# Least recently served renders are deleted beyond this size
+RENDER_CACHE_MAX_BYTES = int(float(os.getenv("RENDER_CACHE_MAX_MB", "2048")) * 2**20)
+# On-demand renders run at the same time; they have their own threads so
+# playback never waits for processing jobs to free a worker
+RENDER_WORKERS = max(1, int(os.getenv("RENDER_WORKERS", "1")))
+# Bytes sent per read while streaming a render in progress
+RENDER_STREAM_CHUNK = 256 * 1024
+# Seconds to wait for the encoder to write more before reading again
+RENDER_STREAM_POLL = 0.2
+
+class FragmentedMp4Writer:
+    """Pipes BGR frames through ffmpeg into a fragmented MP4.
+
+    Fragmented MP4 starts with an empty moov and is only ever appended to, so
+    the file can be streamed and played while it is being written.
+    """
+
+    def __init__(self, path: str, fps: float, size):
+        width, height = size
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-v", "error", "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+             "-r", str(fps or 30), "-i", "pipe:0", "-c:v", "libx264", "-preset", "veryfast",
+             "-pix_fmt", "yuv420p", "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+             "-f", "mp4", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        # ffmpeg writes to a pipe so it never seeks back into what was already streamed
+        self.output = open(path, "wb")
+        self.copier = threading.Thread(target=self._copy, name="render-copy", daemon=True)
+        self.copier.start()
+
+    def _copy(self):
+        for chunk in iter(lambda: self.process.stdout.read(RENDER_STREAM_CHUNK), b""):
+            self.output.write(chunk)
+            self.output.flush()
+
+    def write(self, frame):
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        self.process.stdin.close()
+        self.process.wait()
+        self.copier.join()
+        self.output.close()
+        if self.process.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with status {self.process.returncode}")
+
+class RenderDiscarded(Exception):
+    pass
+
+def render_video(video_path: str, output_path: str, frame_numbers, boxes, progressive: bool = False,
+                 discarded: threading.Event = None):
+    # Draw stored (N, 5) boxes, sorted by frame_numbers, onto the original video.
+    # Setting discarded stops the render at the next frame
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Failed to open video file")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    out = FragmentedMp4Writer(output_path, fps, size) if progressive else open_video_writer(output_path, fps, size)
+    try:
+        frame_number = 0
+        while True:
+            if discarded is not None and discarded.is_set():
+                raise RenderDiscarded("Render was discarded")
+            ret, frame = cap.read()
+            if not ret:
+                break
+            start, end = np.searchsorted(frame_numbers, [frame_number, frame_number + 1])
+            draw_detections(frame, boxes[start:end])
+            out.write(frame)
+            frame_number += 1
+    finally:
+        cap.release()
+        out.release()
+    if not progressive:
+        # Fragmented output already starts with its moov
+        faststart(output_path)
+
+async def load_boxes(video_id: int):
+    # Frame numbers and x1, y1, x2, y2, confidence rows of a video, sorted by frame
+    if detection_store.has_detections(video_id):
+        arrays = await asyncio.to_thread(detection_store.load_detections, video_id)
+        frame_numbers = arrays["frame_number"]
+        x, y, width, height = arrays["x"], arrays["y"], arrays["width"], arrays["height"]
+        return frame_numbers, np.column_stack([x, y, x + width, y + height, arrays["confidence"]])
+
+    stmt = (
+        select(models.Detection.frame_number, models.Detection.x, models.Detection.y,
+               models.Detection.width, models.Detection.height, models.Detection.confidence)
+        .where(models.Detection.video_id == video_id)
+        .order_by(models.Detection.frame_number)
+    )
+    chunks = []
+    async with AsyncSession(engine) as session:
+        result = await session.stream(stmt.execution_options(yield_per=10000))
+        async for rows in result.partitions():
+            chunks.append(np.array(rows, dtype=np.float64).reshape(-1, 6))
+    table = np.concatenate(chunks) if chunks else np.empty((0, 6))
+    frame_numbers = table[:, 0].astype(np.int32)
+    x, y, width, height, confidence = table[:, 1:].T
+    return frame_numbers, np.column_stack([x, y, x + width, y + height, confidence]).astype(np.float32)
+
+_task_ids = itertools.count()
+
+class RenderTask:
+    def __init__(self, video_id: int, path: str, progressive: bool):
+        self.video_id = video_id
+        self.path = path
+        # Per task, so a discarded render never shares a file with its replacement;
+        # the extension stays last because OpenCV picks the container from it
+        stem, extension = os.path.splitext(os.path.basename(path))
+        self.partial_path = os.path.join(os.path.dirname(path), "partial", f"{stem}.{next(_task_ids)}{extension}")
+        self.progressive = progressive
+        self.future = None
+        self.error = None
+        self.discarded = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+class RenderCache:
+    """Annotated videos rendered on demand, kept on disk with LRU eviction.
+
+    Concurrent requests for the same video share one render. Serving a cached
+    file touches its access time, which is the recency used for eviction; the
+    modification time is left alone because it backs the ETag.
+    """
+
+    def __init__(self, directory: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.executor = None
+        self.hits = 0
+        self.renders = 0
+        self.evictions = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render-worker")
+        return self.executor
+
+    def shutdown(self):
+        for task in self.tasks.values():
+            task.discarded.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def path(self, video_id: int) -> str:
+        return os.path.join(self.directory, f"video_{video_id}.mp4").replace("\\", "/")
+
+    def get(self, video_id: int):
+        path = self.path(video_id)
+        if video_id in self.tasks or not os.path.exists(path):
+            return None
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+        self.hits += 1
+        return path
+
+    async def render(self, video_id: int, video_path: str) -> RenderTask:
+        task = self.tasks.get(video_id)
+        if task is not None:
+            return task
+
+        os.makedirs(os.path.join(self.directory, "partial"), exist_ok=True)
+        task = RenderTask(video_id, self.path(video_id), progressive=shutil.which("ffmpeg") is not None)
+        self.tasks[video_id] = task
+        try:
+            frame_numbers, boxes = await load_boxes(video_id)
+            # Readers may open the partial file before the encoder has written to it
+            open(task.partial_path, "wb").close()
+            loop = asyncio.get_running_loop()
+            task.future = loop.run_in_executor(
+                self._get_executor(), self._render, task, video_path, frame_numbers, boxes
+            )
+        except Exception:
+            self._forget(task)
+            raise
+        task.future.add_done_callback(lambda future: self._finished(task, future))
+        self.renders += 1
+        logger.info(f"Rendering annotated video {video_id} ({'progressive' if task.progressive else 'buffered'})")
+        return task
+
+    def _render(self, task: RenderTask, video_path: str, frame_numbers, boxes):
+        render_video(video_path, task.partial_path, frame_numbers, boxes, task.progressive, task.discarded)
+        with self.lock:
+            # Checked under the lock delete() takes, so a discarded render is never moved into place
+            if task.discarded.is_set():
+                raise RenderDiscarded("Render was discarded")
+            os.replace(task.partial_path, task.path)
+        self.evict(keep=task.path)
+
+    def _forget(self, task: RenderTask):
+        # A newer render of the same video may have replaced this one already
+        if self.tasks.get(task.video_id) is task:
+            del self.tasks[task.video_id]
+
+    def _finished(self, task: RenderTask, future):
+        self._forget(task)
+        error = RenderDiscarded("Render was discarded") if future.cancelled() else future.exception()
+        if error is not None:
+            task.error = error
+            if isinstance(error, RenderDiscarded):
+                logger.info(f"Discarded render of video {task.video_id}")
+            else:
+                logger.error(f"Rendering video {task.video_id} failed: {str(error)}")
+            if os.path.exists(task.partial_path):
+                os.remove(task.partial_path)
+
+    async def wait(self, task: RenderTask) -> str:
+        await asyncio.shield(task.future)
+        return task.path
+
+    async def stream(self, task: RenderTask):
+        # Follows the partial file as the encoder appends to it; the open handle
+        # stays valid when the file is renamed into place
+        with open(task.partial_path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, RENDER_STREAM_CHUNK)
+                if chunk:
+                    yield chunk
+                elif task.done:
+                    if task.error is not None:
+                        raise task.error
+                    break
+                else:
+                    await asyncio.sleep(RENDER_STREAM_POLL)
+
+    def evict(self, keep: str = None):
+        files = []
+        for path in glob.glob(os.path.join(self.directory, "*.mp4")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path.replace("\\", "/")))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            self.evictions += 1
+            logger.info(f"Evicted rendered video {path}")
+
+    def delete(self, video_id: int):
+        # The video's detections changed: a render in progress would store a stale file
+        with self.lock:
+            task = self.tasks.pop(video_id, None)
+            if task is not None:
+                task.discarded.set()
+            path = self.path(video_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def stats(self) -> dict:
+        sizes = [os.path.getsize(path) for path in glob.glob(os.path.join(self.directory, "*.mp4"))]
+        return {
+            "files": len(sizes),
+            "bytes": sum(sizes),
+            "max_bytes": self.max_bytes,
+            "rendering": len(self.tasks),
+            "hits": self.hits,
+            "renders": self.renders,
+            "evictions": self.evictions,
+        }
+
+render_cache = RenderCache()
@@ -0,0 +1,305 @@
+import numpy as np
+from sqlalchemy import select, update, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .database import engine
+from .detection_store import save_detections
+from .detection_writer import DetectionWriter, DETECTION_FLUSH_ROWS
+from .inference_backends import (
+    INFERENCE_BACKEND, INFERENCE_INT8, CONFIDENCE_THRESHOLD, NMS_IOU_THRESHOLD
+)
+from .model_registry import weights_path
+from .tracking import TRACK_HIGH_CONFIDENCE, TRACK_MATCH_IOU, TRACK_MAX_AGE
+from .uploads import _hash_file
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Reuse detections of a video already processed with the same model and settings
+RESULT_CACHE = os.getenv("RESULT_CACHE", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "result_cache")
+# Least recently used entries are deleted beyond this size
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv("RESULT_CACHE_MAX_MB", "4096")) * 2**20)
+
+# Options that change which boxes are detected; batch size, storage and
+# rendering options don't and are left out of the key
+KEY_OPTIONS = (
+    "sample_every", "adaptive_sampling", "motion_threshold", "max_frame_gap", "segment_workers",
+    "model_variant", "roi", "inference_size", "motion_mask",
+)
+
+DETECTIONS_FILE = "detections.npz"
+TRACKS_FILE = "tracks.json"
+META_FILE = "meta.json"
+VIDEO_FILE = "annotated.mp4"
+
+_weights_hashes = {}
+_weights_lock = threading.Lock()
+
+def weights_hash(path: str) -> str:
+    # Hashed once per file version; weights not on disk yet are known by name only
+    if not os.path.exists(path):
+        return path
+    stat = os.stat(path)
+    version = (path, stat.st_size, stat.st_mtime_ns)
+    with _weights_lock:
+        cached = _weights_hashes.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+    digest = _hash_file(path)
+    with _weights_lock:
+        _weights_hashes[path] = (version, digest)
+    return digest
+
+def cache_key(content_hash: str, options) -> str:
+    settings = {name: getattr(options, name) for name in KEY_OPTIONS}
+    settings.update({
+        "backend": INFERENCE_BACKEND,
+        "int8": INFERENCE_INT8,
+        "confidence": CONFIDENCE_THRESHOLD,
+        "nms_iou": NMS_IOU_THRESHOLD,
+        "tracker": [TRACK_HIGH_CONFIDENCE, TRACK_MATCH_IOU, TRACK_MAX_AGE],
+    })
+    key = {
+        "content": content_hash,
+        "weights": weights_hash(weights_path(options.model_variant)),
+        "settings": settings,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+async def load_results(video_id: int) -> dict:
+    # A video's detection rows as columns, in frame order
+    stmt = (
+        select(models.Detection.frame_number, models.Detection.x, models.Detection.y,
+               models.Detection.width, models.Detection.height, models.Detection.confidence,
+               models.Detection.track_id)
+        .where(models.Detection.video_id == video_id)
+        .order_by(models.Detection.frame_number, models.Detection.id)
+    )
+    chunks = []
+    async with AsyncSession(engine) as session:
+        result = await session.stream(stmt.execution_options(yield_per=10000))
+        async for rows in result.partitions():
+            # Missing track IDs become NaN and are stored as 0
+            chunks.append(np.array(rows, dtype=np.float64).reshape(-1, 7))
+    table = np.concatenate(chunks) if chunks else np.empty((0, 7))
+    return {
+        "frame_number": table[:, 0].astype(np.int32),
+        "x": table[:, 1].astype(np.float32),
+        "y": table[:, 2].astype(np.float32),
+        "width": table[:, 3].astype(np.float32),
+        "height": table[:, 4].astype(np.float32),
+        "confidence": table[:, 5].astype(np.float32),
+        "track_id": np.nan_to_num(table[:, 6]).astype(np.int32),
+    }
+
+def _link_or_copy(source: str, target: str):
+    # Hard links share the bytes; different filesystems get a copy
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+class ResultCache:
+    """Detections, tracks and annotated video of finished jobs, on disk.
+
+    Entries are keyed by the video content hash, the weights hash and every
+    setting that affects detection, so a hit is the exact result the job
+    would produce. Reading an entry touches its meta file, whose access time
+    is the recency used for eviction.
+    """
+
+    def __init__(self, directory: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 enabled: bool = RESULT_CACHE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key).replace("\\", "/")
+
+    async def key_for(self, video_id: int, options) -> str:
+        async with AsyncSession(engine) as session:
+            video = await session.get(models.Video, video_id)
+            content_hash = video.content_hash
+            if content_hash is None:
+                # Videos uploaded before content hashing get their hash now
+                content_hash = await asyncio.to_thread(_hash_file, video.filepath)
+                video.content_hash = content_hash
+                await session.commit()
+        return await asyncio.to_thread(cache_key, content_hash, options)
+
+    def lookup(self, key: str):
+        meta_path = os.path.join(self.path(key), META_FILE)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(meta_path, (time.time(), os.path.getmtime(meta_path)))
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return meta
+
+    async def link(self, key: str, video_id: int, meta: dict, output_path: str = None,
+                   columnar_store: bool = False, lease_check=None) -> dict:
+        """Attaches a cached result to a video and marks it completed."""
+        started = time.perf_counter()
+        entry = self.path(key)
+        arrays = await asyncio.to_thread(self._read_detections, entry)
+        with open(os.path.join(entry, TRACKS_FILE)) as f:
+            tracks = json.load(f)
+
+        processed_path = None
+        if output_path and os.path.exists(os.path.join(entry, VIDEO_FILE)):
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            await asyncio.to_thread(_link_or_copy, os.path.join(entry, VIDEO_FILE), output_path)
+            processed_path = output_path
+
+        async with AsyncSession(engine) as session:
+            if lease_check is not None:
+                await lease_check(session)
+            # Results of an earlier run of this video are replaced
+            await session.execute(delete(models.Detection).where(models.Detection.video_id == video_id))
+            await session.execute(delete(models.Track).where(models.Track.video_id == video_id))
+            if tracks:
+                await session.execute(insert(models.Track), [{"video_id": video_id, **track} for track in tracks])
+            await session.commit()
+
+        writer = DetectionWriter(lease_check=lease_check)
+        track_ids = arrays["track_id"]
+        for start in range(0, len(arrays["frame_number"]), DETECTION_FLUSH_ROWS):
+            end = start + DETECTION_FLUSH_ROWS
+            await writer.add_many(zip(
+                itertools.repeat(video_id, end - start),
+                arrays["frame_number"][start:end].tolist(),
+                arrays["x"][start:end].tolist(),
+                arrays["y"][start:end].tolist(),
+                arrays["width"][start:end].tolist(),
+                arrays["height"][start:end].tolist(),
+                arrays["confidence"][start:end].tolist(),
+                [int(t) if t else None for t in track_ids[start:end].tolist()]
+            ))
+        await writer.close()
+
+        if columnar_store:
+            columns = {name: arrays[name] for name in ("frame_number", "x", "y", "width", "height", "confidence")}
+            await asyncio.to_thread(save_detections, video_id, columns, meta["frame_count"])
+
+        seconds = time.perf_counter() - started
+        async with AsyncSession(engine) as session:
+            if lease_check is not None:
+                await lease_check(session)
+            await session.execute(
+                update(models.Video)
+                .where(models.Video.id == video_id)
+                .values(
+                    processed_filepath=processed_path,
+                    status="completed",
+                    frame_count=meta["frame_count"],
+                    processed_frames=meta["processed_frames"],
+                    detection_count=writer.rows_written,
+                    processing_seconds=round(seconds, 3)
+                )
+            )
+            await session.commit()
+        logger.info(f"Video {video_id} served from result cache entry {key} in {seconds * 1000:.1f}ms")
+        return {"cache_hit": True, "frames": meta["processed_frames"], "seconds": round(seconds, 3)}
+
+    def _read_detections(self, entry: str) -> dict:
+        with np.load(os.path.join(entry, DETECTIONS_FILE)) as archive:
+            return {name: archive[name] for name in archive.files}
+
+    async def store(self, key: str, video_id: int, meta: dict, tracks: list, output_path: str = None):
+        arrays = await load_results(video_id)
+        await asyncio.to_thread(self._write, key, arrays, meta, tracks, output_path)
+
+    def _write(self, key: str, arrays: dict, meta: dict, tracks: list, output_path: str = None):
+        entry = self.path(key)
+        if os.path.exists(entry):
+            return
+        # Built next to the entry and renamed into place, so readers never see half of it
+        temp_entry = f"{entry}.tmp{threading.get_ident()}"
+        os.makedirs(temp_entry)
+        try:
+            with open(os.path.join(temp_entry, DETECTIONS_FILE), "wb") as f:
+                np.savez_compressed(f, **arrays)
+            with open(os.path.join(temp_entry, TRACKS_FILE), "w") as f:
+                json.dump(tracks, f)
+            if output_path and os.path.exists(output_path):
+                _link_or_copy(output_path, os.path.join(temp_entry, VIDEO_FILE))
+            # Written last: an entry exists once its meta file does
+            with open(os.path.join(temp_entry, META_FILE), "w") as f:
+                json.dump(meta, f)
+            os.rename(temp_entry, entry)
+        except OSError:
+            shutil.rmtree(temp_entry, ignore_errors=True)
+            if not os.path.exists(entry):
+                raise
+            return
+        with self.lock:
+            self.stores += 1
+        self.evict(keep=entry)
+
+    def _entries(self) -> list:
+        # (last used, size, path) of every complete entry
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            entry = self.path(name)
+            try:
+                last_used = os.stat(os.path.join(entry, META_FILE)).st_atime
+                size = sum(entry_file.stat().st_size for entry_file in os.scandir(entry))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            entries.append((last_used, size, entry))
+        return entries
+
+    def evict(self, keep: str = None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            with self.lock:
+                self.evictions += 1
+            logger.info(f"Evicted result cache entry {entry}")
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+result_cache = ResultCache()
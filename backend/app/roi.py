@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+from .pipeline import detect_people
+import threading
+
+class FrameRegion:
+    """Region of interest of a video, given in original frame pixels.
+
+    Two points are the corners of a rectangle, more points are a polygon.
+    Only the bounding rectangle of the region is sent to the detector, with
+    pixels outside a polygon blacked out, and boxes are mapped back to frame
+    coordinates. The frame size is only known once frames arrive, so the
+    crop and mask are prepared on first use.
+    """
+
+    def __init__(self, points):
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        if len(points) == 2:
+            (x1, y1), (x2, y2) = points.min(axis=0), points.max(axis=0)
+            points = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+        self.points = points
+        # Axis-aligned rectangles are cropped without masking
+        self.is_rectangle = (
+            len(points) == 4 and len(np.unique(points[:, 0])) == 2 and len(np.unique(points[:, 1])) == 2
+        )
+        self.frame_shape = None
+        self.bounds = None
+        self.mask = None
+        self._lock = threading.Lock()
+
+    def _prepare(self, frame_shape):
+        with self._lock:
+            if self.frame_shape == frame_shape[:2]:
+                return
+            height, width = frame_shape[:2]
+            polygon = np.round(self.points).astype(np.int32)
+            polygon[:, 0] = polygon[:, 0].clip(0, width)
+            polygon[:, 1] = polygon[:, 1].clip(0, height)
+            x, y, w, h = cv2.boundingRect(polygon)
+            if w == 0 or h == 0:
+                raise ValueError("Region of interest lies outside the frame")
+            mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(mask, [polygon - (x, y)], 255)
+            self.bounds = (x, y, min(w, width - x), min(h, height - y))
+            self.mask = mask[:self.bounds[3], :self.bounds[2]]
+            self.frame_shape = frame_shape[:2]
+
+    def crop(self, frame):
+        if self.frame_shape != frame.shape[:2]:
+            self._prepare(frame.shape)
+        x, y, w, h = self.bounds
+        region = frame[y:y + h, x:x + w]
+        if self.is_rectangle:
+            return region
+        return cv2.bitwise_and(region, region, mask=self.mask)
+
+    def contains(self, boxes):
+        # Boxes, in frame coordinates, whose center lies inside the region
+        x, y, w, h = self.bounds
+        cx = ((boxes[:, 0] + boxes[:, 2]) / 2 - x).astype(np.int32)
+        cy = ((boxes[:, 1] + boxes[:, 3]) / 2 - y).astype(np.int32)
+        inside = (cx >= 0) & (cx < w) & (cy >= 0) & (cy < h)
+        inside[inside] = self.mask[cy[inside], cx[inside]] > 0
+        return inside
+
+    def to_frame(self, boxes):
+        # Shift (N, 5) crop boxes back to frame coordinates and drop the ones
+        # centered outside the region
+        if not len(boxes):
+            return boxes
+        x, y, _, _ = self.bounds
+        boxes = boxes.copy()
+        boxes[:, :4] += np.array([x, y, x, y], dtype=boxes.dtype)
+        return boxes[self.contains(boxes)]
+
+def region_detector(model, region: FrameRegion = None, imgsz: int = None):
+    # detect(frames) for the pipeline, restricted to the region when there is one
+    if region is None:
+        return lambda frames: detect_people(model, frames, imgsz)
+
+    def detect(frames):
+        detections = detect_people(model, [region.crop(frame) for frame in frames], imgsz)
+        return [region.to_frame(boxes) for boxes in detections]
+    return detect
@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+import os
+
+# Defaults for sampled processing
+SAMPLE_EVERY = max(1, int(os.getenv("SAMPLE_EVERY", "1")))
+ADAPTIVE_SAMPLING = os.getenv("ADAPTIVE_SAMPLING", "false").lower() in ("1", "true", "yes")
+# Mean absolute grayscale difference (0-255) that triggers inference in adaptive mode
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "6.0"))
+# Longest run of frames that may be skipped in adaptive mode
+MAX_FRAME_GAP = max(1, int(os.getenv("MAX_FRAME_GAP", "15")))
+
+# Size of the thumbnail used to measure frame differences
+MOTION_SIZE = (64, 64)
+# Minimum IoU for two boxes of neighbouring keyframes to be treated as the same person
+MATCH_IOU = 0.2
+
+def motion_thumbnail(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, MOTION_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+def motion_energy(previous, current) -> float:
+    return float(np.abs(current - previous).mean())
+
+class FrameSampler:
+    """Decides which frames are sent to the detector.
+
+    Fixed mode runs inference on every k-th frame. Adaptive mode runs it when the
+    frame differs enough from the last inferred frame, or after max_gap skipped frames.
+    With a region, only motion inside the region counts.
+    """
+
+    def __init__(self, every: int = SAMPLE_EVERY, adaptive: bool = ADAPTIVE_SAMPLING,
+                 motion_threshold: float = MOTION_THRESHOLD, max_gap: int = MAX_FRAME_GAP, region=None):
+        self.every = max(1, every)
+        self.adaptive = adaptive
+        self.motion_threshold = motion_threshold
+        self.max_gap = max(1, max_gap)
+        self.region = region
+        self.reference = None
+        self.last_keyframe = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.adaptive or self.every > 1
+
+    def is_keyframe(self, frame_number: int, frame) -> bool:
+        if not self.enabled:
+            return True
+        if not self.adaptive:
+            return frame_number % self.every == 0
+
+        thumbnail = motion_thumbnail(self.region.crop(frame) if self.region is not None else frame)
+        keyframe = (
+            self.reference is None
+            or frame_number - self.last_keyframe >= self.max_gap
+            or motion_energy(self.reference, thumbnail) >= self.motion_threshold
+        )
+        if keyframe:
+            self.reference = thumbnail
+            self.last_keyframe = frame_number
+        return keyframe
+
+def box_iou(a, b):
+    # Pairwise IoU between (N, 4+) and (M, 4+) arrays of x1, y1, x2, y2
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0).astype(np.float32)
+
+def match_boxes(a, b, min_iou: float = MATCH_IOU):
+    # Greedy highest-IoU-first matching; returns (index_a, index_b) pairs
+    iou = box_iou(a, b)
+    pairs = []
+    if iou.size == 0:
+        return pairs
+    order = np.dstack(np.unravel_index(np.argsort(-iou, axis=None), iou.shape))[0]
+    used_a, used_b = set(), set()
+    for i, j in order:
+        if iou[i, j] < min_iou:
+            break
+        if i in used_a or j in used_b:
+            continue
+        used_a.add(i)
+        used_b.add(j)
+        pairs.append((i, j))
+    return pairs
+
+def interpolate_detections(start_boxes, end_boxes, steps: int) -> list:
+    """Fill the `steps` frames between two keyframes with interpolated boxes.
+
+    Boxes matched across the two keyframes move linearly; unmatched boxes are held
+    from the nearer keyframe.
+    """
+    pairs = match_boxes(start_boxes, end_boxes)
+    matched_start = np.array([i for i, _ in pairs], dtype=int)
+    matched_end = np.array([j for _, j in pairs], dtype=int)
+    only_start = np.setdiff1d(np.arange(len(start_boxes)), matched_start)
+    only_end = np.setdiff1d(np.arange(len(end_boxes)), matched_end)
+
+    frames = []
+    for step in range(1, steps + 1):
+        t = step / (steps + 1)
+        moving = start_boxes[matched_start] * (1 - t) + end_boxes[matched_end] * t
+        held = start_boxes[only_start] if t < 0.5 else end_boxes[only_end]
+        frames.append(np.concatenate([moving, held]).astype(np.float32).reshape(-1, 5))
+    return frames
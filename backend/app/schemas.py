@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Literal
+from pydantic import ConfigDict, Field, field_validator
 
 class VideoBase(BaseModel):
     filename: str
@@ -33,4 +34,53 @@ class Detection(DetectionBase):
     timestamp: datetime
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class ProcessingOptions(BaseModel):
+    # model_variant would otherwise clash with pydantic's reserved "model_" prefix
+    model_config = ConfigDict(protected_namespaces=())
+
+    # Unset fields fall back to the server defaults
+    batch_size: Optional[int] = Field(None, ge=1, le=64)
+    sample_every: Optional[int] = Field(None, ge=1, le=300)
+    adaptive_sampling: Optional[bool] = None
+    motion_threshold: Optional[float] = Field(None, ge=0, le=255)
+    max_frame_gap: Optional[int] = Field(None, ge=1, le=300)
+    columnar_store: Optional[bool] = None
+    segment_workers: Optional[int] = Field(None, ge=1, le=64)
+    model_variant: Optional[Literal["n", "s", "m", "l", "x"]] = None
+    # [[x, y], ...] in frame pixels; two points are the corners of a rectangle
+    roi: Optional[List[List[float]]] = None
+    # Inference resolution, e.g. 320, 480 or 640
+    inference_size: Optional[int] = Field(None, ge=160, le=1920)
+    # Skip inference on frames without motion inside the ROI
+    motion_mask: Optional[bool] = None
+    # Encode the annotated video while processing instead of on first request
+    render: Optional[bool] = None
+
+    @field_validator("roi")
+    @classmethod
+    def check_roi(cls, roi):
+        if roi is not None and (len(roi) < 2 or any(len(point) != 2 for point in roi)):
+            raise ValueError("roi must be two corners or a polygon of [x, y] points")
+        return roi
+
+    @field_validator("inference_size")
+    @classmethod
+    def check_inference_size(cls, size):
+        if size is not None and size % 32:
+            raise ValueError("inference_size must be a multiple of 32")
+        return size
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0)
+
+class StreamCreate(BaseModel):
+    # RTSP/HTTP URL, camera index, or a local video file standing in for a camera
+    source: str = Field(..., min_length=1)
+    # Restart local files at the end instead of ending the stream
+    loop: bool = False
+    latency_budget_ms: Optional[float] = Field(None, gt=0, le=60000)
+    # Only model_variant, roi and inference_size apply to streams
+    options: Optional[ProcessingOptions] = None
@@ -0,0 +1,214 @@
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .pipeline import FramePipeline, open_video_writer
+from .roi import FrameRegion, region_detector
+from .sampling import FrameSampler
+from .inference_backends import load_detector
+from .model_registry import warm_up
+from .metrics import registry as metrics_registry
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used to process one video in parallel segments (1 = sequential)
+SEGMENT_WORKERS = max(1, int(os.getenv("SEGMENT_WORKERS", "1")))
+# Segments shorter than this are not worth a process of their own
+SEGMENT_MIN_FRAMES = max(1, int(os.getenv("SEGMENT_MIN_FRAMES", "300")))
+
+# Detector owned by each worker process
+_worker_model = None
+
+def _init_worker(weights: str):
+    global _worker_model
+    # Parallelism comes from the processes, so keep each one on a single thread
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _worker_model = load_detector(weights)
+    warm_up(_worker_model)
+
+def find_keyframes(video_path: str, fps: float):
+    # Frame indices of keyframes according to ffprobe, or None if unavailable
+    if shutil.which("ffprobe") is None or fps <= 0:
+        return None
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path],
+            capture_output=True, text=True, check=True, timeout=600
+        ).stdout
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"Could not list keyframes of {video_path}: {str(e)}")
+        return None
+
+    packets = []
+    for line in output.splitlines():
+        parts = line.split(",")
+        if len(parts) >= 2 and parts[0] not in ("", "N/A"):
+            packets.append((float(parts[0]), "K" in parts[1]))
+    if not packets:
+        return None
+    first_pts = min(pts for pts, _ in packets)
+    keyframes = sorted({int(round((pts - first_pts) * fps)) for pts, keyframe in packets if keyframe})
+    return keyframes or None
+
+def plan_segments(total_frames: int, workers: int, keyframes=None, min_frames: int = SEGMENT_MIN_FRAMES):
+    # Split [0, total_frames) into up to `workers` ranges starting on keyframes
+    count = max(1, min(workers, total_frames // max(min_frames, 1)))
+    boundaries = [0]
+    for i in range(1, count):
+        target = total_frames * i // count
+        if keyframes:
+            target = min(keyframes, key=lambda keyframe: abs(keyframe - target))
+        if boundaries[-1] < target < total_frames:
+            boundaries.append(target)
+    boundaries.append(total_frames)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def process_segment(video_path: str, output_path: str, start: int, end: int, options: dict) -> dict:
+    # Runs inside a worker process
+    region = FrameRegion(options["roi"]) if options.get("roi") else None
+    sampler = FrameSampler(
+        every=options["sample_every"],
+        adaptive=options["adaptive_sampling"] or options.get("motion_mask", False),
+        motion_threshold=options["motion_threshold"],
+        max_gap=options["max_frame_gap"],
+        region=region
+    )
+    frame_chunks, box_chunks = [], []
+
+    def on_detections(frame_numbers, detections):
+        counts = [len(boxes) for boxes in detections]
+        if sum(counts):
+            frame_chunks.append(np.repeat(np.asarray(frame_numbers, dtype=np.int32), counts))
+            box_chunks.append(np.concatenate(detections).astype(np.float32))
+
+    pipeline = FramePipeline(
+        video_path,
+        output_path,
+        region_detector(_worker_model, region, options.get("inference_size")),
+        batch_size=options["batch_size"],
+        sampler=sampler,
+        on_detections=on_detections,
+        start_frame=start,
+        max_frames=end - start
+    )
+    stats = pipeline.run()
+
+    return {
+        "start": start,
+        "end": end,
+        "output_path": output_path,
+        "frame_numbers": np.concatenate(frame_chunks) if frame_chunks else np.empty(0, dtype=np.int32),
+        "boxes": np.concatenate(box_chunks) if box_chunks else np.empty((0, 5), dtype=np.float32),
+        "stats": stats,
+        # Pipeline metrics recorded in this process since its previous segment
+        "metrics": metrics_registry.drain(),
+    }
+
+def stitch_segments(paths, output_path: str, fps: float, size):
+    if shutil.which("ffmpeg"):
+        list_path = f"{output_path}.segments.txt"
+        with open(list_path, "w") as f:
+            for path in paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        try:
+            subprocess.run(
+                ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                 "-c", "copy", output_path],
+                check=True, timeout=3600
+            )
+            return
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning(f"ffmpeg concat failed, re-encoding segments: {str(e)}")
+        finally:
+            os.remove(list_path)
+
+    # Fallback: decode the segments in order and encode them into one file
+    out = open_video_writer(output_path, fps, size)
+    try:
+        for path in paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        out.release()
+
+def run_segments(video_path: str, output_path: str, options: dict, workers: int,
+                 weights: str = "yolov8n.pt", on_segment=None) -> dict:
+    """Process a video as keyframe-aligned segments in a process pool.
+
+    Each worker process loads its own detector instance. Segment results keep global
+    frame numbers and are passed to on_segment as they finish; the annotated
+    segments are stitched into output_path in order. Without an output_path
+    only detections are produced.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Failed to open video file")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    segments = plan_segments(total_frames, workers, find_keyframes(video_path, fps))
+    logger.info(f"Processing {video_path} as {len(segments)} segments with {workers} workers")
+
+    started = time.perf_counter()
+    results = []
+    output_dir = os.path.dirname(output_path or "") or "."
+    with tempfile.TemporaryDirectory(dir=output_dir) as segment_dir:
+        # Spawned workers don't inherit the parent's threads or CUDA state
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(segments)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(weights,)
+        ) as pool:
+            futures = [
+                pool.submit(process_segment, video_path,
+                            os.path.join(segment_dir, f"segment_{i:04d}.mp4") if output_path else None,
+                            start, end, options)
+                for i, (start, end) in enumerate(segments)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                result["total_frames"] = total_frames
+                metrics_registry.merge(result.pop("metrics"))
+                results.append(result)
+                if on_segment:
+                    on_segment(result)
+
+        results.sort(key=lambda result: result["start"])
+        stitch_started = time.perf_counter()
+        if output_path:
+            stitch_segments([result["output_path"] for result in results], output_path, fps, size)
+        stitch_seconds = time.perf_counter() - stitch_started
+
+    elapsed = time.perf_counter() - started
+    frames = sum(result["stats"]["frames"] for result in results)
+    return {
+        "frames": frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "workers": workers,
+        "stitch_seconds": round(stitch_seconds, 3),
+        "segments": [
+            {"start": result["start"], "end": result["end"], "fps": result["stats"]["fps"]}
+            for result in results
+        ],
+    }
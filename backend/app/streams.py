@@ -0,0 +1,448 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime
+from urllib.parse import urlsplit
+import cv2
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .database import engine
+from .detection_writer import DetectionWriter
+from .events import broker
+from .executor import stream_from_worker
+from .metrics import INFERENCE_SECONDS, STREAMS_ACTIVE
+from .model_registry import ModelRegistry, MODEL_VARIANT
+from .pipeline import detection_rows, PROGRESS_INTERVAL
+from .roi import FrameRegion, region_detector
+from .tracking import IoUTracker
+from .video_processor import save_tracks
+import asyncio
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Frames older than this when inference is ready for them are dropped
+STREAM_LATENCY_BUDGET_MS = float(os.getenv("STREAM_LATENCY_BUDGET_MS", "500"))
+# Streams processed at the same time; each keeps a model checked out while it runs
+MAX_STREAMS = max(1, int(os.getenv("MAX_STREAMS", "2")))
+# Seconds to wait before reopening a live source that stopped delivering frames
+STREAM_RECONNECT_SECONDS = float(os.getenv("STREAM_RECONNECT_SECONDS", "2"))
+# Directory whose video files may be played back as stand-in cameras; unset disables file sources
+STREAM_FILE_DIR = os.getenv("STREAM_FILE_DIR", "")
+# Network sources must use one of these schemes and hosts (comma separated); no hosts disables them
+STREAM_ALLOWED_SCHEMES = {
+    scheme.strip().lower() for scheme in os.getenv("STREAM_ALLOWED_SCHEMES", "rtsp,rtsps,rtmp,http,https").split(",")
+    if scheme.strip()
+}
+STREAM_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("STREAM_ALLOWED_HOSTS", "").split(",") if host.strip()}
+# Allow camera indexes ("0") of the server's own video devices
+STREAM_ALLOW_DEVICES = os.getenv("STREAM_ALLOW_DEVICES", "false").lower() in ("1", "true", "yes")
+# Seconds over which input and processed frame rates are measured
+STREAM_STATS_WINDOW = 5.0
+# End-to-end latencies kept for the percentiles in the health report
+LATENCY_SAMPLES = 1000
+
+class StreamLimitError(Exception):
+    pass
+
+# Streams have their own instances, so they can never hold every model queued jobs wait for
+stream_models = ModelRegistry(pool_size=MAX_STREAMS)
+
+def local_path(source: str):
+    # File sources stand in for a camera; anything else is handed to OpenCV as a URL
+    path = source[len("file://"):] if source.startswith("file://") else source
+    if "://" in path or path.isdigit():
+        return None
+    return path
+
+def check_source(source: str) -> str:
+    """Returns the source to open, or raises ValueError if it is not allowed.
+
+    Sources come from API clients and end up opened by OpenCV on the server,
+    so nothing is accepted by default: files must be inside STREAM_FILE_DIR,
+    URLs must match STREAM_ALLOWED_SCHEMES and STREAM_ALLOWED_HOSTS, and
+    devices need STREAM_ALLOW_DEVICES.
+    """
+    if source.isdigit():
+        if not STREAM_ALLOW_DEVICES:
+            raise ValueError("Camera devices are not enabled as stream sources")
+        return source
+
+    path = local_path(source)
+    if path is None:
+        url = urlsplit(source)
+        if url.scheme.lower() not in STREAM_ALLOWED_SCHEMES:
+            raise ValueError(f"Stream source scheme {url.scheme!r} is not allowed")
+        if (url.hostname or "").lower() not in STREAM_ALLOWED_HOSTS:
+            raise ValueError(f"Stream source host {url.hostname!r} is not allowed")
+        return source
+
+    if not STREAM_FILE_DIR:
+        raise ValueError("File stream sources are not enabled")
+    # Relative paths are inside the directory; symlinks and ".." can't leave it
+    file_dir = os.path.realpath(STREAM_FILE_DIR)
+    path = os.path.realpath(os.path.join(file_dir, path))
+    if os.path.commonpath([path, file_dir]) != file_dir:
+        raise ValueError(f"Stream source {source} is outside the stream file directory")
+    if not os.path.isfile(path):
+        raise ValueError(f"Stream source {source} not found")
+    return path
+
+class RateMeter:
+    """Events per second over a sliding window."""
+
+    def __init__(self, window: float = STREAM_STATS_WINDOW):
+        self.window = window
+        self.times = deque()
+        self.lock = threading.Lock()
+
+    def tick(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.times.append(now)
+            while self.times and now - self.times[0] > self.window:
+                self.times.popleft()
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self.lock:
+            while self.times and now - self.times[0] > self.window:
+                self.times.popleft()
+            if len(self.times) < 2:
+                return 0.0
+            return (len(self.times) - 1) / max(now - self.times[0], 1e-9)
+
+class FrameGrabber:
+    """Reads a stream source in its own thread, keeping only the newest frame.
+
+    A consumer that falls behind gets the latest frame on its next read and the
+    frames it never saw are counted as dropped, so no backlog can build up.
+    Live sources are reopened when they stop delivering frames. Local files
+    stand in for a camera: they are read at their own frame rate and can loop.
+    """
+
+    def __init__(self, source: str, loop: bool = False, reconnect_seconds: float = STREAM_RECONNECT_SECONDS):
+        self.source = source
+        self.path = local_path(source)
+        self.loop = loop
+        self.reconnect_seconds = reconnect_seconds
+        self.condition = threading.Condition()
+        self.latest = None
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.input_rate = RateMeter()
+        self.status = "starting"
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def ended(self) -> bool:
+        return self.status in ("ended", "failed", "stopped")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stream-grabber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self.condition:
+            if not self.ended:
+                self.status = "stopped"
+            self.condition.notify_all()
+
+    def _open(self):
+        if self.path is not None:
+            return cv2.VideoCapture(self.path)
+        cap = cv2.VideoCapture(int(self.source) if self.source.isdigit() else self.source)
+        # Keep OpenCV's own buffer from holding on to stale frames
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _finish(self, status: str, error: str = None):
+        with self.condition:
+            self.status = status
+            self.error = error
+            self.condition.notify_all()
+
+    def _run(self):
+        frame_number = 0
+        while not self._stop.is_set():
+            cap = self._open()
+            if not cap.isOpened():
+                if self.path is not None:
+                    self._finish("failed", "Failed to open video file")
+                    return
+                logger.warning(f"Could not open stream {self.source}, retrying in {self.reconnect_seconds}s")
+                self.status = "reconnecting"
+                self._stop.wait(self.reconnect_seconds)
+                continue
+
+            self.status = "running"
+            # Files are paced to their frame rate like a camera would deliver them
+            interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0) if self.path is not None else 0.0
+            next_frame_at = time.monotonic()
+            try:
+                while not self._stop.is_set():
+                    ret, frame = cap.read()
+                    if not ret:
+                        if self.path is not None and self.loop and frame_number:
+                            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                            continue
+                        break
+                    captured_at = time.monotonic()
+                    with self.condition:
+                        if self.latest is not None:
+                            self.frames_dropped += 1
+                        self.latest = (frame_number, captured_at, frame)
+                        self.frames_read += 1
+                        self.condition.notify()
+                    self.input_rate.tick(captured_at)
+                    frame_number += 1
+
+                    if interval:
+                        next_frame_at += interval
+                        self._stop.wait(max(next_frame_at - time.monotonic(), 0))
+            finally:
+                cap.release()
+
+            if self.path is not None:
+                self._finish("ended")
+                return
+            if not self._stop.is_set():
+                logger.warning(f"Stream {self.source} stopped delivering frames, reconnecting")
+                self.status = "reconnecting"
+                self._stop.wait(self.reconnect_seconds)
+
+    def read(self, timeout: float = None):
+        # Newest (frame_number, captured_at, frame), or None on timeout or end of stream
+        with self.condition:
+            self.condition.wait_for(lambda: self.latest is not None or self.ended, timeout)
+            item, self.latest = self.latest, None
+            return item
+
+class LiveStream:
+    """State and health of one stream being processed."""
+
+    def __init__(self, video_id: int, source: str, options: dict, loop: bool = False,
+                 latency_budget_ms: float = STREAM_LATENCY_BUDGET_MS):
+        self.video_id = video_id
+        self.source = source
+        self.options = options
+        self.latency_budget = latency_budget_ms / 1000
+        self.grabber = FrameGrabber(source, loop)
+        self.stop_event = threading.Event()
+        self.started_at = time.monotonic()
+        self.status = "starting"
+        self.error = None
+        self.task = None
+
+        self.frames_processed = 0
+        self.frames_stale = 0
+        self.frames_over_budget = 0
+        self.detections = 0
+        self.processed_rate = RateMeter()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, latency: float):
+        self.frames_processed += 1
+        self.processed_rate.tick()
+        self.latencies.append(latency)
+        if latency > self.latency_budget:
+            self.frames_over_budget += 1
+
+    def health(self) -> dict:
+        frames_read = self.grabber.frames_read
+        dropped = self.grabber.frames_dropped + self.frames_stale
+        latencies = np.array(self.latencies) * 1000
+        status = self.status
+        if status == "running" and self.grabber.status == "reconnecting":
+            status = "reconnecting"
+        return {
+            "video_id": self.video_id,
+            "source": self.source,
+            "status": status,
+            "error": self.error or self.grabber.error,
+            "uptime_seconds": round(time.monotonic() - self.started_at, 1),
+            "input_fps": round(self.grabber.input_rate.rate(), 2),
+            "processed_fps": round(self.processed_rate.rate(), 2),
+            "frames_read": frames_read,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": dropped,
+            "drop_rate": round(dropped / frames_read, 4) if frames_read else 0.0,
+            "detections": self.detections,
+            "latency_budget_ms": round(self.latency_budget * 1000, 1),
+            "frames_over_budget": self.frames_over_budget,
+            "latency_ms": {
+                "last": round(float(latencies[-1]), 1) if len(latencies) else None,
+                "mean": round(float(latencies.mean()), 1) if len(latencies) else None,
+                "p95": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+            },
+        }
+
+def run_stream(emit, stream: LiveStream):
+    # Runs in a stream worker thread for as long as the stream is processed
+    options = stream.options
+    region = FrameRegion(options["roi"]) if options.get("roi") else None
+    tracker = IoUTracker()
+    grabber = stream.grabber
+
+    with stream_models.acquire(options.get("model_variant") or MODEL_VARIANT) as model:
+        detect = region_detector(model, region, options.get("inference_size"))
+        grabber.start()
+        stream.status = "running"
+        last_progress = 0.0
+        try:
+            while not stream.stop_event.is_set():
+                item = grabber.read(timeout=0.5)
+                if item is None:
+                    if grabber.ended:
+                        break
+                    continue
+
+                frame_number, captured_at, frame = item
+                if time.monotonic() - captured_at > stream.latency_budget:
+                    # Already too old to be useful: skip it rather than fall further behind
+                    stream.frames_stale += 1
+                    continue
+
+                with INFERENCE_SECONDS.time():
+                    boxes = detect([frame])[0]
+                track_ids = tracker.update(frame_number, boxes)
+                stream.record(time.monotonic() - captured_at)
+                if len(boxes):
+                    stream.detections += len(boxes)
+                    emit(("detections", detection_rows(
+                        stream.video_id, np.full(len(boxes), frame_number), boxes, track_ids
+                    )))
+
+                now = time.monotonic()
+                if now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    emit(("progress", None))
+        finally:
+            grabber.stop()
+
+    emit(("tracks", tracker.summaries()))
+
+class StreamManager:
+    """Starts, tracks and stops live streams.
+
+    Each stream is stored as a Video whose status is "streaming" while it
+    runs; detections and tracks are written through the same tables as for
+    uploaded videos, and health is published to the video's event stream.
+    """
+
+    def __init__(self, max_streams: int = MAX_STREAMS):
+        self.max_streams = max_streams
+        self.streams = {}
+        self.executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Streams never finish on their own, so they get threads outside the processing pool
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_streams, thread_name_prefix="stream-worker")
+        return self.executor
+
+    def active(self) -> list:
+        return [stream for stream in self.streams.values() if not stream.task.done()]
+
+    async def start(self, source: str, options: dict = None, loop: bool = False,
+                    latency_budget_ms: float = None) -> LiveStream:
+        if len(self.active()) >= self.max_streams:
+            raise StreamLimitError(f"At most {self.max_streams} streams can run at the same time")
+        source = check_source(source)
+        path = local_path(source)
+
+        async with AsyncSession(engine) as session:
+            video = models.Video(
+                filename=os.path.basename(path) if path is not None else source,
+                filepath=source,
+                status="streaming",
+                created_at=datetime.now()
+            )
+            session.add(video)
+            await session.commit()
+            await session.refresh(video)
+
+        stream = LiveStream(
+            video.id, source, options or {}, loop,
+            latency_budget_ms if latency_budget_ms is not None else STREAM_LATENCY_BUDGET_MS
+        )
+        self.streams[video.id] = stream
+        stream.task = asyncio.create_task(self._run(stream))
+        logger.info(f"Started stream {source} as video {video.id}")
+        return stream
+
+    async def _run(self, stream: LiveStream):
+        writer = DetectionWriter()
+        tracks = []
+        try:
+            async for event, payload in stream_from_worker(run_stream, stream, executor=self._get_executor()):
+                if event == "detections":
+                    await writer.add_many(payload)
+                elif event == "progress":
+                    await writer.maybe_flush()
+                    broker.publish(stream.video_id, {"status": "streaming", **stream.health()})
+                elif event == "tracks":
+                    tracks = payload
+            stream.status = "stopped" if stream.stop_event.is_set() else stream.grabber.status
+            if stream.grabber.status == "failed":
+                stream.error = stream.grabber.error
+        except Exception as e:
+            logger.error(f"Stream {stream.source} failed: {str(e)}", exc_info=True)
+            stream.status = "failed"
+            stream.error = str(e)
+        finally:
+            # Whatever was processed stays queryable like any other video
+            video_status = "failed" if stream.status == "failed" else "completed"
+            try:
+                await writer.close()
+                await save_tracks(stream.video_id, tracks)
+                async with AsyncSession(engine) as session:
+                    await session.execute(
+                        update(models.Video)
+                        .where(models.Video.id == stream.video_id)
+                        .values(
+                            status=video_status,
+                            frame_count=stream.grabber.frames_read,
+                            processed_frames=stream.frames_processed,
+                            detection_count=writer.rows_written,
+                            processing_seconds=round(time.monotonic() - stream.started_at, 3)
+                        )
+                    )
+                    await session.commit()
+            finally:
+                broker.publish(stream.video_id, {**stream.health(), "status": video_status})
+                logger.info(f"Stream {stream.source} finished: {stream.health()}")
+
+    def get(self, video_id: int):
+        return self.streams.get(video_id)
+
+    async def stop(self, video_id: int) -> LiveStream:
+        stream = self.streams[video_id]
+        stream.stop_event.set()
+        await asyncio.shield(stream.task)
+        return stream
+
+    def forget(self, video_id: int):
+        stream = self.streams.get(video_id)
+        if stream is not None and stream.task.done():
+            del self.streams[video_id]
+
+    async def shutdown(self):
+        for stream in self.active():
+            stream.stop_event.set()
+        await asyncio.gather(*(stream.task for stream in self.streams.values()), return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+stream_manager = StreamManager()
+STREAMS_ACTIVE.set_function(lambda: len(stream_manager.active()))
@@ -0,0 +1,125 @@
+import numpy as np
+from .sampling import match_boxes
+import os
+
+# Detections at or above this confidence are matched first, the rest only to
+# tracks left over (ByteTrack's two-stage association)
+TRACK_HIGH_CONFIDENCE = float(os.getenv("TRACK_HIGH_CONFIDENCE", "0.5"))
+# Minimum IoU between a track's predicted box and a detection
+TRACK_MATCH_IOU = float(os.getenv("TRACK_MATCH_IOU", "0.3"))
+# Frames a track may go unseen and still be picked up again
+TRACK_MAX_AGE = max(1, int(os.getenv("TRACK_MAX_AGE", "30")))
+
+# Weight of the newest movement in a track's velocity estimate
+VELOCITY_SMOOTHING = 0.5
+
+class Track:
+    def __init__(self, track_id: int, frame_number: int, box):
+        self.track_id = track_id
+        self.box = box[:4].astype(np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.first_frame = frame_number
+        self.last_frame = frame_number
+        self.frame_count = 1
+        self.extent = self.box.copy()
+        self.confidence_sum = float(box[4])
+
+    def predict(self, frame_number: int):
+        # Constant-velocity guess of where the box is now
+        return self.box + self.velocity * (frame_number - self.last_frame)
+
+    def update(self, frame_number: int, box):
+        gap = frame_number - self.last_frame
+        velocity = (box[:4] - self.box) / gap
+        self.velocity = VELOCITY_SMOOTHING * velocity + (1 - VELOCITY_SMOOTHING) * self.velocity
+        self.box = box[:4].astype(np.float32)
+        self.last_frame = frame_number
+        self.frame_count += 1
+        self.extent[:2] = np.minimum(self.extent[:2], self.box[:2])
+        self.extent[2:] = np.maximum(self.extent[2:], self.box[2:])
+        self.confidence_sum += float(box[4])
+
+    def summary(self) -> dict:
+        x_min, y_min, x_max, y_max = self.extent.tolist()
+        return {
+            "track_id": self.track_id,
+            "first_frame": self.first_frame,
+            "last_frame": self.last_frame,
+            "frame_count": self.frame_count,
+            "x_min": x_min,
+            "y_min": y_min,
+            "x_max": x_max,
+            "y_max": y_max,
+            "mean_confidence": self.confidence_sum / self.frame_count,
+        }
+
+class IoUTracker:
+    """Assigns persistent person IDs to per-frame detections, on the CPU.
+
+    Tracks are matched to detections by IoU between the track's
+    constant-velocity prediction and the detected box. Confident detections
+    are matched first and low-confidence ones only to the tracks that are left,
+    so a briefly occluded person keeps their ID. Unmatched detections start
+    new tracks; tracks unseen for more than max_age frames are closed. Frames
+    must be passed in order, but frames without detections can be skipped.
+    """
+
+    def __init__(self, high_confidence: float = TRACK_HIGH_CONFIDENCE, match_iou: float = TRACK_MATCH_IOU,
+                 max_age: int = TRACK_MAX_AGE):
+        self.high_confidence = high_confidence
+        self.match_iou = match_iou
+        self.max_age = max_age
+        self.active = []
+        self.finished = []
+        self.next_id = 1
+
+    def _match(self, tracks, predicted, boxes, indices, track_ids, frame_number):
+        # Matches the given detections to tracks; returns the unmatched tracks
+        pairs = match_boxes(predicted, boxes[indices], self.match_iou)
+        for i, j in pairs:
+            tracks[i].update(frame_number, boxes[indices[j]])
+            track_ids[indices[j]] = tracks[i].track_id
+        matched = {i for i, _ in pairs}
+        remaining = [i for i in range(len(tracks)) if i not in matched]
+        return [tracks[i] for i in remaining], predicted[remaining]
+
+    def update(self, frame_number: int, boxes):
+        """Track IDs for one frame's (N, 5) x1, y1, x2, y2, confidence boxes."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+        track_ids = np.zeros(len(boxes), dtype=np.int64)
+
+        # Close tracks that have been gone too long
+        alive = []
+        for track in self.active:
+            (alive if frame_number - track.last_frame <= self.max_age else self.finished).append(track)
+        self.active = alive
+
+        tracks = self.active
+        predicted = np.array([track.predict(frame_number) for track in tracks], dtype=np.float32).reshape(-1, 4)
+        confident = boxes[:, 4] >= self.high_confidence
+        tracks, predicted = self._match(
+            tracks, predicted, boxes, np.flatnonzero(confident), track_ids, frame_number
+        )
+        self._match(tracks, predicted, boxes, np.flatnonzero(~confident), track_ids, frame_number)
+
+        for index in np.flatnonzero(track_ids == 0):
+            track = Track(self.next_id, frame_number, boxes[index])
+            self.next_id += 1
+            self.active.append(track)
+            track_ids[index] = track.track_id
+        return track_ids
+
+    def update_many(self, frame_numbers, boxes):
+        # frame_numbers has one entry per row of boxes, sorted by frame
+        frame_numbers = np.asarray(frame_numbers)
+        track_ids = np.zeros(len(frame_numbers), dtype=np.int64)
+        if not len(frame_numbers):
+            return track_ids
+        starts = np.flatnonzero(np.diff(frame_numbers, prepend=frame_numbers[0] - 1))
+        for start, end in zip(starts, np.append(starts[1:], len(frame_numbers))):
+            track_ids[start:end] = self.update(int(frame_numbers[start]), boxes[start:end])
+        return track_ids
+
+    def summaries(self) -> list:
+        tracks = sorted(self.finished + self.active, key=lambda track: track.track_id)
+        return [track.summary() for track in tracks]
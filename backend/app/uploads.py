@@ -0,0 +1,185 @@
+from contextlib import asynccontextmanager
+from fastapi import UploadFile
+from .metrics import UPLOAD_BYTES
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+PARTIAL_DIR = os.path.join(UPLOAD_DIR, "partial")
+# Bytes read from the client and written to disk per step
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# In-progress hashes of resumable uploads, keyed by upload id: (offset, hasher)
+_hashers = {}
+# Held while a request appends to or completes an upload, keyed by upload id
+_locks = {}
+
+class UploadOffsetError(Exception):
+    def __init__(self, expected: int):
+        super().__init__(f"Expected upload offset {expected}")
+        self.expected = expected
+
+def content_path(content_hash: str, filename: str) -> str:
+    # Files are stored by content hash, so identical uploads share one path
+    extension = os.path.splitext(filename or "")[1].lower()
+    return os.path.join(UPLOAD_DIR, content_hash[:2], f"{content_hash}{extension}").replace("\\", "/")
+
+def is_upload_path(path: str) -> bool:
+    # Videos can also point at files outside UPLOAD_DIR, e.g. stream sources
+    upload_dir = os.path.abspath(UPLOAD_DIR)
+    return os.path.commonpath([os.path.abspath(path), upload_dir]) == upload_dir
+
+def _write_chunk(out, hasher, chunk: bytes):
+    # hashlib and file writes release the GIL, so this runs off the event loop
+    hasher.update(chunk)
+    out.write(chunk)
+
+def _store(tmp_path: str, content_hash: str, filename: str) -> str:
+    path = content_path(content_hash, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return path
+
+async def save_upload(file: UploadFile):
+    """Stream an upload to disk while hashing it; returns (path, sha256, size)."""
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    tmp_path = os.path.join(PARTIAL_DIR, f"{uuid.uuid4().hex}.upload")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await asyncio.to_thread(_write_chunk, out, hasher, chunk)
+                size += len(chunk)
+                UPLOAD_BYTES.inc(len(chunk))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    content_hash = hasher.hexdigest()
+    path = await asyncio.to_thread(_store, tmp_path, content_hash, file.filename)
+    return path, content_hash, size
+
+def _session_paths(upload_id: str):
+    # Upload ids are generated server side; reject anything that isn't one
+    if not upload_id.isalnum():
+        raise KeyError(upload_id)
+    base = os.path.join(PARTIAL_DIR, upload_id)
+    return f"{base}.json", f"{base}.part"
+
+def create_session(filename: str, size: int) -> dict:
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _session_paths(upload_id)
+    meta = {"upload_id": upload_id, "filename": filename, "size": size}
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    open(part_path, "wb").close()
+    _hashers[upload_id] = (0, hashlib.sha256())
+    return {**meta, "offset": 0, "chunk_size": UPLOAD_CHUNK_SIZE}
+
+def get_session(upload_id: str) -> dict:
+    meta_path, part_path = _session_paths(upload_id)
+    if not os.path.exists(meta_path):
+        raise KeyError(upload_id)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    offset = os.path.getsize(part_path)
+    return {**meta, "offset": offset, "complete": offset >= meta["size"]}
+
+@asynccontextmanager
+async def _exclusive(upload_id: str):
+    # A second request for the same upload is turned away, not queued: by the
+    # time it got the lock its offset would be stale anyway
+    session = get_session(upload_id)
+    lock = _locks.setdefault(upload_id, asyncio.Lock())
+    if lock.locked():
+        raise UploadOffsetError(session["offset"])
+    async with lock:
+        yield
+
+async def append_chunk(upload_id: str, offset: int, chunks) -> int:
+    """Append the async byte iterator `chunks` at `offset`; returns the new offset."""
+    async with _exclusive(upload_id):
+        return await _append_chunk(upload_id, offset, chunks)
+
+async def _append_chunk(upload_id: str, offset: int, chunks) -> int:
+    session = get_session(upload_id)
+    if offset != session["offset"]:
+        raise UploadOffsetError(session["offset"])
+
+    _, part_path = _session_paths(upload_id)
+    hashed_offset, hasher = _hashers.get(upload_id, (None, None))
+    if hashed_offset != offset:
+        # The hash state was lost (e.g. restart); it is rebuilt when completing
+        hasher = None
+
+    written = offset
+    with open(part_path, "ab") as out:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if written + len(chunk) > session["size"]:
+                raise ValueError("Upload is larger than the declared size")
+            if hasher is not None:
+                await asyncio.to_thread(_write_chunk, out, hasher, chunk)
+            else:
+                await asyncio.to_thread(out.write, chunk)
+            written += len(chunk)
+            UPLOAD_BYTES.inc(len(chunk))
+
+    if hasher is not None:
+        _hashers[upload_id] = (written, hasher)
+    else:
+        _hashers.pop(upload_id, None)
+    return written
+
+def _hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+async def complete_session(upload_id: str):
+    """Finish a resumable upload; returns (path, sha256, size, filename)."""
+    async with _exclusive(upload_id):
+        result = await _complete_session(upload_id)
+    _locks.pop(upload_id, None)
+    return result
+
+async def _complete_session(upload_id: str):
+    session = get_session(upload_id)
+    if not session["complete"]:
+        raise UploadOffsetError(session["offset"])
+
+    meta_path, part_path = _session_paths(upload_id)
+    hashed_offset, hasher = _hashers.pop(upload_id, (None, None))
+    if hashed_offset == session["size"]:
+        content_hash = hasher.hexdigest()
+    else:
+        content_hash = await asyncio.to_thread(_hash_file, part_path)
+
+    path = await asyncio.to_thread(_store, part_path, content_hash, session["filename"])
+    os.remove(meta_path)
+    return path, content_hash, session["size"], session["filename"]
+
+def delete_session(upload_id: str):
+    _hashers.pop(upload_id, None)
+    _locks.pop(upload_id, None)
+    for path in _session_paths(upload_id):
+        if os.path.exists(path):
+            os.remove(path)
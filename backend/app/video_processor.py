@@ -1,142 +1,242 @@
 import cv2
 import numpy as np
 import torch
-from ultralytics import YOLO
 import io
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, update, delete, insert
 from . import models
 from .database import get_db, engine
+from .detection_writer import DetectionWriter
+from .executor import stream_from_worker
+from .pipeline import FramePipeline, detection_rows
+from .roi import FrameRegion, region_detector
+from .tracking import IoUTracker
+from .inference_backends import INFERENCE_IMGSZ
+from .rendering import RENDER_VIDEO, render_cache
+from .media import faststart
+from .result_cache import result_cache
+from .sampling import FrameSampler, SAMPLE_EVERY, ADAPTIVE_SAMPLING, MOTION_THRESHOLD, MAX_FRAME_GAP
+from .schemas import ProcessingOptions
+from .detection_store import ColumnarDetections, save_detections, delete_detections, COLUMNAR_STORE
+from .segments import run_segments, SEGMENT_WORKERS
+from .model_registry import registry, weights_path, MODEL_VARIANT
 import asyncio
 import os
+import time
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
-# Global variables for model and processing state
-model = None
-processing_states = {}
+# Number of frames sent to YOLO in a single inference call
+BATCH_SIZE = max(1, int(os.getenv("BATCH_SIZE", "1")))
 
-def load_model():
-    global model
-    if model is None:
-        try:
-            logger.info("Loading YOLO model...")
-            model = YOLO('yolov8n.pt')
-            logger.info("YOLO model loaded successfully")
-        except Exception as e:
-            logger.error(f"Failed to load YOLO model: {str(e)}", exc_info=True)
-            raise
-
-async def get_processing_progress(video_id: int) -> float:
-    return processing_states.get(video_id, {}).get('progress', 0)
-
-def process_video(video_id: int, video):
-    try:
-        # Initialize processing state
-        processing_states[video_id] = {'progress': 0, 'status': 'processing'}
-        logger.info(f"Starting video processing for video_id: {video_id}")
-        
-        # Load model if not already loaded
-        load_model()
-        
-        # Start processing in background
-        asyncio.create_task(process_video_async(video_id, video.filepath))
-    except Exception as e:
-        logger.error(f"Error starting video processing: {str(e)}", exc_info=True)
-        processing_states[video_id] = {'progress': -1, 'status': 'failed', 'error': str(e)}
-
-async def process_video_async(video_id: int, video_path: str):
-    try:
-        # Initialize processing state
-        processing_states[video_id] = {'progress': 0, 'status': 'processing'}
-        
-        # Open the video file
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise ValueError("Failed to open video file")
-
-        # Get video properties
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+def resolve_options(options=None) -> ProcessingOptions:
+    # Fill unset options with the server defaults
+    options = ProcessingOptions.model_validate(options or {})
+    defaults = {
+        "batch_size": BATCH_SIZE,
+        "sample_every": SAMPLE_EVERY,
+        "adaptive_sampling": ADAPTIVE_SAMPLING,
+        "motion_threshold": MOTION_THRESHOLD,
+        "max_frame_gap": MAX_FRAME_GAP,
+        "columnar_store": COLUMNAR_STORE,
+        "segment_workers": SEGMENT_WORKERS,
+        "model_variant": MODEL_VARIANT,
+        "inference_size": INFERENCE_IMGSZ,
+        "motion_mask": False,
+        "render": RENDER_VIDEO,
+    }
+    return options.model_copy(update={
+        name: value for name, value in defaults.items() if getattr(options, name) is None
+    })
+
+def process_frames(emit, video_id: int, video_path: str, output_path: str, options: ProcessingOptions):
+    # Runs in a processing worker thread: everything in here is blocking
+    region = FrameRegion(options.roi) if options.roi else None
+    sampler = FrameSampler(
+        every=options.sample_every,
+        adaptive=options.adaptive_sampling or options.motion_mask,
+        motion_threshold=options.motion_threshold,
+        max_gap=options.max_frame_gap,
+        region=region
+    )
+    columns = ColumnarDetections() if options.columnar_store else None
+    tracker = IoUTracker()
+
+    def on_detections(frame_numbers, detections):
+        if columns is not None:
+            columns.append(frame_numbers, detections)
+        counts = [len(boxes) for boxes in detections]
+        if sum(counts):
+            frame_numbers = np.repeat(frame_numbers, counts)
+            boxes = np.concatenate(detections)
+            track_ids = tracker.update_many(frame_numbers, boxes)
+            emit(("detections", detection_rows(video_id, frame_numbers, boxes, track_ids)))
+
+    def on_progress(frames_written, total_frames, stats):
+        emit(("progress", (frames_written, total_frames, stats)))
+
+    # The model stays checked out of the pool for the whole video
+    with registry.acquire(options.model_variant) as model:
+        pipeline = FramePipeline(
+            video_path,
+            output_path,
+            region_detector(model, region, options.inference_size),
+            batch_size=options.batch_size,
+            sampler=sampler,
+            on_detections=on_detections,
+            on_progress=on_progress
+        )
+        pipeline.run()
+
+    emit(("tracks", tracker.summaries()))
+    if columns is not None:
+        save_detections(video_id, columns.to_arrays(), pipeline.total_frames)
+
+def process_segments(emit, video_id: int, video_path: str, output_path: str, options: ProcessingOptions):
+    # Runs in a processing worker thread and waits on the segment process pool
+    columns = ColumnarDetections() if options.columnar_store else None
+    tracker = IoUTracker()
+    # Segments finish in any order but are tracked in frame order, so people
+    # keep their ID across segment boundaries
+    waiting = {}
+    next_start = 0
+    frames_done = 0
+
+    def on_segment(result):
+        nonlocal frames_done, next_start
+        waiting[result["start"]] = result
+        while next_start in waiting:
+            ready = waiting.pop(next_start)
+            next_start = ready["end"]
+            frame_numbers, boxes = ready["frame_numbers"], ready["boxes"]
+            if columns is not None:
+                columns.extend(frame_numbers, boxes)
+            if len(boxes):
+                track_ids = tracker.update_many(frame_numbers, boxes)
+                emit(("detections", detection_rows(video_id, frame_numbers, boxes, track_ids)))
+        frames_done += result["end"] - result["start"]
+        emit(("progress", (frames_done, result["total_frames"], {"segments_done": result["stats"]})))
+
+    stats = run_segments(
+        video_path,
+        output_path,
+        options.model_dump(),
+        options.segment_workers,
+        weights=weights_path(options.model_variant),
+        on_segment=on_segment
+    )
+    emit(("progress", (stats["frames"], stats["frames"], stats)))
+
+    emit(("tracks", tracker.summaries()))
+    if columns is not None:
+        save_detections(video_id, columns.to_arrays(), stats["frames"])
+
+async def save_tracks(video_id: int, tracks: list, lease_check=None):
+    # Replaces the video's track summaries, e.g. those of an interrupted attempt
+    async with AsyncSession(engine) as session:
+        if lease_check is not None:
+            await lease_check(session)
+        await session.execute(delete(models.Track).where(models.Track.video_id == video_id))
+        if tracks:
+            await session.execute(insert(models.Track), [{"video_id": video_id, **track} for track in tracks])
+        await session.commit()
 
+async def clear_results(video_id: int):
+    # Drops everything an earlier run of the video produced, finished or not
+    async with AsyncSession(engine) as session:
+        video = await session.get(models.Video, video_id)
+        await session.execute(delete(models.Detection).where(models.Detection.video_id == video_id))
+        await session.execute(delete(models.Track).where(models.Track.video_id == video_id))
+        processed_path = video.processed_filepath if video else None
+        if video:
+            video.processed_filepath = None
+            video.detection_count = 0
+        await session.commit()
+    if processed_path and os.path.exists(processed_path):
+        os.remove(processed_path)
+    delete_detections(video_id)
+    render_cache.delete(video_id)
+
+async def process_video_async(video_id: int, video_path: str, options=None, on_progress=None, lease_check=None):
+    # lease_check(connection) runs in every transaction that writes results and
+    # raises once the job was taken over, so a stale worker never overwrites them
+    options = resolve_options(options)
+    writer = DetectionWriter(lease_check=lease_check)
+    stats = None
+    tracks = []
+    frames_done = total_frames = 0
+    started = time.monotonic()
+
+    # Without rendering only detections are stored; the annotated video is
+    # rendered from them when it is first requested
+    output_path = None
+    if options.render:
         # Create output directory if it doesn't exist
         output_dir = "processed_videos"
         os.makedirs(output_dir, exist_ok=True)
-        
-        # Create output video writer with forward slashes and H.264 codec
         output_path = os.path.join(output_dir, f"video_{video_id}.mp4").replace("\\", "/")
-        fourcc = cv2.VideoWriter_fourcc(*'avc1')  # H.264 codec
-        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-
-        # Load YOLO model
-        model = YOLO('yolov8n.pt')
-
-        frame_number = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            # Process frame with YOLO
-            results = model(frame)
-            
-            # Draw detections on frame
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    confidence = box.conf[0].cpu().numpy()
-                    class_id = box.cls[0].cpu().numpy()
-                    
-                    # Only process person detections
-                    if class_id == 0:  # 0 is the class ID for person in COCO dataset
-                        # Draw bounding box
-                        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                        
-                        # Save detection to database
-                        async with AsyncSession(engine) as session:
-                            detection = models.Detection(
-                                video_id=video_id,
-                                frame_number=frame_number,
-                                x=float(x1),
-                                y=float(y1),
-                                width=float(x2 - x1),
-                                height=float(y2 - y1),
-                                confidence=float(confidence)
-                            )
-                            session.add(detection)
-                            await session.commit()
-
-            # Write frame to output video
-            out.write(frame)
-            
-            # Update progress
-            frame_number += 1
-            progress = (frame_number / total_frames) * 100
-            processing_states[video_id]['progress'] = progress
-            
-            # Update video record with processed file path
-            if progress >= 100:
-                async with AsyncSession(engine) as session:
-                    stmt = select(models.Video).where(models.Video.id == video_id)
-                    result = await session.execute(stmt)
-                    video = result.scalar_one_or_none()
-                    if video:
-                        video.processed_filepath = output_path
-                        await session.commit()
-
-        # Release resources
-        cap.release()
-        out.release()
-        
-        # Update processing state
-        processing_states[video_id] = {'progress': 100, 'status': 'completed'}
-        
-    except Exception as e:
-        logger.error(f"Error processing video: {str(e)}", exc_info=True)
-        processing_states[video_id] = {'progress': -1, 'status': 'failed', 'error': str(e)}
-        raise 
\ No newline at end of file
+
+    # A video processed before with the same weights and settings is answered
+    # from the result cache instead of running the model again
+    cache_key = None
+    if result_cache.enabled:
+        cache_key = await result_cache.key_for(video_id, options)
+        cached = await asyncio.to_thread(result_cache.lookup, cache_key)
+        if cached is not None:
+            return await result_cache.link(cache_key, video_id, cached, output_path, options.columnar_store,
+                                           lease_check=lease_check)
+
+    # Decode, inference and encode run in the processing pool; the event loop
+    # only receives detections and progress updates
+    # Long videos can be split into segments processed by several processes
+    worker = process_segments if options.segment_workers > 1 else process_frames
+    async for event, payload in stream_from_worker(worker, video_id, video_path, output_path, options):
+        if event == "detections":
+            await writer.add_many(payload)
+        elif event == "progress":
+            frames_done, total_frames, stats = payload
+            await writer.maybe_flush()
+            if on_progress and total_frames > 0:
+                await on_progress(min(frames_done / total_frames * 100, 99.9), stats, frames_done, total_frames)
+        elif event == "tracks":
+            tracks = payload
+
+    await writer.close()
+    await save_tracks(video_id, tracks, lease_check)
+    if stats is not None:
+        stats["db_write"] = writer.stats()
+    logger.info(f"Pipeline stats for video {video_id}: {stats}")
+
+    if output_path:
+        # Players can start and seek without fetching the end of the file first
+        await asyncio.to_thread(faststart, output_path)
+
+    # Store the processed file path and the summary served by the video endpoints
+    async with AsyncSession(engine) as session:
+        if lease_check is not None:
+            await lease_check(session)
+        await session.execute(
+            update(models.Video)
+            .where(models.Video.id == video_id)
+            .values(
+                processed_filepath=output_path,
+                status="completed",
+                frame_count=max(total_frames, frames_done),
+                processed_frames=frames_done,
+                detection_count=writer.rows_written,
+                processing_seconds=round(time.monotonic() - started, 3)
+            )
+        )
+        await session.commit()
+
+    if cache_key is not None:
+        # The job already succeeded; a failed cache write only costs a future hit
+        try:
+            meta = {"frame_count": max(total_frames, frames_done), "processed_frames": frames_done}
+            await result_cache.store(cache_key, video_id, meta, tracks, output_path)
+        except Exception as e:
+            logger.warning(f"Could not cache results of video {video_id}: {str(e)}")
+
+    return stats
@@ -0,0 +1,48 @@
+from .database import engine, init_db
+from .executor import shutdown_executor
+from .jobs import scheduler
+from .model_registry import registry
+import argparse
+import asyncio
+import logging
+import signal
+
+logger = logging.getLogger(__name__)
+
+async def run_worker(max_jobs: int = None):
+    """Runs the job scheduler without the API until SIGINT or SIGTERM.
+
+    Any number of workers, on any number of machines, can drain the same
+    processing_jobs table next to an API started with PROCESSING_MODE=api.
+    They need the same DATABASE_URL, and the upload and output directories
+    on shared storage.
+    """
+    if max_jobs:
+        scheduler.max_concurrency = max_jobs
+    # Workers may start before the API, so they apply pending migrations too
+    await init_db()
+    await asyncio.to_thread(registry.preload)
+    await scheduler.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    await stopping.wait()
+
+    logger.info(f"Worker {scheduler.worker_id} stopping")
+    # Unfinished jobs go back to the queue for the other workers
+    await scheduler.stop()
+    shutdown_executor()
+    await engine.dispose()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process queued videos outside the API")
+    parser.add_argument("--max-jobs", type=int, default=None,
+                        help="Jobs processed at the same time (default: MAX_CONCURRENT_JOBS)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(args.max_jobs))
+
+if __name__ == "__main__":
+    main()
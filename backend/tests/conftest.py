@@ -0,0 +1,74 @@
+from contextlib import nullcontext
+import os
+import tempfile
+
+# The app reads its settings at import time, so they are set before any test imports it
+TEST_DIR = tempfile.mkdtemp(prefix="app-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{TEST_DIR}/app.db"
+os.environ.setdefault("UPLOAD_DIR", os.path.join(TEST_DIR, "uploads"))
+os.environ.setdefault("RESULT_CACHE", "false")
+os.environ.setdefault("JOB_POLL_INTERVAL", "0.2")
+
+import cv2
+import numpy as np
+import pytest
+import time
+
+# Seconds the stub detector spends per frame, like a small model on a CPU
+DETECT_SECONDS = 0.02
+
+def slow_detector(model, region=None, imgsz=None):
+    # One person per frame, found after sleeping like inference that releases the GIL
+    def detect(frames):
+        time.sleep(DETECT_SECONDS * len(frames))
+        return [np.array([[10, 10, 60, 110, 0.9]], dtype=np.float32) for _ in frames]
+    return detect
+
+@pytest.fixture
+def anyio_backend():
+    # Async tests run on the anyio plugin that ships with FastAPI's dependencies
+    return "asyncio"
+
+@pytest.fixture(scope="session")
+def make_video():
+    counter = iter(range(1000000))
+
+    def make(frames: int = 30, size=(160, 120)) -> str:
+        # A small MP4 whose content differs per call, so uploads are never deduplicated
+        seed = next(counter)
+        path = os.path.join(TEST_DIR, f"input_{seed}.mp4")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, size)
+        for index in range(frames):
+            frame = np.full((size[1], size[0], 3), (seed * 37 + index) % 256, dtype=np.uint8)
+            writer.write(frame)
+        writer.release()
+        return path
+    return make
+
+@pytest.fixture(scope="session")
+def client():
+    # The whole app, with the scheduler running jobs on the stub detector
+    pytest.importorskip("ultralytics")
+    from fastapi.testclient import TestClient
+    from app import video_processor
+    from app.main import app
+    from app.model_registry import registry
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(TEST_DIR)
+        patch.setattr(video_processor, "region_detector", slow_detector)
+        patch.setattr(registry, "acquire", lambda variant=None, timeout=None: nullcontext())
+        patch.setattr(registry, "preload", lambda variants=None: None)
+        with TestClient(app) as client:
+            yield client
+
+@pytest.fixture
+def wait_for_status(client):
+    def wait(video_id: int, statuses=("completed", "failed"), timeout: float = 30.0) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            status = client.get(f"/video/{video_id}/status").json()
+            if status["status"] in statuses or time.monotonic() > deadline:
+                return status
+            time.sleep(0.05)
+    return wait
@@ -0,0 +1,25 @@
+import time
+
+# /videos must answer within this while a video is being processed
+LATENCY_TARGET_SECONDS = 0.05
+
+def test_videos_stays_fast_while_processing(client, make_video, wait_for_status):
+    with open(make_video(frames=150), "rb") as f:
+        upload = client.post("/video/upload", files={"file": ("busy.mp4", f, "video/mp4")}).json()
+    video_id = upload["id"]
+    assert wait_for_status(video_id, ("processing", "completed", "failed"))["status"] == "processing"
+
+    latencies = []
+    while client.get(f"/video/{video_id}/status").json()["status"] == "processing":
+        started = time.perf_counter()
+        response = client.get("/videos")
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        time.sleep(0.01)
+
+    assert wait_for_status(video_id)["status"] == "completed"
+    # Enough requests overlapped the job for the percentile to mean something
+    assert len(latencies) >= 20
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    assert p95 < LATENCY_TARGET_SECONDS, f"p95 /videos latency {p95 * 1000:.1f}ms while processing"
@@ -0,0 +1,89 @@
+from alembic import command
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app import database, models
+from app.database import Base, alembic_config, init_db
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+# Longest acceptable schema check on restart, in seconds
+STARTUP_TARGET_SECONDS = 1.0
+HEAD = "c7d2e9a4f613"
+
+@pytest.fixture
+async def engine(tmp_path, monkeypatch):
+    # init_db works on the module's engine; each test gets its own database
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/startup.db")
+    monkeypatch.setattr(database, "engine", engine)
+    yield engine
+    await engine.dispose()
+
+async def count(engine, model) -> int:
+    async with AsyncSession(engine) as session:
+        return (await session.execute(select(func.count(model.id)))).scalar()
+
+async def add_rows(engine):
+    async with AsyncSession(engine) as session:
+        video = models.Video(filename="kept.mp4", filepath="uploads/kept.mp4", status="completed")
+        session.add(video)
+        await session.flush()
+        session.add(models.Detection(video_id=video.id, frame_number=0, x=1, y=2, width=3, height=4,
+                                     confidence=0.9))
+        await session.commit()
+
+def build_legacy_schema(connection, revision: str):
+    # The schema create_all produced at that revision, without migration history
+    Base.metadata.create_all(connection)
+    config = alembic_config(connection)
+    command.stamp(config, "heads")
+    if revision != HEAD:
+        command.downgrade(config, revision)
+    connection.execute(text("DROP TABLE alembic_version"))
+
+def current_heads(connection) -> list:
+    return sorted(MigrationContext.configure(connection).get_current_heads())
+
+def columns(connection, table: str) -> set:
+    return {column["name"] for column in inspect(connection).get_columns(table)}
+
+async def test_restarts_keep_rows_and_are_fast(engine):
+    assert (await init_db())["action"] == "created"
+    await add_rows(engine)
+
+    for _ in range(2):
+        # A restart starts without pooled connections
+        await engine.dispose()
+        report = await init_db()
+        assert report["action"] == "verified"
+        assert report["seconds"] < STARTUP_TARGET_SECONDS
+
+    assert await count(engine, models.Video) == 1
+    assert await count(engine, models.Detection) == 1
+
+# Every revision a database built by create_all can be recognised at
+@pytest.mark.parametrize("revision", [marker[0] for marker in database.LEGACY_MARKERS])
+async def test_legacy_schema_is_stamped_and_upgraded(engine, revision):
+    async with engine.begin() as conn:
+        await conn.run_sync(build_legacy_schema, revision)
+        assert await conn.run_sync(database.legacy_revision) == revision
+        await conn.execute(text(
+            "INSERT INTO videos (filename, filepath) VALUES ('legacy.mp4', 'uploads/legacy.mp4')"
+        ))
+
+    report = await init_db()
+    if revision == HEAD:
+        assert report["action"] == "stamped"
+    else:
+        assert report["action"] == "upgraded"
+        assert report["from"] == [revision]
+
+    async with engine.connect() as conn:
+        assert await conn.run_sync(current_heads) == [HEAD]
+        assert {"worker_id", "lease_expires_at"} <= await conn.run_sync(columns, "processing_jobs")
+        assert "track_id" in await conn.run_sync(columns, "detections")
+    assert await count(engine, models.Video) == 1
+    # Detections can be written with the upgraded columns
+    await add_rows(engine)
+    assert (await init_db())["action"] == "verified"
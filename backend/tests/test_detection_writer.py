@@ -0,0 +1,68 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import models
+from app.database import Base
+from app.detection_writer import DetectionWriter
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+def rows(count: int, frame_number: int = 0) -> list:
+    return [(1, frame_number, 10.0 * i, 20.0, 30.0, 60.0, 0.9, None) for i in range(count)]
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/writer.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+async def stored_rows(engine) -> int:
+    async with engine.connect() as conn:
+        return (await conn.execute(select(func.count(models.Detection.id)))).scalar()
+
+async def test_flushes_when_buffer_is_full(engine):
+    writer = DetectionWriter(engine, max_rows=100, max_interval=3600)
+
+    await writer.add_many(rows(99))
+    assert await stored_rows(engine) == 0
+    assert writer.stats()["flushes"] == 0
+
+    await writer.add(1, 1, 0.0, 0.0, 10.0, 10.0, 0.5)
+    assert await stored_rows(engine) == 100
+    assert writer.buffer == []
+    assert writer.stats()["rows_written"] == 100
+    assert writer.stats()["flushes"] == 1
+
+async def test_flushes_after_interval(engine):
+    writer = DetectionWriter(engine, max_rows=10000, max_interval=0.05)
+
+    await writer.add_many(rows(5))
+    assert await stored_rows(engine) == 0
+
+    await asyncio.sleep(0.06)
+    await writer.maybe_flush()
+    assert await stored_rows(engine) == 5
+    assert writer.stats()["rows_written"] == 5
+    assert writer.stats()["flushes"] == 1
+
+async def test_close_writes_remaining_rows(engine):
+    writer = DetectionWriter(engine, max_rows=100, max_interval=3600)
+
+    await writer.add_many(rows(250))
+    assert await stored_rows(engine) == 250
+    assert len(writer.buffer) == 0
+
+    await writer.add_many(rows(30, frame_number=1))
+    assert await stored_rows(engine) == 250
+
+    await writer.close()
+    assert await stored_rows(engine) == 280
+    stats = writer.stats()
+    assert stats["rows_written"] == 280
+    assert stats["flushes"] == 2
+    # Closing with nothing buffered writes nothing more
+    await writer.close()
+    assert writer.stats()["flushes"] == 2
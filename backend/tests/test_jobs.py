@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.database import engine, init_db
+import pytest
+import time
+
+# The scheduler imports the model stack along with the processor
+pytest.importorskip("ultralytics")
+from app import jobs  # noqa: E402
+from app.jobs import scheduler  # noqa: E402
+
+def upload(client, path: str) -> int:
+    with open(path, "rb") as f:
+        return client.post("/video/upload", files={"file": ("video.mp4", f, "video/mp4")}).json()["id"]
+
+async def count_detections(video_id: int) -> int:
+    async with AsyncSession(engine) as session:
+        return (await session.execute(
+            select(func.count(models.Detection.id)).where(models.Detection.video_id == video_id)
+        )).scalar()
+
+async def add_partial_detections(video_id: int, count: int):
+    async with AsyncSession(engine) as session:
+        session.add_all(
+            models.Detection(video_id=video_id, frame_number=frame, x=1, y=1, width=5, height=5, confidence=0.5)
+            for frame in range(count)
+        )
+        await session.commit()
+
+async def fail_video(video_id: int):
+    # What a job that crashed halfway leaves behind
+    await add_partial_detections(video_id, 10)
+    async with AsyncSession(engine) as session:
+        await session.execute(update(models.Video).where(models.Video.id == video_id).values(status="failed"))
+        await session.execute(
+            update(models.ProcessingJob).where(models.ProcessingJob.video_id == video_id)
+            .values(status="failed", error="Simulated crash")
+        )
+        await session.commit()
+
+async def add_job_of_lost_worker(video_path: str) -> int:
+    async with AsyncSession(engine) as session:
+        video = models.Video(filename="lost.mp4", filepath=video_path, status="processing")
+        session.add(video)
+        await session.flush()
+        video_id = video.id
+        session.add(models.ProcessingJob(
+            video_id=video_id, status="processing", attempts=1, worker_id="lost-worker",
+            started_at=datetime.utcnow() - timedelta(minutes=5),
+            lease_expires_at=datetime.utcnow() - timedelta(minutes=1)
+        ))
+        await session.commit()
+    await add_partial_detections(video_id, 10)
+    return video_id
+
+async def take_over_job(video_id: int, status: str = "processing"):
+    # Another worker reclaimed the job and is processing it now
+    async with AsyncSession(engine) as session:
+        await session.execute(
+            update(models.ProcessingJob).where(models.ProcessingJob.video_id == video_id)
+            .values(status=status, worker_id="other-worker", lease_expires_at=datetime.utcnow() + timedelta(minutes=5))
+        )
+        await session.commit()
+
+async def restart_and_reclaim() -> dict:
+    report = await init_db()
+    await scheduler.reclaim()
+    return report
+
+async def latest_job(video_id: int) -> models.ProcessingJob:
+    async with AsyncSession(engine) as session:
+        return (await session.execute(
+            select(models.ProcessingJob).where(models.ProcessingJob.video_id == video_id)
+            .order_by(models.ProcessingJob.id.desc()).limit(1)
+        )).scalar_one()
+
+def test_requeued_failed_video_replaces_partial_results(client, make_video, wait_for_status):
+    video_id = upload(client, make_video(frames=30))
+    assert wait_for_status(video_id)["status"] == "completed"
+    expected = client.portal.call(count_detections, video_id)
+    assert expected > 0
+
+    client.portal.call(fail_video, video_id)
+    assert client.post(f"/video/{video_id}/process").json()["status"] == "queued"
+    assert wait_for_status(video_id)["status"] == "completed"
+
+    assert client.portal.call(count_detections, video_id) == expected
+    assert client.get(f"/video/{video_id}").json()["detection_count"] == expected
+    assert client.portal.call(latest_job, video_id).attempts == 1
+
+def test_job_of_lost_worker_resumes_after_restart(client, make_video, wait_for_status):
+    reference_id = upload(client, make_video(frames=30))
+    assert wait_for_status(reference_id)["status"] == "completed"
+    expected = client.portal.call(count_detections, reference_id)
+
+    video_id = client.portal.call(add_job_of_lost_worker, make_video(frames=30))
+    # The restart keeps the job and its partial rows; the job is then retried from scratch
+    assert client.portal.call(restart_and_reclaim)["action"] == "verified"
+    assert wait_for_status(video_id)["status"] == "completed"
+
+    job = client.portal.call(latest_job, video_id)
+    assert job.status == "completed"
+    assert job.attempts == 2
+    assert client.portal.call(count_detections, video_id) == expected
+
+def test_worker_that_lost_its_lease_stops_writing(client, make_video, wait_for_status, monkeypatch):
+    # Only the first progress update is written, so detections and the final update are what notice
+    monkeypatch.setattr(jobs, "JOB_PROGRESS_INTERVAL", 3600)
+    video_id = upload(client, make_video(frames=150))
+    assert wait_for_status(video_id, statuses=("processing",))["status"] == "processing"
+    job_id = client.portal.call(latest_job, video_id).id
+    client.portal.call(take_over_job, video_id)
+
+    deadline = time.monotonic() + 15
+    while job_id in scheduler.running:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    written = client.portal.call(count_detections, video_id)
+    time.sleep(0.5)
+
+    # The rows, status and job belong to the new owner
+    assert client.portal.call(count_detections, video_id) == written < 150
+    assert client.get(f"/video/{video_id}").json()["status"] == "processing"
+    job = client.portal.call(latest_job, video_id)
+    assert (job.status, job.worker_id) == ("processing", "other-worker")
+    client.portal.call(take_over_job, video_id, "failed")
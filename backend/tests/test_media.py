@@ -0,0 +1,51 @@
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from app.media import RangeFileResponse, FILE_CHUNK_SIZE
+import os
+import pytest
+
+@pytest.fixture
+def served_file(tmp_path):
+    # Larger than one read, so the body is sent in several messages
+    path = tmp_path / "video.mp4"
+    data = os.urandom(FILE_CHUNK_SIZE * 2 + 123)
+    path.write_bytes(data)
+    app = Starlette(routes=[Route("/file", lambda request: RangeFileResponse(str(path)))])
+    return TestClient(app), data
+
+def test_whole_file(served_file):
+    client, data = served_file
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(data))
+    assert response.content == data
+
+def test_range_spanning_reads(served_file):
+    client, data = served_file
+    end = FILE_CHUNK_SIZE + 10
+    response = client.get("/file", headers={"range": f"bytes=100-{end}"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 100-{end}/{len(data)}"
+    assert response.content == data[100:end + 1]
+
+def test_unsatisfiable_range(served_file):
+    client, data = served_file
+    response = client.get("/file", headers={"range": f"bytes={len(data)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(data)}"
+
+def test_not_modified(served_file):
+    client, _ = served_file
+    etag = client.get("/file").headers["etag"]
+    response = client.get("/file", headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_invalid_range_is_ignored(served_file):
+    client, data = served_file
+    # A last byte before the first makes the range invalid, not unsatisfiable
+    response = client.get("/file", headers={"range": "bytes=5-3"})
+    assert response.status_code == 200
+    assert "content-range" not in response.headers
+    assert response.content == data
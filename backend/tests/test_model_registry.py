@@ -0,0 +1,15 @@
+import pytest
+
+# The pool loads detectors through the model stack
+pytest.importorskip("ultralytics")
+from app.model_registry import ModelBusyError, ModelPool  # noqa: E402
+
+def test_busy_pool_fails_instead_of_waiting(monkeypatch):
+    monkeypatch.setattr(ModelPool, "_load", lambda self: object())
+    pool = ModelPool("n", size=1)
+    with pool.acquire():
+        with pytest.raises(ModelBusyError):
+            with pool.acquire(timeout=0.1):
+                pass
+    with pool.acquire(timeout=0.1) as model:
+        assert model is not None
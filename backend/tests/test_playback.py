@@ -0,0 +1,27 @@
+def upload(client, path: str) -> int:
+    with open(path, "rb") as f:
+        return client.post("/video/upload", files={"file": ("video.mp4", f, "video/mp4")}).json()["id"]
+
+def test_processed_video_is_revalidated_after_reprocessing(client, make_video, wait_for_status):
+    video_id = upload(client, make_video(frames=10))
+    assert wait_for_status(video_id)["status"] == "completed"
+
+    first = client.get(f"/video/{video_id}/processed")
+    assert first.status_code == 200
+    assert "immutable" not in first.headers["cache-control"]
+    etag = first.headers["etag"]
+    assert client.get(f"/video/{video_id}/processed", headers={"if-none-match": etag}).status_code == 304
+
+    assert client.post(f"/video/{video_id}/process", params={"reprocess": True}).json()["status"] == "queued"
+    assert wait_for_status(video_id)["status"] == "completed"
+
+    # The URL is the same, the file behind it is not
+    second = client.get(f"/video/{video_id}/processed", headers={"if-none-match": etag})
+    assert second.status_code == 200
+    assert second.headers["etag"] != etag
+
+def test_uploads_stay_immutable(client, make_video):
+    video_id = upload(client, make_video(frames=5))
+    response = client.get(f"/video/{video_id}/original")
+    assert response.status_code == 200
+    assert "immutable" in response.headers["cache-control"]
@@ -0,0 +1,61 @@
+from concurrent.futures import wait
+import asyncio
+import numpy as np
+import os
+import pytest
+import threading
+import time
+
+pytestmark = pytest.mark.anyio
+
+# Rendering draws with the pipeline, which imports the model stack
+pytest.importorskip("ultralytics")
+from app import rendering  # noqa: E402
+from app.executor import get_executor, PROCESSING_WORKERS  # noqa: E402
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    async def load_boxes(video_id):
+        return np.arange(30, dtype=np.int32), np.tile(np.float32([10, 10, 60, 110, 0.9]), (30, 1))
+    monkeypatch.setattr(rendering, "load_boxes", load_boxes)
+    cache = rendering.RenderCache(str(tmp_path / "renders"))
+    yield cache
+    cache.shutdown()
+
+@pytest.fixture
+def busy_processing_pool():
+    # Every processing worker is taken by a job that runs until the test ends
+    release = threading.Event()
+    futures = [get_executor().submit(release.wait) for _ in range(PROCESSING_WORKERS)]
+    yield
+    release.set()
+    wait(futures)
+
+async def test_renders_do_not_wait_for_processing_jobs(cache, make_video, busy_processing_pool):
+    task = await cache.render(1, make_video(frames=30))
+    path = await asyncio.wait_for(cache.wait(task), timeout=10)
+    assert os.path.getsize(path) > 0
+    assert cache.get(1) == path
+
+async def test_delete_discards_render_in_progress(cache, make_video, monkeypatch):
+    draw = rendering.draw_detections
+
+    def slow_draw(frame, boxes):
+        time.sleep(0.02)
+        draw(frame, boxes)
+    monkeypatch.setattr(rendering, "draw_detections", slow_draw)
+
+    video = make_video(frames=30)
+    task = await cache.render(1, video)
+    cache.delete(1)
+    with pytest.raises(rendering.RenderDiscarded):
+        await cache.wait(task)
+    assert not os.path.exists(task.path)
+    assert not os.path.exists(task.partial_path)
+    assert 1 not in cache.tasks
+
+    # The next request renders again instead of getting the discarded task
+    replacement = await cache.render(1, video)
+    assert replacement is not task
+    assert await cache.wait(replacement) == task.path
+    assert os.path.exists(task.path)
@@ -0,0 +1,102 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.database import engine
+from conftest import slow_detector
+import os
+import pytest
+import time
+
+# Streams run on the processing pipeline, which imports the model stack
+pytest.importorskip("ultralytics")
+from app import streams  # noqa: E402
+from app.model_registry import ModelPool, ModelRegistry, registry  # noqa: E402
+
+@pytest.fixture
+def stream_file_dir(tmp_path, monkeypatch):
+    (tmp_path / "camera.mp4").write_bytes(b"not really a video")
+    monkeypatch.setattr(streams, "STREAM_FILE_DIR", str(tmp_path))
+    return tmp_path
+
+def test_file_sources_are_disabled_by_default(monkeypatch):
+    monkeypatch.setattr(streams, "STREAM_FILE_DIR", "")
+    with pytest.raises(ValueError, match="not enabled"):
+        streams.check_source("camera.mp4")
+
+def test_file_sources_stay_inside_their_directory(stream_file_dir):
+    assert streams.check_source("camera.mp4") == os.path.realpath(stream_file_dir / "camera.mp4")
+    assert streams.check_source(f"file://{stream_file_dir}/camera.mp4") == os.path.realpath(stream_file_dir / "camera.mp4")
+    for source in ("/etc/passwd", "../../../etc/passwd", "file:///etc/passwd"):
+        with pytest.raises(ValueError, match="outside"):
+            streams.check_source(source)
+
+def test_symlinks_cannot_leave_the_directory(stream_file_dir):
+    os.symlink("/etc/passwd", stream_file_dir / "link.mp4")
+    with pytest.raises(ValueError, match="outside"):
+        streams.check_source("link.mp4")
+
+def test_network_sources_need_an_allowed_scheme_and_host(monkeypatch):
+    monkeypatch.setattr(streams, "STREAM_ALLOWED_HOSTS", {"camera.local"})
+    assert streams.check_source("rtsp://camera.local:554/live") == "rtsp://camera.local:554/live"
+    with pytest.raises(ValueError, match="host"):
+        streams.check_source("rtsp://169.254.169.254/latest")
+    with pytest.raises(ValueError, match="host"):
+        streams.check_source("http://camera.local@internal.example/")
+    with pytest.raises(ValueError, match="scheme"):
+        streams.check_source("ftp://camera.local/video.mp4")
+
+def test_devices_need_to_be_enabled(monkeypatch):
+    with pytest.raises(ValueError, match="devices"):
+        streams.check_source("0")
+    monkeypatch.setattr(streams, "STREAM_ALLOW_DEVICES", True)
+    assert streams.check_source("0") == "0"
+
+async def add_video(filepath: str) -> int:
+    async with AsyncSession(engine) as session:
+        video = models.Video(filename="source", filepath=filepath, status="completed")
+        session.add(video)
+        await session.flush()
+        video_id = video.id
+        await session.commit()
+    return video_id
+
+def test_server_files_are_not_served(client):
+    response = client.post("/streams", json={"source": "/etc/passwd"})
+    assert response.status_code == 400
+
+    # Rows created before sources were checked still can't expose the file
+    video_id = client.portal.call(add_video, "/etc/passwd")
+    response = client.get(f"/video/{video_id}/original")
+    assert response.status_code == 404
+    assert b"root:" not in response.content
+
+def test_stream_videos_cannot_be_reprocessed(client, stream_file_dir):
+    video_id = client.portal.call(add_video, str(stream_file_dir / "camera.mp4"))
+    response = client.post(f"/video/{video_id}/process", params={"reprocess": True})
+    assert response.status_code == 400
+
+def test_streams_leave_models_for_jobs(client, make_video, wait_for_status, monkeypatch):
+    # Real pools whose instances are placeholders the stub detector ignores
+    monkeypatch.setattr(ModelPool, "_load", lambda self: object())
+    monkeypatch.delattr(registry, "acquire")
+    monkeypatch.setattr(streams, "stream_models", ModelRegistry(pool_size=streams.MAX_STREAMS))
+    monkeypatch.setattr(streams, "region_detector", slow_detector)
+    camera = make_video()
+    monkeypatch.setattr(streams, "STREAM_FILE_DIR", os.path.dirname(camera))
+
+    stream_ids = []
+    try:
+        for _ in range(streams.MAX_STREAMS):
+            response = client.post("/streams", json={"source": camera, "loop": True})
+            assert response.status_code == 200
+            stream_ids.append(response.json()["video_id"])
+        deadline = time.monotonic() + 10
+        while any(client.get(f"/streams/{id}").json()["status"] != "running" for id in stream_ids):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        with open(make_video(), "rb") as f:
+            video_id = client.post("/video/upload", files={"file": ("video.mp4", f, "video/mp4")}).json()["id"]
+        assert wait_for_status(video_id, timeout=15)["status"] == "completed"
+    finally:
+        for stream_id in stream_ids:
+            client.delete(f"/streams/{stream_id}")
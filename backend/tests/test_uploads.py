@@ -0,0 +1,47 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.database import engine
+
+def upload(client, path: str) -> dict:
+    with open(path, "rb") as f:
+        return client.post("/video/upload", files={"file": ("video.mp4", f, "video/mp4")}).json()
+
+async def count_jobs(video_id: int) -> int:
+    async with AsyncSession(engine) as session:
+        return (await session.execute(
+            select(func.count(models.ProcessingJob.id)).where(models.ProcessingJob.video_id == video_id)
+        )).scalar()
+
+async def fail_video(video_id: int):
+    async with AsyncSession(engine) as session:
+        await session.execute(update(models.Video).where(models.Video.id == video_id).values(status="failed"))
+        await session.execute(
+            update(models.ProcessingJob).where(models.ProcessingJob.video_id == video_id)
+            .values(status="failed", error="Simulated crash")
+        )
+        await session.commit()
+
+def test_duplicate_of_completed_video_is_not_processed_again(client, make_video, wait_for_status):
+    path = make_video(frames=10)
+    first = upload(client, path)
+    assert wait_for_status(first["id"])["status"] == "completed"
+
+    second = upload(client, path)
+    assert second["deduplicated"] is True
+    assert second["id"] == first["id"]
+    assert second["status"] == "completed"
+    assert client.portal.call(count_jobs, first["id"]) == 1
+
+def test_duplicate_of_failed_video_is_queued_again(client, make_video, wait_for_status):
+    path = make_video(frames=10)
+    first = upload(client, path)
+    assert wait_for_status(first["id"])["status"] == "completed"
+    client.portal.call(fail_video, first["id"])
+
+    second = upload(client, path)
+    assert second["deduplicated"] is True
+    assert second["id"] == first["id"]
+    assert second["status"] == "queued"
+    assert wait_for_status(first["id"])["status"] == "completed"
+    assert client.portal.call(count_jobs, first["id"]) == 2
@@ -0,0 +1,45 @@
+from app import uploads
+import asyncio
+import hashlib
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def body(data: bytes, started: asyncio.Event = None, release: asyncio.Event = None):
+    # A slow client: the request has passed the offset check, but no byte is written yet
+    if started is not None:
+        started.set()
+        await release.wait()
+    yield data[:len(data) // 2]
+    yield data[len(data) // 2:]
+
+async def test_concurrent_chunks_at_the_same_offset():
+    data = bytes(range(256)) * 64
+    session = uploads.create_session("video.mp4", len(data) * 2)
+    upload_id = session["upload_id"]
+    started, release = asyncio.Event(), asyncio.Event()
+
+    first = asyncio.create_task(uploads.append_chunk(upload_id, 0, body(data, started, release)))
+    await started.wait()
+    with pytest.raises(uploads.UploadOffsetError) as error:
+        await uploads.append_chunk(upload_id, 0, body(data))
+    assert error.value.expected == 0
+    release.set()
+    assert await first == len(data)
+
+    # The rejected request retries at the offset the server reports
+    assert uploads.get_session(upload_id)["offset"] == len(data)
+    assert await uploads.append_chunk(upload_id, len(data), body(data)) == len(data) * 2
+
+    path, content_hash, size, _ = await uploads.complete_session(upload_id)
+    assert size == len(data) * 2
+    assert content_hash == hashlib.sha256(data * 2).hexdigest()
+    with open(path, "rb") as f:
+        assert f.read() == data * 2
+
+async def test_stale_offset_is_rejected():
+    session = uploads.create_session("video.mp4", 10)
+    await uploads.append_chunk(session["upload_id"], 0, body(b"12345"))
+    with pytest.raises(uploads.UploadOffsetError) as error:
+        await uploads.append_chunk(session["upload_id"], 0, body(b"12345"))
+    assert error.value.expected == 5
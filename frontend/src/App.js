@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Container,
   Box,
@@ -51,65 +51,58 @@ function App() {
   const [videoStatus, setVideoStatus] = useState(null);
   const [error, setError] = useState(null);
 
-  // Add polling interval state
-  const [pollInterval, setPollInterval] = useState(null);
+  // Server-sent progress events for the video being processed
+  const eventSourceRef = useRef(null);
 
-  // Cleanup polling on unmount
+  const closeEventSource = () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
+      eventSourceRef.current = null;
+    }
+  };
+
+  // Close the event stream on unmount
   useEffect(() => {
-    return () => {
-      if (pollInterval) {
-        clearInterval(pollInterval);
-      }
-    };
+    return () => closeEventSource();
   }, []);
 
   useEffect(() => {
     fetchVideos();
   }, []);
 
-  const checkVideoStatus = async (videoId) => {
-    try {
-      const response = await axios.get(`/video/${videoId}/status`);
-      setVideoStatus(response.data);
-      
-      // If processing is complete (progress is 100%), stop polling and fetch detections
-      if (response.data.progress >= 100) {
-        if (pollInterval) {
-          clearInterval(pollInterval);
-          setPollInterval(null);
-        }
-        setProcessingVideo(false);
-        await fetchDetections(videoId);
-      } else if (response.data.progress === -1) {
-        // If progress is -1, there was an error
-        setError('Failed to process video. Please try again.');
-        if (pollInterval) {
-          clearInterval(pollInterval);
-          setPollInterval(null);
-        }
-        setProcessingVideo(false);
-      } else if (response.data.progress === 0) {
-        // If progress is still 0 after a while, there might be an issue
-        if (videoStatus && videoStatus.progress === 0) {
-          setError('Video processing seems to be stuck. Please try uploading the video again.');
-          if (pollInterval) {
-            clearInterval(pollInterval);
-            setPollInterval(null);
-          }
-          setProcessingVideo(false);
-        }
-      }
-    } catch (error) {
-      console.error('Error checking video status:', error);
-      setError('Failed to check video status. Please try again.');
-      if (pollInterval) {
-        clearInterval(pollInterval);
-        setPollInterval(null);
-      }
+  const handleStatusEvent = async (videoId, event) => {
+    const status = JSON.parse(event.data);
+    setVideoStatus(status);
+
+    if (status.status === 'completed') {
+      // Processing finished: stop listening and fetch detections
+      closeEventSource();
+      setProcessingVideo(false);
+      await fetchDetections(videoId);
+      await fetchVideos();
+    } else if (status.status === 'failed') {
+      closeEventSource();
+      setError('Failed to process video. Please try again.');
       setProcessingVideo(false);
     }
   };
 
+  const watchVideoStatus = (videoId) => {
+    closeEventSource();
+    const source = new EventSource(`${API_URL}/video/${videoId}/events`, { withCredentials: true });
+    ['pending', 'processing', 'completed', 'failed'].forEach((type) => {
+      source.addEventListener(type, (event) => handleStatusEvent(videoId, event));
+    });
+    source.onerror = () => {
+      // EventSource reconnects on its own unless the stream was closed for good
+      if (source.readyState === EventSource.CLOSED) {
+        setError('Lost connection while processing the video. Please refresh.');
+        setProcessingVideo(false);
+      }
+    };
+    eventSourceRef.current = source;
+  };
+
   const fetchVideos = async () => {
     try {
       setLoading(true);
@@ -126,7 +119,7 @@ function App() {
   const fetchDetections = async (videoId) => {
     try {
       const response = await axios.get(`/detections/${videoId}`);
-      setDetections(response.data);
+      setDetections(response.data.detections);
     } catch (error) {
       console.error('Error fetching detections:', error);
       setError('Failed to fetch detections. Please try again.');
@@ -157,11 +150,8 @@ function App() {
         },
       });
 
-      // Start polling for status
-      const interval = setInterval(() => {
-        checkVideoStatus(response.data.id);
-      }, 2000);
-      setPollInterval(interval);
+      // Listen for progress pushed by the server
+      watchVideoStatus(response.data.id);
       setProcessingVideo(true);
 
       // Refresh videos list
@@ -259,6 +249,8 @@ function App() {
                   <TableRow>
                     <TableCell>Filename</TableCell>
                     <TableCell>Upload Date</TableCell>
+                    <TableCell>Status</TableCell>
+                    <TableCell>Detections</TableCell>
                     <TableCell>Actions</TableCell>
                   </TableRow>
                 </TableHead>
@@ -273,6 +265,8 @@ function App() {
                       <TableCell>
                         {new Date(video.created_at).toLocaleString()}
                       </TableCell>
+                      <TableCell>{video.status}</TableCell>
+                      <TableCell>{video.detection_count}</TableCell>
                       <TableCell>
                         <Button
                           variant="outlined"